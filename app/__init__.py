@@ -4,3 +4,10 @@
 # - app.utils: utilities (io, tokens, pricing, summary)
 # - app.pipeline: multi- and single-agent pipelines
 # - app.cli: CLI parsing and validation
+# - app.registry: SQLite run registry and workspace importer
+# - app.sweep: queue-backed sweep coordinator and workers
+# - app.supervisor: process-isolated runs with deadlines and RSS limits
+# - app.server: long-lived run server (submit/poll/stream API, warm clients)
+# - app.loadtest: asyncio load test of a generated auth server (with a Python stand-in)
+# - app.batch: provider batch-API submission (judge scoring, first Tasker calls of a sweep)
+# - app.frontier: cost/latency/quality frontier report across runs and models
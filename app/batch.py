@@ -0,0 +1,639 @@
+"""
+Provider batch-API submission for work that does not need interactive latency.
+
+Two kinds of requests are collected into one batch per (provider, model):
+  - judge:  final-evaluation scoring of generated app.ts files against the
+            rubrics in final_evaluations/evaluation_rubrics (code-based rubrics
+            only; the inclusivity rubrics are scored from screenshots)
+  - tasker: the first Tasker call of every job in a sweep spec (app.sweep),
+            whose reply the run then picks up instead of calling the model
+
+Submitting writes a manifest (<manifest dir>/<batch id>.json) mapping every
+request to the file its result belongs in, so collection can resume after the
+submitting process is gone. Results land in the usual layout:
+  - judge:  <run dir>/judge/<rubric>_<model>.txt, in the "N: score" format of
+            final_evaluations/results (plus the raw reply when it does not parse)
+  - tasker: <job output dir>/tasker_seed.json (see TASKER_SEED in app.pipeline.multi)
+
+Backends: OpenAI Batch API (/v1/files + /v1/batches) and Anthropic Message
+Batches. OpenRouter has no batch API. --standin starts a local
+OpenAI-compatible batch endpoint with canned replies, for testing the plumbing.
+
+    python -m app.batch judge workspace/password_recovery_health \\
+        --rubric final_evaluations/evaluation_rubrics/security_eval_case_1.md \\
+        --provider openai --model gpt-5 --model gpt-4o
+    python -m app.batch tasker sweep.json --no-wait
+    python -m app.batch collect workspace/batches/batch_abc123.json
+"""
+
+import argparse
+import email
+import email.policy
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+import httpx
+from dotenv import load_dotenv
+
+from app.utils.runlog import iter_run_dirs
+
+load_dotenv()
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+JUDGE_SYSTEM = (
+    "You are an evaluator of LLM-generated code. Score every numbered criterion "
+    "of the survey on its 1-5 scale. Respond ONLY with one line per criterion in "
+    "the form 'N: score', with no explanations."
+)
+_SCORE_RE = re.compile(r"^\s*(\d{1,2})\s*[:.)-]\s*([1-5])\b", re.M)
+_TERMINAL = {"completed", "failed", "expired", "cancelled", "ended"}
+
+
+class BatchRequest(TypedDict):
+    custom_id: str
+    model: str
+    messages: List[Dict[str, str]]
+
+
+class BatchResult(TypedDict):
+    text: str
+    usage: List[int]  # [input, output, cached_input]
+    error: str
+
+
+def _get(env_key: str, default: str = "") -> str:
+    v = os.getenv(env_key)
+    return v.strip() if isinstance(v, str) else default
+
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", s).strip("-")
+
+
+# ---------------- backends ----------------
+
+
+class OpenAIBatch:
+    """OpenAI Batch API: upload a JSONL file, create a batch, download the output file."""
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.Client(
+            timeout=timeout, headers={"Authorization": f"Bearer {api_key}"}
+        )
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        lines = [
+            json.dumps(
+                {
+                    "custom_id": r["custom_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": r["model"], "messages": r["messages"]},
+                },
+                ensure_ascii=False,
+            )
+            for r in requests
+        ]
+        up = self.client.post(
+            f"{self.base_url}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", ("\n".join(lines) + "\n").encode("utf-8"))},
+        )
+        up.raise_for_status()
+        resp = self.client.post(
+            f"{self.base_url}/batches",
+            json={
+                "input_file_id": up.json()["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        resp = self.client.get(f"{self.base_url}/batches/{batch_id}")
+        resp.raise_for_status()
+        return resp.json()
+
+    def results(self, info: Dict[str, Any]) -> Dict[str, BatchResult]:
+        out: Dict[str, BatchResult] = {}
+        for key in ("output_file_id", "error_file_id"):
+            if not info.get(key):
+                continue
+            resp = self.client.get(f"{self.base_url}/files/{info[key]}/content")
+            resp.raise_for_status()
+            for line in resp.text.splitlines():
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                body = (row.get("response") or {}).get("body") or {}
+                error = row.get("error") or body.get("error")
+                usage = body.get("usage") or {}
+                text = ""
+                if body.get("choices"):
+                    text = body["choices"][0]["message"].get("content") or ""
+                out[row["custom_id"]] = {
+                    "text": text,
+                    "usage": [
+                        int(usage.get("prompt_tokens") or 0),
+                        int(usage.get("completion_tokens") or 0),
+                        int(
+                            (usage.get("prompt_tokens_details") or {}).get(
+                                "cached_tokens"
+                            )
+                            or 0
+                        ),
+                    ],
+                    "error": json.dumps(error) if error else "",
+                }
+        return out
+
+
+class AnthropicBatch:
+    """Anthropic Message Batches: one create call, then a JSONL results URL."""
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.max_tokens = int(_get("BATCH_MAX_TOKENS", "8192"))
+        self.client = httpx.Client(
+            timeout=timeout,
+            headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+        )
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        items = []
+        for r in requests:
+            system = "\n\n".join(
+                m["content"] for m in r["messages"] if m["role"] == "system"
+            )
+            params = {
+                "model": r["model"],
+                "max_tokens": self.max_tokens,
+                "messages": [m for m in r["messages"] if m["role"] != "system"],
+            }
+            if system:
+                params["system"] = system
+            items.append({"custom_id": r["custom_id"], "params": params})
+        resp = self.client.post(
+            f"{self.base_url}/v1/messages/batches", json={"requests": items}
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        resp = self.client.get(f"{self.base_url}/v1/messages/batches/{batch_id}")
+        resp.raise_for_status()
+        info = resp.json()
+        info["status"] = info.get("processing_status")
+        return info
+
+    def results(self, info: Dict[str, Any]) -> Dict[str, BatchResult]:
+        resp = self.client.get(info["results_url"])
+        resp.raise_for_status()
+        out: Dict[str, BatchResult] = {}
+        for line in resp.text.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            result = row.get("result") or {}
+            msg = result.get("message") or {}
+            usage = msg.get("usage") or {}
+            out[row["custom_id"]] = {
+                "text": "".join(
+                    b.get("text", "")
+                    for b in msg.get("content") or []
+                    if b.get("type") == "text"
+                ),
+                "usage": [
+                    int(usage.get("input_tokens") or 0),
+                    int(usage.get("output_tokens") or 0),
+                    int(usage.get("cache_read_input_tokens") or 0),
+                ],
+                "error": (
+                    ""
+                    if result.get("type") == "succeeded"
+                    else json.dumps(result.get("error") or result.get("type"))
+                ),
+            }
+        return out
+
+
+def make_backend(provider: str, standin_url: Optional[str] = None):
+    """Batch client for a provider (BATCH_BASE_URL overrides the endpoint)."""
+    if standin_url:
+        return OpenAIBatch(standin_url, "standin")
+    provider = provider.lower()
+    if provider == "openai":
+        api_key = _get("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing OPENAI_API_KEY for provider=openai")
+        return OpenAIBatch(_get("BATCH_BASE_URL") or OPENAI_BASE_URL, api_key)
+    if provider == "anthropic":
+        api_key = _get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise RuntimeError("Missing ANTHROPIC_API_KEY for provider=anthropic")
+        return AnthropicBatch(_get("BATCH_BASE_URL") or ANTHROPIC_BASE_URL, api_key)
+    raise ValueError(
+        f"Provider {provider!r} has no batch API (use openai or anthropic)"
+    )
+
+
+# ---------------- request builders ----------------
+
+
+def judge_requests(
+    run_dirs: List[str], rubrics: List[str], model: str
+) -> List[Tuple[BatchRequest, Dict[str, Any]]]:
+    """One scoring request per (run, rubric); paired with its result destination."""
+    out = []
+    for rubric in rubrics:
+        with open(rubric, encoding="utf-8") as f:
+            rubric_text = f.read()
+        stem = os.path.splitext(os.path.basename(rubric))[0]
+        for run_dir in run_dirs:
+            app_ts = os.path.join(run_dir, "app.ts")
+            if not os.path.isfile(app_ts):
+                continue
+            with open(app_ts, encoding="utf-8") as f:
+                code = f.read()
+            request: BatchRequest = {
+                "custom_id": f"judge-{len(out):05d}",
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": JUDGE_SYSTEM},
+                    {
+                        "role": "user",
+                        "content": f"{rubric_text}\n\nSource code (app.ts):\n```ts\n{code}\n```",
+                    },
+                ],
+            }
+            dest = {
+                "kind": "judge",
+                "path": os.path.join(run_dir, "judge", f"{stem}_{_slug(model)}.txt"),
+            }
+            out.append((request, dest))
+    return out
+
+
+def tasker_requests(
+    jobs: List[Dict[str, Any]],
+) -> List[Tuple[BatchRequest, Dict[str, Any]]]:
+    """The first Tasker call of each sweep job, exactly as run_multi would send it."""
+    from app.pipeline.multi import TASKER_SEED, messages_hash, tasker_user_message
+
+    out = []
+    for job in jobs:
+        with open(job["prompts"]["tasker"], encoding="utf-8") as f:
+            system = f.read()
+        with open(job["requirements"], encoding="utf-8") as f:
+            requirements = f.read()
+        request: BatchRequest = {
+            "custom_id": f"tasker-{len(out):05d}",
+            "model": job["model"],
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": tasker_user_message(requirements, "", [])},
+            ],
+        }
+        dest = {
+            "kind": "tasker",
+            "path": os.path.join(job["output_dir"], TASKER_SEED),
+            "provider": job["provider"],
+            # The run only adopts the reply for exactly this request
+            "messages_hash": messages_hash(request["messages"]),
+        }
+        out.append((request, dest))
+    return out
+
+
+# ---------------- submit / collect ----------------
+
+
+def submit(
+    provider: str,
+    pairs: List[Tuple[BatchRequest, Dict[str, Any]]],
+    manifest_dir: str,
+    standin_url: Optional[str] = None,
+) -> str:
+    """Submit one batch and write its manifest; returns the manifest path."""
+    backend = make_backend(provider, standin_url)
+    batch_id = backend.submit([req for req, _ in pairs])
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest = {
+        "batch_id": batch_id,
+        "provider": provider,
+        "standin_url": standin_url,
+        "submitted_at": time.time(),
+        "requests": {
+            req["custom_id"]: {**dest, "model": req["model"]} for req, dest in pairs
+        },
+    }
+    path = os.path.join(manifest_dir, f"{_slug(batch_id)}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"Submitted {len(pairs)} request(s) as {batch_id} -> {path}", flush=True)
+    return path
+
+
+def parse_scores(text: str) -> Dict[int, int]:
+    return {int(n): int(s) for n, s in _SCORE_RE.findall(text or "")}
+
+
+def _write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def apply_results(
+    manifest: Dict[str, Any], results: Dict[str, BatchResult]
+) -> Dict[str, int]:
+    """Write every result to its destination; returns outcome counts."""
+    counts = {"ok": 0, "unparsed": 0, "error": 0, "missing": 0}
+    for cid, dest in manifest["requests"].items():
+        res = results.get(cid)
+        if res is None or res["error"]:
+            counts["missing" if res is None else "error"] += 1
+            print(
+                f"[WARN] {cid} -> {dest['path']}: {res['error'] if res else 'no result'}"
+            )
+            continue
+        if dest["kind"] == "judge":
+            scores = parse_scores(res["text"])
+            if not scores:
+                counts["unparsed"] += 1
+                _write(dest["path"][: -len(".txt")] + ".raw.txt", res["text"])
+                continue
+            _write(
+                dest["path"],
+                "\n".join(f"{n}: {s}" for n, s in sorted(scores.items())),
+            )
+        else:
+            seed = {
+                "model": dest["model"],
+                "text": res["text"],
+                "usage": res["usage"],
+                "messages_hash": dest.get("messages_hash"),
+                "batch_id": manifest["batch_id"],
+                "custom_id": cid,
+            }
+            _write(dest["path"], json.dumps(seed, ensure_ascii=False, indent=2))
+        counts["ok"] += 1
+    return counts
+
+
+def collect(
+    manifest_path: str, poll_s: float = 30.0, timeout_s: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Poll a submitted batch until it finishes, then write its results.
+    Returns the batch summary (also stored in the manifest under "outcome"),
+    or None when timeout_s passed first (collect again later).
+    """
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    backend = make_backend(manifest["provider"], manifest.get("standin_url"))
+    t0 = time.time()
+    while True:
+        info = backend.status(manifest["batch_id"])
+        if info.get("status") in _TERMINAL:
+            break
+        if timeout_s is not None and time.time() - t0 >= timeout_s:
+            print(f"Batch {manifest['batch_id']} still {info.get('status')}")
+            return None
+        time.sleep(poll_s)
+    results = backend.results(info)
+    counts = apply_results(manifest, results)
+    usage = [sum(r["usage"][k] for r in results.values()) for k in range(3)]
+    manifest["outcome"] = {
+        "status": info.get("status"),
+        "collected_at": time.time(),
+        "counts": counts,
+        "usage": {"input": usage[0], "output": usage[1], "cached_input": usage[2]},
+    }
+    _write(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2))
+    print(f"Batch {manifest['batch_id']} {info.get('status')}: {counts}", flush=True)
+    return manifest["outcome"]
+
+
+# ---------------- stand-in endpoint ----------------
+
+
+def standin_reply(custom_id: str, body: Dict[str, Any]) -> str:
+    """Canned replies: mid-scale scores for judge requests, one task for the Tasker."""
+    if custom_id.startswith("judge-"):
+        prompt = body["messages"][-1]["content"]
+        items = len(re.findall(r"^\s*\d{1,2}\.\s", prompt, re.M)) or 15
+        return "\n".join(f"{n}: 3" for n in range(1, items + 1))
+    return json.dumps({"task_list": ["Implement the requirements in app.ts"]})
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /v1/files + /v1/batches; batches finish after `delay` s."""
+
+    files: Dict[str, bytes] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+    lock = threading.Lock()
+    delay = 0.5
+    responder: Callable[[str, Dict[str, Any]], str] = staticmethod(standin_reply)
+
+    def log_message(self, *a) -> None:
+        pass
+
+    def _send(self, code: int, payload: Any, raw: Optional[bytes] = None) -> None:
+        body = raw if raw is not None else json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _finish(self, batch: Dict[str, Any]) -> None:
+        """Answer every request of a due batch into an output file."""
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            text = self.responder(req["custom_id"], req["body"])
+            prompt_chars = sum(len(m["content"]) for m in req["body"]["messages"])
+            body = {
+                "choices": [{"message": {"role": "assistant", "content": text}}],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(text) // 4,
+                },
+            }
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": req["custom_id"],
+                        "response": {"status_code": 200, "body": body},
+                        "error": None,
+                    }
+                )
+            )
+        fid = f"file-{secrets.token_hex(8)}"
+        self.files[fid] = ("\n".join(lines) + "\n").encode("utf-8")
+        batch.update(status="completed", output_file_id=fid)
+
+    def do_GET(self) -> None:
+        with self.lock:
+            m = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+            if m and m.group(1) in self.batches:
+                batch = self.batches[m.group(1)]
+                if batch["status"] != "completed" and time.time() >= batch["due"]:
+                    self._finish(batch)
+                return self._send(200, batch)
+            m = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+            if m and m.group(1) in self.files:
+                return self._send(200, None, self.files[m.group(1)])
+        self._send(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path == "/v1/files":
+            head = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n"
+            msg = email.message_from_bytes(
+                head.encode("utf-8") + raw, policy=email.policy.HTTP
+            )
+            data = next(
+                (
+                    p.get_payload(decode=True)
+                    for p in msg.iter_parts()
+                    if p.get_param("name", header="content-disposition") == "file"
+                ),
+                None,
+            )
+            if data is None:
+                return self._send(400, {"error": {"message": "missing file"}})
+            fid = f"file-{secrets.token_hex(8)}"
+            with self.lock:
+                self.files[fid] = data
+            return self._send(200, {"id": fid, "object": "file"})
+        if self.path == "/v1/batches":
+            req = json.loads(raw or b"{}")
+            with self.lock:
+                if req.get("input_file_id") not in self.files:
+                    return self._send(400, {"error": {"message": "unknown file"}})
+                bid = f"batch_{secrets.token_hex(8)}"
+                self.batches[bid] = {
+                    "id": bid,
+                    "object": "batch",
+                    "status": "in_progress",
+                    "input_file_id": req["input_file_id"],
+                    "due": time.time() + self.delay,
+                }
+            return self._send(200, self.batches[bid])
+        self._send(404, {"error": {"message": "Not found"}})
+
+
+def start_standin(port: int = 0, delay: float = 0.5) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stand-in batch endpoint in a daemon thread; returns (server, base_url)."""
+    _StandIn.delay = delay
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), _StandIn)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+
+
+# ---------------- CLI ----------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Provider batch-API submission")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    def _common(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--manifest-dir", default=os.path.join("workspace", "batches"))
+        p.add_argument(
+            "--no-wait",
+            action="store_true",
+            help="Submit only; run `collect` on the manifest later",
+        )
+        p.add_argument("--poll", type=float, default=30.0, help="Seconds between polls")
+        p.add_argument(
+            "--standin",
+            action="store_true",
+            help="Send everything to a local stand-in batch endpoint",
+        )
+
+    p_judge = sub.add_parser("judge", help="Score generated app.ts files with rubrics")
+    p_judge.add_argument("root", help="Run directory or tree of run directories")
+    p_judge.add_argument("--rubric", action="append", required=True)
+    p_judge.add_argument("--model", action="append", required=True)
+    p_judge.add_argument("--provider", default=_get("LLM_PROVIDER", "openai"))
+    _common(p_judge)
+
+    p_tasker = sub.add_parser("tasker", help="Batch the first Tasker call of a sweep")
+    p_tasker.add_argument("spec", help="Sweep spec JSON (see app.sweep)")
+    _common(p_tasker)
+
+    p_collect = sub.add_parser(
+        "collect", help="Poll a submitted batch and write results"
+    )
+    p_collect.add_argument("manifest")
+    p_collect.add_argument("--poll", type=float, default=30.0)
+    p_collect.add_argument(
+        "--timeout", type=float, default=None, help="Give up polling after N seconds"
+    )
+    args = parser.parse_args()
+
+    if args.cmd == "collect":
+        collect(args.manifest, args.poll, args.timeout)
+        return
+
+    # (provider, model) -> requests; one batch each
+    groups: Dict[Tuple[str, str], List] = {}
+    if args.cmd == "judge":
+        run_dirs = sorted(iter_run_dirs(args.root))
+        if os.path.isfile(os.path.join(args.root, "app.ts")):
+            run_dirs = sorted(set(run_dirs) | {args.root})
+        for model in args.model:
+            pairs = judge_requests(run_dirs, args.rubric, model)
+            if pairs:
+                groups[(args.provider, model)] = pairs
+    else:
+        from app.sweep import expand_spec
+
+        with open(args.spec, encoding="utf-8") as f:
+            jobs = expand_spec(json.load(f))
+        for job in jobs:
+            groups.setdefault((job["provider"], job["model"]), []).append(job)
+        groups = {key: tasker_requests(jobs) for key, jobs in groups.items()}
+    if not groups:
+        raise SystemExit("Nothing to submit")
+
+    standin, standin_url = None, None
+    if args.standin:
+        standin, standin_url = start_standin()
+    try:
+        manifests = []
+        for (provider, model), pairs in groups.items():
+            if standin_url is None and provider.lower() not in {"openai", "anthropic"}:
+                print(f"[WARN] {provider} has no batch API; skipping {model}")
+                continue
+            manifests.append(submit(provider, pairs, args.manifest_dir, standin_url))
+        if args.no_wait and not standin:
+            return
+        for path in manifests:
+            collect(path, min(args.poll, 1.0) if standin else args.poll)
+    finally:
+        if standin:
+            standin.shutdown()
+
+
+if __name__ == "__main__":
+    main()
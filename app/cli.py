@@ -1,9 +1,10 @@
 import argparse
 import pathlib
 import os
+from typing import List, Optional
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Run multi-agent (Tasker→Coder→Evaluator) or single-agent programmer (HITL) loop for password recovery experiment."
     )
@@ -27,6 +28,13 @@ def parse_args() -> argparse.Namespace:
         help="Path to prompt_programmer_hitl.txt (single mode).",
     )
 
+    parser.add_argument(
+        "--script",
+        required=False,
+        help="Single mode: replay turns from a file instead of prompting on stdin "
+        "(JSON list or one turn per line; see app.pipeline.single.load_script).",
+    )
+
     # Shared flags
     parser.add_argument(
         "--requirements", required=False, help="Path to requirements.md"
@@ -41,6 +49,110 @@ def parse_args() -> argparse.Namespace:
         default=8,
         help="Maximum number of loop iterations in multi mode (default: 8)",
     )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Multi mode: wall-clock budget for the run in seconds; iterations that are "
+        "predicted not to fit are reduced or skipped (default: none)",
+    )
+    parser.add_argument(
+        "--budget-usd",
+        type=float,
+        default=None,
+        help="Multi mode: cost budget for the run in USD (needs PRICE_* env; default: none)",
+    )
+    parser.add_argument(
+        "--escalate-after",
+        type=int,
+        default=2,
+        help="Multi mode with *_MODEL_CASCADE set: consecutive FAILs on the same items "
+        "before the Coder moves to the next model (default: 2)",
+    )
+    parser.add_argument(
+        "--coder-shards",
+        type=int,
+        default=0,
+        help="Multi mode: split the Coder's tasks by the app.ts sections they touch and "
+        "run up to N section edits concurrently (falls back to one call; default: off)",
+    )
+    parser.add_argument(
+        "--coder-regions",
+        type=int,
+        default=0,
+        help="Multi mode: send the Coder an outline of app.ts plus at most N blocks its "
+        "tasks touch, and splice its edits back (falls back to the full file; default: off)",
+    )
+    parser.add_argument(
+        "--req-sections",
+        type=int,
+        default=0,
+        help="Multi mode: send the Coder only the requirement sections that best match "
+        "each task (up to N per task, BM25) instead of the full document (default: off)",
+    )
+    parser.add_argument(
+        "--req-min-score",
+        type=float,
+        default=1.5,
+        help="With --req-sections, a task whose best section scores below this falls "
+        "back to the full document (default: 1.5)",
+    )
+    parser.add_argument(
+        "--req-full-iters",
+        type=int,
+        default=1,
+        help="With --req-sections, iterations that always get the full document (default: 1)",
+    )
+    parser.add_argument(
+        "--no-structured",
+        dest="structured",
+        action="store_false",
+        help="Multi mode: disable provider-native JSON output for Tasker/Evaluator "
+        "(fall back to parsing plain text / Markdown).",
+    )
+    parser.add_argument(
+        "--eval-incremental",
+        action="store_true",
+        help="Multi mode: after a FAIL, evaluate only the code diff against the previous "
+        "FAILING_ITEMS (PASS is always confirmed by a full evaluation).",
+    )
+    parser.add_argument(
+        "--eval-full-every",
+        type=int,
+        default=3,
+        help="With --eval-incremental, force a full evaluation every N iterations (default: 3)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Multi mode: stream the Evaluator and start the next Tasker call as soon as "
+        "NEW_TASKS is complete; the early reply is used only if the verdict is FAIL and "
+        "the Tasker prompt is unchanged (structured mode reads the Evaluator's JSON as text).",
+    )
+    parser.add_argument(
+        "--max-continuations",
+        type=int,
+        default=2,
+        help="Continuation requests allowed when a code reply is truncated (default: 2)",
+    )
+    parser.add_argument(
+        "--registry",
+        required=False,
+        help="SQLite run registry to record this run in (default: $RUN_REGISTRY; unset = off)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Multi mode: profile each node and the final summary (cProfile + tracemalloc) "
+        "into <output>/profile/.",
+    )
+    parser.add_argument(
+        "--prompt-profile",
+        action="store_true",
+        help="Multi mode: count prompt tokens per section (system, requirements, feedback, "
+        "tasks, code) with tiktoken for every call; per-call counts go to log.jsonl and "
+        "per-role/iteration totals to tokens_summary.json.",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -48,7 +160,7 @@ def parse_args() -> argparse.Namespace:
         help="Verbose debug output (show prompts, responses, and timing).",
     )
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def validate_args(args: argparse.Namespace) -> None:
@@ -93,6 +205,33 @@ def validate_args(args: argparse.Namespace) -> None:
             raise FileNotFoundError(f"Requirements not found: {args.requirements}")
         if args.programmer and not pathlib.Path(args.programmer).is_file():
             raise FileNotFoundError(f"Programmer prompt not found: {args.programmer}")
+        if args.script and not pathlib.Path(args.script).is_file():
+            raise FileNotFoundError(f"Session script not found: {args.script}")
+
+    if args.script and args.mode != "single":
+        raise SystemExit("--script is only valid with --mode single")
+    if args.max_iters < 1 or args.eval_full_every < 1 or args.escalate_after < 1:
+        raise SystemExit(
+            "--max-iters, --eval-full-every and --escalate-after must be >= 1"
+        )
+    if (args.deadline is not None and args.deadline <= 0) or (
+        args.budget_usd is not None and args.budget_usd <= 0
+    ):
+        raise SystemExit("--deadline and --budget-usd must be > 0")
+    if (
+        min(
+            args.max_continuations,
+            args.coder_shards,
+            args.coder_regions,
+            args.req_sections,
+            args.req_full_iters,
+        )
+        < 0
+    ):
+        raise SystemExit(
+            "--max-continuations, --coder-shards, --coder-regions, --req-sections "
+            "and --req-full-iters must be >= 0"
+        )
 
     if args.criteria and not pathlib.Path(args.criteria).is_file():
         raise FileNotFoundError(f"Inclusivity criteria file not found: {args.criteria}")
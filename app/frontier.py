@@ -0,0 +1,371 @@
+"""
+Cost-latency-quality frontier across runs and models.
+
+Every run directory below a workspace root is indexed and joined:
+  - cost and per-role tokens/cost from tokens_summary.json (recomputed from the
+    PRICE_* environment when the run had no pricing)
+  - iterations, PASS, wall-clock and per-role seconds from log.jsonl
+  - rubric scores from <run>/judge/*.txt (written by app.batch judge); the
+    published case directories (case_N_*) also pick up
+    final_evaluations/results/<kind>/case_N/*.txt
+Runs are grouped per (case, model); the Pareto frontier of each case minimises
+cost and wall-clock and maximises quality (mean judge total / maximum). Missing
+metrics count as the worst value. Output: frontier.json and frontier.html.
+
+    python -m app.frontier workspace --out workspace/reports
+    python -m app.frontier workspace/sweeps/example --default-model openai/gpt-5
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+from statistics import mean
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.pricing import compute_cost_usd_per_1M, load_pricing
+from app.utils.runlog import RunReader, iter_run_dirs
+
+load_dotenv()
+
+ROLES = ("tasker", "coder", "evaluator")
+# Requirements file stem -> case (see README, "Repository Structure")
+REQUIREMENTS_CASES = {
+    "password_recovery_health_no_inclusivity_no_condition": "case_1",
+    "password_recovery_health_no_inclusivity": "case_2",
+    "password_recovery_health_with_inclusivity": "case_3",
+}
+_CASE_DIR_RE = re.compile(r"^(case_\d+)_")
+_SCORE_RE = re.compile(r"^\s*(\d{1,2})\s*:\s*([1-5])\s*$", re.M)
+_RUBRIC_KIND_RE = re.compile(r"^(security|inclusivity)_")
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    vals = [v for v in values if v is not None]
+    return round(mean(vals), 6) if vals else None
+
+
+def case_of(run_dir: str) -> str:
+    for part in reversed(os.path.normpath(run_dir).split(os.sep)):
+        m = _CASE_DIR_RE.match(part)
+        if m:
+            return m.group(1)
+        if part in REQUIREMENTS_CASES:
+            return REQUIREMENTS_CASES[part]
+    return "(unknown)"
+
+
+def read_scores(path: str) -> Optional[Dict[str, Any]]:
+    """One judge file ("N: score" lines) -> {"total", "max", "items"}."""
+    with open(path, encoding="utf-8") as f:
+        items = {int(n): int(s) for n, s in _SCORE_RE.findall(f.read())}
+    if not items:
+        return None
+    return {"total": sum(items.values()), "max": 5 * len(items), "items": len(items)}
+
+
+def _judge_files(run_dir: str, case: str, results_root: Optional[str]) -> List[str]:
+    files = []
+    judge_dir = os.path.join(run_dir, "judge")
+    if os.path.isdir(judge_dir):
+        files += [
+            os.path.join(judge_dir, n)
+            for n in sorted(os.listdir(judge_dir))
+            if n.endswith(".txt") and not n.endswith(".raw.txt")
+        ]
+    published = _CASE_DIR_RE.match(os.path.basename(os.path.normpath(run_dir)))
+    if results_root and published and not files:
+        for kind in ("security", "inclusivity"):
+            d = os.path.join(results_root, kind, case)
+            if os.path.isdir(d):
+                files += [
+                    os.path.join(d, n)
+                    for n in sorted(os.listdir(d))
+                    if n.endswith(".txt")
+                ]
+    return files
+
+
+def run_quality(run_dir: str, case: str, results_root: Optional[str]) -> Dict[str, Any]:
+    """Mean judge total per rubric kind, and their mean share of the maximum."""
+    by_kind: Dict[str, List[Dict[str, Any]]] = {}
+    for path in _judge_files(run_dir, case, results_root):
+        scores = read_scores(path)
+        if scores is None:
+            continue
+        # judge/<kind>_eval_case_N_<model>.txt or results/<kind>/case_N/<file>.txt
+        m = _RUBRIC_KIND_RE.match(os.path.basename(path))
+        kind = (
+            m.group(1)
+            if m
+            else os.path.basename(os.path.dirname(os.path.dirname(path)))
+        )
+        by_kind.setdefault(kind, []).append(scores)
+    kinds = {
+        kind: {
+            "judges": len(s),
+            "mean_total": _mean([x["total"] for x in s]),
+            "max": s[0]["max"],
+        }
+        for kind, s in by_kind.items()
+    }
+    quality = _mean([k["mean_total"] / k["max"] for k in kinds.values()])
+    return {"quality": quality, "scores": kinds}
+
+
+def _run_model(log_models: Dict[str, str], run_dir: str, default: str) -> str:
+    models = {r: m for r, m in log_models.items() if m}
+    if models:
+        distinct = sorted(set(models.values()))
+        if len(distinct) == 1:
+            return distinct[0]
+        return ", ".join(f"{r}={models[r]}" for r in ROLES if r in models)
+    # Sweep layout: <root>/<requirements>/<provider>_<model>/rep<N>
+    parts = os.path.normpath(run_dir).split(os.sep)
+    if len(parts) >= 2 and re.fullmatch(r"rep\d+", parts[-1]):
+        return parts[-2]
+    return default
+
+
+def index_run(
+    run_dir: str, pricing, pricing_missing, results_root, default_model: str
+) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    path = os.path.join(run_dir, "tokens_summary.json")
+    if os.path.isfile(path):
+        with open(path, encoding="utf-8") as f:
+            summary = json.load(f)
+
+    wall = 0.0
+    role_seconds: Dict[str, Optional[float]] = {r: None for r in ROLES}
+    models: Dict[str, str] = {}
+    iterations = 0
+    with RunReader(run_dir) as run:
+        for entry in run.log:
+            iterations = max(iterations, int(entry.get("iter") or 0))
+            wall += float(entry.get("duration_s") or 0.0)
+            for role, s in (entry.get("role_seconds") or {}).items():
+                if role in role_seconds:
+                    role_seconds[role] = (role_seconds[role] or 0.0) + float(s)
+            models.update(entry.get("models") or {})
+
+    by_agent = summary.get("by_agent") or {}
+    cost = summary.get("cost_computation") or {}
+    details = cost.get("details") or {}
+    cost_source = "run" if cost.get("status") == "ok" else None
+    total_cost = cost.get("total_cost_usd") if cost_source else None
+    if cost_source is None and by_agent and not pricing_missing:
+        details, total_cost = compute_cost_usd_per_1M(pricing, by_agent)
+        cost_source = "env"
+
+    names = set(os.listdir(run_dir))
+    if "PASS_MARKER" in names:
+        status = "pass"
+    elif "BUDGET_EXHAUSTED" in names:
+        status = "budget_exhausted"
+    elif any(n.startswith("CRASH_") for n in names):
+        status = "crash"
+    else:
+        status = "fail"
+
+    case = case_of(run_dir)
+    return {
+        "run_dir": run_dir,
+        "case": case,
+        "model": _run_model(models, run_dir, default_model),
+        "models": models,
+        "status": status,
+        "iterations": iterations,
+        "iterations_to_pass": iterations if status == "pass" else None,
+        "wall_clock_s": round(wall, 3),
+        "cost_usd": total_cost,
+        "cost_source": cost_source,
+        "roles": {
+            role: {
+                "input": (by_agent.get(role) or {}).get("input"),
+                "output": (by_agent.get(role) or {}).get("output"),
+                "cached_input": (by_agent.get(role) or {}).get("cached_input"),
+                "cost_usd": (details.get(role) or {}).get("cost_usd"),
+                "seconds": (
+                    None if role_seconds[role] is None else round(role_seconds[role], 3)
+                ),
+            }
+            for role in ROLES
+        },
+        **run_quality(run_dir, case, results_root),
+    }
+
+
+def group_runs(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for r in runs:
+        groups.setdefault((r["case"], r["model"]), []).append(r)
+    out = []
+    for (case, model), rs in sorted(groups.items()):
+        out.append(
+            {
+                "case": case,
+                "model": model,
+                "runs": len(rs),
+                "pass_rate": round(sum(r["status"] == "pass" for r in rs) / len(rs), 3),
+                "cost_usd": _mean([r["cost_usd"] for r in rs]),
+                "wall_clock_s": _mean([r["wall_clock_s"] for r in rs]),
+                "iterations_to_pass": _mean([r["iterations_to_pass"] for r in rs]),
+                "quality": _mean([r["quality"] for r in rs]),
+                "roles": {
+                    role: {
+                        "cost_usd": _mean([r["roles"][role]["cost_usd"] for r in rs]),
+                        "seconds": _mean([r["roles"][role]["seconds"] for r in rs]),
+                        "output_tokens": _mean(
+                            [r["roles"][role]["output"] for r in rs]
+                        ),
+                    }
+                    for role in ROLES
+                },
+                "run_dirs": [r["run_dir"] for r in rs],
+            }
+        )
+    return out
+
+
+def _objectives(g: Dict[str, Any]) -> tuple:
+    """Lower is better on every axis; unknown values are the worst."""
+    inf = float("inf")
+    return (
+        inf if g["cost_usd"] is None else g["cost_usd"],
+        inf if g["wall_clock_s"] is None else g["wall_clock_s"],
+        inf if g["quality"] is None else -g["quality"],
+    )
+
+
+def mark_frontier(groups: List[Dict[str, Any]]) -> None:
+    """Set g["frontier"] on every group: not dominated by another group of its case."""
+    for g in groups:
+        a = _objectives(g)
+        g["frontier"] = not any(
+            o is not g
+            and o["case"] == g["case"]
+            and all(x <= y for x, y in zip(_objectives(o), a))
+            and _objectives(o) != a
+            for o in groups
+        )
+
+
+def _fmt(v: Any, digits: int = 4) -> str:
+    if v is None:
+        return "—"
+    if isinstance(v, float):
+        return f"{v:.{digits}f}"
+    return str(v)
+
+
+def render_html(report: Dict[str, Any]) -> str:
+    head = (
+        "<tr><th>Case</th><th>Model</th><th>Runs</th><th>Pass rate</th>"
+        "<th>Cost (USD)</th><th>Wall-clock (s)</th><th>Iters to PASS</th>"
+        "<th>Quality</th>"
+        + "".join(f"<th>{r} USD</th><th>{r} s</th>" for r in ROLES)
+        + "</tr>"
+    )
+    rows = []
+    for g in report["groups"]:
+        cells = [
+            g["case"],
+            g["model"],
+            g["runs"],
+            _fmt(g["pass_rate"], 2),
+            _fmt(g["cost_usd"]),
+            _fmt(g["wall_clock_s"], 1),
+            _fmt(g["iterations_to_pass"], 1),
+            _fmt(g["quality"], 3),
+        ]
+        for role in ROLES:
+            cells += [
+                _fmt(g["roles"][role]["cost_usd"]),
+                _fmt(g["roles"][role]["seconds"], 1),
+            ]
+        cls = ' class="frontier"' if g["frontier"] else ""
+        rows.append(
+            f"<tr{cls}>"
+            + "".join(f"<td>{html.escape(str(c))}</td>" for c in cells)
+            + "</tr>"
+        )
+    return f"""<!doctype html>
+<html lang="en"><head><meta charset="utf-8"><title>Cost–latency–quality frontier</title>
+<style>
+body {{ font-family: system-ui, sans-serif; margin: 2rem; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: .3rem .6rem; text-align: right; }}
+th:nth-child(-n+2), td:nth-child(-n+2) {{ text-align: left; }}
+tr.frontier {{ background: #e6f4ea; font-weight: 600; }}
+</style></head><body>
+<h1>Cost–latency–quality frontier</h1>
+<p>{report['run_count']} run(s) below {html.escape(report['root'])}. Highlighted rows are
+on their case's Pareto frontier (lower cost and wall-clock, higher quality; quality is
+the mean judge total as a share of the maximum).</p>
+<table>
+{head}
+{chr(10).join(rows)}
+</table>
+</body></html>
+"""
+
+
+def build_report(
+    root: str, results_root: Optional[str], default_model: str
+) -> Dict[str, Any]:
+    pricing, pricing_missing = load_pricing()
+    runs = [
+        index_run(d, pricing, pricing_missing, results_root, default_model)
+        for d in sorted(iter_run_dirs(root))
+    ]
+    groups = group_runs(runs)
+    mark_frontier(groups)
+    return {
+        "root": root,
+        "run_count": len(runs),
+        "groups": groups,
+        "frontier": [
+            {"case": g["case"], "model": g["model"]} for g in groups if g["frontier"]
+        ],
+        "runs": runs,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Join cost, latency and rubric scores across runs into a frontier report."
+    )
+    parser.add_argument("root", help="Workspace root to scan for run directories")
+    parser.add_argument("--out", default=None, help="Output directory (default: root)")
+    parser.add_argument(
+        "--results",
+        default=os.path.join("final_evaluations", "results"),
+        help="Published judge results for case_N_* run directories",
+    )
+    parser.add_argument(
+        "--default-model",
+        default="(unknown)",
+        help="Model label for runs whose logs predate per-iteration model names",
+    )
+    args = parser.parse_args()
+
+    results_root = args.results if os.path.isdir(args.results) else None
+    report = build_report(args.root, results_root, args.default_model)
+    out = args.out or args.root
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, "frontier.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(out, "frontier.html"), "w", encoding="utf-8") as f:
+        f.write(render_html(report))
+    print(
+        f"{report['run_count']} run(s), {len(report['groups'])} (case, model) group(s), "
+        f"{len(report['frontier'])} on the frontier -> {out}/frontier.json, frontier.html"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+"""
+Load test for a generated auth server (app.ts) as a performance fitness signal.
+
+An asyncio load generator drives the login, MFA, reset-request and
+code-verify endpoints at a fixed concurrency. Each virtual user first loads
+"/" to get its session cookie and CSRF token (<meta name="csrf-token">), as the
+generated clients do. The report gives p50/p95/p99 latency, throughput, status
+codes and rate-limiter behaviour (429s, requests before the first 429,
+Retry-After) per endpoint. It is written to <run dir>/loadtest_report.json and
+loadtest_report.md.
+
+Endpoint paths differ between generated apps, so they are discovered from
+app.ts (override with --endpoint kind=/path). Without --target, a Python
+stand-in server with the same shape (sessions, CSRF, token-bucket limits) is
+started locally, for environments without Bun.
+
+    python -m app.loadtest workspace/password_recovery_health/case_1_... \\
+        --target https://localhost:8441 --insecure --concurrency 50 --duration 20
+    python -m app.loadtest workspace/x/run1            # against the stand-in
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# kind -> path patterns tried in order against the routes found in app.ts
+ENDPOINT_KINDS = {
+    "login": [r"/login/start$", r"/login$"],
+    "mfa": [r"/verify-mfa$", r"/login/verify$", r"/mfa/verify$", r"mfa"],
+    "reset_request": [r"/request-reset$", r"/reset/request$", r"forgot"],
+    "code_verify": [r"/verify-reset$", r"/reset/verify$", r"/verify-code$"],
+}
+DEFAULT_ENDPOINTS = {
+    "login": "/api/login",
+    "mfa": "/api/verify-mfa",
+    "reset_request": "/api/request-reset",
+    "code_verify": "/api/verify-reset",
+}
+_ROUTE_RE = re.compile(r"""path(?:name)?\s*===\s*["'](/api/[^"']+)["']""")
+_PORT_RE = re.compile(r"""\bport\s*[:=]\s*(\d{2,5})|\bPORT\s*=\s*(\d{2,5})""")
+_CSRF_RE = re.compile(
+    r"""<meta[^>]+name=["']csrf-token["'][^>]+content=["']([^"']+)["']""", re.I
+)
+
+
+def discover_endpoints(app_ts: str) -> Dict[str, str]:
+    """Map endpoint kinds to the POST routes an app.ts declares."""
+    routes = list(dict.fromkeys(_ROUTE_RE.findall(app_ts)))
+    found: Dict[str, str] = {}
+    for kind, patterns in ENDPOINT_KINDS.items():
+        for pat in patterns:
+            match = next(
+                (r for r in routes if re.search(pat, r) and r not in found.values()),
+                None,
+            )
+            if match:
+                found[kind] = match
+                break
+    return found
+
+
+def discover_port(app_ts: str) -> Optional[int]:
+    m = _PORT_RE.search(app_ts)
+    return int(m.group(1) or m.group(2)) if m else None
+
+
+def _payload(kind: str, user: int) -> Dict[str, Any]:
+    email = f"load{user}@example.com"
+    return {
+        "login": {"identifier": email, "email": email, "password": "Wrong-pass-123"},
+        "mfa": {"code": "000000"},
+        "reset_request": {"identifier": email, "email": email},
+        "code_verify": {"token": "invalid-token", "code": "000000"},
+    }[kind]
+
+
+# ---------------- load generator ----------------
+
+
+def _percentile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+class _Stats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.status: Dict[str, int] = {}
+        self.errors = 0
+        self.first_429_at: Optional[int] = None
+        self.retry_after: List[float] = []
+
+    def add(self, seconds: float, status: Optional[int], retry_after: Optional[str]):
+        self.latencies.append(seconds)
+        if status is None:
+            self.errors += 1
+            return
+        self.status[str(status)] = self.status.get(str(status), 0) + 1
+        if status == 429:
+            if self.first_429_at is None:
+                self.first_429_at = len(self.latencies)
+            try:
+                self.retry_after.append(float(retry_after or ""))
+            except ValueError:
+                pass
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        n = len(lat)
+        limited = self.status.get("429", 0)
+        return {
+            "requests": n,
+            "throughput_rps": round(n / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                k: (round(v * 1000, 2) if v is not None else None)
+                for k, v in (
+                    ("p50", _percentile(lat, 0.50)),
+                    ("p95", _percentile(lat, 0.95)),
+                    ("p99", _percentile(lat, 0.99)),
+                    ("max", lat[-1] if lat else None),
+                )
+            },
+            "status": dict(sorted(self.status.items())),
+            "errors": self.errors,
+            "rate_limit": {
+                "limited": limited,
+                "limited_ratio": round(limited / n, 4) if n else 0.0,
+                "first_429_after_requests": self.first_429_at,
+                "retry_after_s_max": (
+                    max(self.retry_after) if self.retry_after else None
+                ),
+            },
+        }
+
+
+async def _virtual_user(
+    user: int,
+    base_url: str,
+    endpoints: Dict[str, str],
+    deadline: float,
+    stats: Dict[str, _Stats],
+    verify: bool,
+    timeout: float,
+) -> None:
+    kinds = list(endpoints)
+    async with httpx.AsyncClient(
+        base_url=base_url, verify=verify, timeout=timeout
+    ) as client:
+        csrf = ""
+        t = time.perf_counter()
+        try:
+            resp = await client.get("/")
+            m = _CSRF_RE.search(resp.text)
+            csrf = m.group(1) if m else ""
+            stats["page"].add(time.perf_counter() - t, resp.status_code, None)
+        except httpx.HTTPError:
+            stats["page"].add(time.perf_counter() - t, None, None)
+        i = user
+        while time.perf_counter() < deadline:
+            kind = kinds[i % len(kinds)]
+            i += 1
+            t = time.perf_counter()
+            try:
+                resp = await client.post(
+                    endpoints[kind],
+                    json=_payload(kind, user),
+                    headers={"X-CSRF-Token": csrf} if csrf else None,
+                )
+                stats[kind].add(
+                    time.perf_counter() - t,
+                    resp.status_code,
+                    resp.headers.get("retry-after"),
+                )
+            except httpx.HTTPError:
+                stats[kind].add(time.perf_counter() - t, None, None)
+
+
+async def run_load(
+    base_url: str,
+    endpoints: Dict[str, str],
+    concurrency: int = 20,
+    duration_s: float = 10.0,
+    verify: bool = True,
+    timeout: float = 10.0,
+) -> Dict[str, Any]:
+    """Drive the endpoints with `concurrency` virtual users for `duration_s` seconds."""
+    stats = {k: _Stats() for k in ["page", *endpoints]}
+    t0 = time.perf_counter()
+    deadline = t0 + duration_s
+    await asyncio.gather(
+        *(
+            _virtual_user(u, base_url, endpoints, deadline, stats, verify, timeout)
+            for u in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - t0
+    total = _Stats()
+    for kind in endpoints:
+        s = stats[kind]
+        total.latencies.extend(s.latencies)
+        total.errors += s.errors
+        for code, n in s.status.items():
+            total.status[code] = total.status.get(code, 0) + n
+    return {
+        "target": base_url,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "endpoints": {
+            kind: {"path": endpoints.get(kind, "/"), **stats[kind].report(elapsed)}
+            for kind in stats
+        },
+        "overall": total.report(elapsed),
+    }
+
+
+# ---------------- stand-in server ----------------
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Python stand-in with the generated servers' shape: session + CSRF + token buckets."""
+
+    sessions: Dict[str, str] = {}
+    buckets: Dict[Tuple[str, str], List[float]] = {}
+    lock = threading.Lock()
+    capacity = 10.0
+    refill_per_s = 5.0
+
+    def log_message(self, *a) -> None:
+        pass
+
+    def _send(self, code: int, payload: Dict[str, Any], headers=None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _allow(self, sid: str, route: str) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get((sid, route), [self.capacity, now])
+            tokens = min(self.capacity, tokens + (now - last) * self.refill_per_s)
+            ok = tokens >= 1
+            self.buckets[(sid, route)] = [tokens - 1 if ok else tokens, now]
+        return ok, (0.0 if ok else (1 - tokens) / self.refill_per_s)
+
+    def do_GET(self) -> None:
+        sid, csrf = secrets.token_hex(16), secrets.token_hex(16)
+        with self.lock:
+            self.sessions[sid] = csrf
+        body = f'<html><head><meta name="csrf-token" content="{csrf}"></head></html>'
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Set-Cookie", f"sid={sid}; HttpOnly; Path=/")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"message": "Bad JSON"})
+        cookie = self.headers.get("Cookie") or ""
+        m = re.search(r"sid=([0-9a-f]+)", cookie)
+        sid = m.group(1) if m else ""
+        if not sid or self.sessions.get(sid) != self.headers.get("X-CSRF-Token"):
+            return self._send(403, {"message": "Forbidden (CSRF)"})
+        if self.path not in DEFAULT_ENDPOINTS.values():
+            return self._send(404, {"message": "Not found"})
+        ok, retry = self._allow(sid, self.path)
+        if not ok:
+            return self._send(
+                429,
+                {"message": "Too many attempts"},
+                {"Retry-After": str(max(1, round(retry)))},
+            )
+        if self.path == "/api/request-reset":
+            return self._send(
+                200, {"message": "If the account exists, we sent a code."}
+            )
+        if not isinstance(body, dict):
+            return self._send(400, {"message": "Bad request"})
+        return self._send(400, {"message": "Invalid credentials or code"})
+
+
+def start_standin(port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stand-in on localhost in a daemon thread; returns (server, base_url)."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), _StandIn)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+# ---------------- report ----------------
+
+
+def render_report_md(report: Dict[str, Any]) -> str:
+    lines = [
+        "# LOAD TEST REPORT",
+        "",
+        f"- Target: {report['target']} ({report['target_kind']})",
+        f"- Concurrency: {report['concurrency']} · Duration: {report['duration_s']}s",
+        f"- Throughput: {report['overall']['throughput_rps']} req/s",
+        "",
+        "| Endpoint | Path | Requests | p50 ms | p95 ms | p99 ms | 429s | First 429 | Status |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for kind, r in [*report["endpoints"].items(), ("overall", report["overall"])]:
+        lat, rl = r["latency_ms"], r["rate_limit"]
+        lines.append(
+            f"| {kind} | {r.get('path', '')} | {r['requests']} | {lat['p50']} | "
+            f"{lat['p95']} | {lat['p99']} | {rl['limited']} | "
+            f"{rl['first_429_after_requests']} | {json.dumps(r['status'])} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Load-test a generated auth server and write a report into its run directory."
+    )
+    parser.add_argument("run_dir", help="Run directory holding app.ts")
+    parser.add_argument(
+        "--target", default=None, help="Base URL of the running app (default: stand-in)"
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per request (s)")
+    parser.add_argument(
+        "--insecure",
+        action="store_true",
+        help="Skip TLS verification (mkcert/self-signed)",
+    )
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        default=[],
+        metavar="KIND=PATH",
+        help=f"Override a discovered endpoint ({', '.join(ENDPOINT_KINDS)})",
+    )
+    args = parser.parse_args()
+
+    app_ts_path = os.path.join(args.run_dir, "app.ts")
+    app_ts = ""
+    if os.path.isfile(app_ts_path):
+        with open(app_ts_path, encoding="utf-8") as f:
+            app_ts = f.read()
+
+    standin = None
+    if args.target:
+        endpoints = discover_endpoints(app_ts)
+        base_url, target_kind = args.target.rstrip("/"), "external"
+    else:
+        endpoints = dict(DEFAULT_ENDPOINTS)
+        standin, base_url = start_standin()
+        target_kind = "standin"
+    for item in args.endpoint:
+        kind, _, path = item.partition("=")
+        if kind not in ENDPOINT_KINDS or not path.startswith("/"):
+            raise SystemExit(
+                f"--endpoint expects KIND=/path with KIND in {list(ENDPOINT_KINDS)}"
+            )
+        endpoints[kind] = path
+    if not endpoints:
+        raise SystemExit("No endpoints found in app.ts; pass --endpoint KIND=/path")
+
+    print(f"Load test {base_url} ({target_kind}) endpoints={endpoints}", flush=True)
+    try:
+        report = asyncio.run(
+            run_load(
+                base_url,
+                endpoints,
+                args.concurrency,
+                args.duration,
+                verify=not args.insecure,
+                timeout=args.timeout,
+            )
+        )
+    finally:
+        if standin:
+            standin.shutdown()
+            standin.server_close()
+    report["target_kind"] = target_kind
+    report["app_port"] = discover_port(app_ts)
+
+    with open(
+        os.path.join(args.run_dir, "loadtest_report.json"), "w", encoding="utf-8"
+    ) as f:
+        json.dump(report, f, indent=2)
+    md = render_report_md(report)
+    with open(
+        os.path.join(args.run_dir, "loadtest_report.md"), "w", encoding="utf-8"
+    ) as f:
+        f.write(md)
+    print(md)
+
+
+if __name__ == "__main__":
+    main()
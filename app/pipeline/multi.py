@@ -1,16 +1,64 @@
+import contextvars
+import functools
+import hashlib
 import json
 import time
 import os
-import pathlib
-from typing import List, TypedDict, cast
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, cast
 
 from langgraph.graph import StateGraph, END
 
 from app.constants import INIT_CODE
-from app.utils.io import vprint, safe_invoke, normalize_content, set_args
-from app.utils.tokens import TOK, add_usage, extract_usage
+from app.utils.io import (
+    vprint,
+    safe_invoke,
+    normalize_content,
+    set_args,
+    stream_invoke,
+    read_text_cached,
+)
+from app.utils.tokens import (
+    CallUsage,
+    book_calls,
+    call_usage,
+    usage_scope,
+    usage_totals,
+)
 from app.utils.pricing import load_pricing
+from app.utils.scheduler import BudgetScheduler
+from app.utils.codeindex import REGION_INSTRUCTIONS, CodeIndex
+from app.utils.pipelining import Speculation, before_decision, decided_pass
+from app.utils.promptprofile import PromptProfile
+from app.utils.reqindex import RequirementsIndex
+from app.utils.routing import ModelRouter
+from app.utils.sharding import (
+    SHARD_INSTRUCTIONS,
+    ShardConflict,
+    merge_shards,
+    plan_shards,
+    shard_message,
+    split_regions,
+)
 from app.utils.summary import finalize_summary
+from app.utils.diff import code_diff
+from app.utils.continuation import invoke_file
+from app.utils.artifacts import ArtifactWriter
+from app.registry import open_registry
+from app.utils.profiling import NodeProfiler
+from app.utils.structured import (
+    TASKER_SCHEMA,
+    EVALUATOR_SCHEMA,
+    EVALUATOR_JSON_INSTRUCTIONS,
+    TASKER_JSON_INSTRUCTIONS,
+    invoke_structured,
+    is_sentinel_task,
+    parse_json_lenient,
+    partial_verdict,
+    render_verdict_md,
+    validate_tasker,
+    validate_verdict,
+)
 from provider import make_three_llms
 
 
@@ -21,14 +69,86 @@ class State(TypedDict):
     done: bool
     iter: int
     step: int
+    eval_mode: str
+    plan: str
 
 
-def run_multi(args) -> None:
+# Precomputed first Tasker reply for a run (written by `python -m app.batch tasker`)
+TASKER_SEED = "tasker_seed.json"
+
+
+def messages_hash(messages: List[Dict[str, str]]) -> str:
+    """Fingerprint of a chat request; ties a batch reply to the exact prompt it answers."""
+    blob = json.dumps([[m["role"], m["content"]] for m in messages], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def tasker_user_message(
+    requirements: str, evaluator_md: str, task_list: List[str]
+) -> str:
+    return f"""Requirements:
+        {requirements}
+        Evaluator feedback:
+        {evaluator_md}
+        Current tasks: {json.dumps(task_list, ensure_ascii=False)}
+        """
+
+
+# Node callables of the current run; the compiled graph is the same for every
+# run (flags only change what the nodes do), so it is built once per process
+# and each invocation dispatches to the nodes of the run that set this
+_NODES: contextvars.ContextVar[Dict[str, Callable[[State], State]]] = (
+    contextvars.ContextVar("graph_nodes")
+)
+
+
+def _dispatch(name: str) -> Callable[[State], State]:
+    def node(state: State) -> State:
+        return _NODES.get()[name](state)
+
+    node.__name__ = f"{name}_node"
+    return node
+
+
+@functools.lru_cache(maxsize=1)
+def _compiled_graph():
+    """Tasker -> Coder -> Evaluator graph, compiled once and reused by every run."""
+    g = StateGraph(State)
+    g.add_node("tasker", _dispatch("tasker"))
+    g.add_node("coder", _dispatch("coder"))
+    g.add_node("evaluator", _dispatch("evaluator"))
+
+    # Always proceed Tasker -> Coder; Evaluator alone can set done=True (PASS)
+    g.add_edge("tasker", "coder")
+    g.add_edge("coder", "evaluator")
+
+    def _next_after_evaluator(state: State) -> str:
+        return "end"
+
+    g.add_conditional_edges(
+        "evaluator",
+        _next_after_evaluator,
+        {
+            "end": END,
+        },
+    )
+    g.set_entry_point("tasker")
+    return g.compile()
+
+
+def run_multi(
+    args, on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict:
     """
     Multi-agent Tasker → Coder → Evaluator loop, unchanged behavior from original run.py.
+    on_event (optional) receives {"type": "iteration", ...log entry} after every
+    iteration and {"type": "finished", ...} at the end; returns the token summary.
     """
     # Make io utils aware of args for vprint/safe_invoke
     set_args(args)
+    run_t0 = time.time()
+    # Token counters for this run only
+    TOK = usage_scope()
 
     vprint(
         "CONFIG (multi):",
@@ -39,22 +159,31 @@ def run_multi(args) -> None:
         f"output={args.output}",
         f"criteria={'(none)' if not args.criteria else args.criteria}",
         f"max_iters={args.max_iters}",
+        f"structured={args.structured}",
+        f"eval_incremental={args.eval_incremental} (full every {args.eval_full_every})",
     )
 
     # Load prompt texts
-    SYSTEM_TASKER = pathlib.Path(args.tasker).read_text(encoding="utf-8")
-    SYSTEM_CODER = pathlib.Path(args.coder).read_text(encoding="utf-8")
-    SYSTEM_EVAL = pathlib.Path(args.eval_).read_text(encoding="utf-8")
-    requirements = pathlib.Path(args.requirements).read_text(encoding="utf-8")
+    SYSTEM_TASKER = read_text_cached(args.tasker)
+    SYSTEM_CODER = read_text_cached(args.coder)
+    SYSTEM_EVAL = read_text_cached(args.eval_)
+    requirements = read_text_cached(args.requirements)
 
     INCLUSIVITY_CRITERIA = None
     if args.criteria:
-        INCLUSIVITY_CRITERIA = pathlib.Path(args.criteria).read_text(encoding="utf-8")
+        INCLUSIVITY_CRITERIA = read_text_cached(args.criteria)
 
     MAX_ITERS = args.max_iters
+    # Optional BM25 section index for trimming the Coder's requirements
+    req_index = RequirementsIndex(requirements) if args.req_sections else None
 
     # MODELS
     llm_tasker, llm_coder, llm_eval = make_three_llms(temperature=0.0)
+    # Optional per-role model cascades ({PROVIDER}_{ROLE}_MODEL_CASCADE)
+    router = ModelRouter(
+        {"tasker": llm_tasker, "coder": llm_coder, "evaluator": llm_eval},
+        escalate_after=args.escalate_after,
+    )
 
     # Try to print model names if available (LangChain wrappers vary)
     def _model_name(llm):
@@ -70,6 +199,25 @@ def run_multi(args) -> None:
         f"CODER={_model_name(llm_coder)}",
         f"EVALUATOR={_model_name(llm_eval)}",
     )
+    if router.enabled:
+        vprint("CASCADES:", {r: t for r, t in router.tiers.items() if t})
+    if router.hedges:
+        vprint("HEDGING: alternate provider", os.getenv("LLM_HEDGE_PROVIDER"))
+    # Next-iteration Tasker call started from the streamed Evaluator (--pipeline)
+    speculation = Speculation() if args.pipeline else None
+    # Per-section prompt token counts (--prompt-profile)
+    prompt_profile = PromptProfile() if args.prompt_profile else None
+
+    def _profile_prompt(role: str, call: str, iter_no: int, messages, **sections):
+        if prompt_profile:
+            prompt_profile.record(
+                role,
+                call,
+                iter_no,
+                router.model(role),
+                messages,
+                {"system": messages[0]["content"], **sections},
+            )
 
     pricing, pricing_missing = load_pricing()
     if args.verbose:
@@ -92,47 +240,141 @@ def run_multi(args) -> None:
         "done": False,
         "iter": 0,
         "step": 0,
+        "eval_mode": "full",
+        "plan": "full",
     }
 
+    # Artifacts are written off the critical path by a background thread
+    writer = ArtifactWriter(args.output)
+
+    # Optional SQLite run registry (--registry / RUN_REGISTRY)
+    registry = open_registry(args.registry)
+    if registry:
+        run_id = registry.start_run(
+            args.output,
+            "multi",
+            requirements=args.requirements,
+            provider=os.getenv("LLM_PROVIDER", "openai"),
+            models=router.models(),
+        )
+
+    def _log_routing(decision) -> None:
+        if decision:
+            writer.append("routing.jsonl", json.dumps(decision, ensure_ascii=False))
+
     # NODES
-    def tasker_node(state: State) -> State:
-        user_msg = f"""Requirements:
-        {requirements}
-        Evaluator feedback:
-        {state.get('evaluator_md','(none yet)')}
-        Current tasks: {json.dumps(state.get('task_list', []), ensure_ascii=False)}
+    def _tasker_seed(user_msg: str):
+        """
+        First Tasker reply precomputed by a batch submission, if one was written
+        for this run's model and exact request and it parses; (data, text, usage) or None.
         """
+        path = os.path.join(args.output, TASKER_SEED)
+        if not os.path.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            seed = json.load(f)
+        if seed.get("model") != router.model("tasker"):
+            vprint(f"TASKER: {TASKER_SEED} is for {seed.get('model')}; ignoring it")
+            return None
+        if seed.get("messages_hash") != messages_hash(_tasker_messages(user_msg)):
+            vprint(f"TASKER: {TASKER_SEED} answers a different request; ignoring it")
+            return None
+        try:
+            data = validate_tasker(parse_json_lenient(seed.get("text", "")))
+        except (ValueError, TypeError) as e:
+            vprint(f"TASKER: {TASKER_SEED} does not parse ({e}); calling the model")
+            return None
+        usage = seed.get("usage") or [0, 0, 0]
+        return data, seed["text"], [CallUsage(None, usage[0], usage[1], usage[2])]
+
+    def _tasker_feedback(evaluator_md: str) -> str:
+        # With --pipeline the Tasker never sees the DECISION line (it only runs
+        # after a FAIL), so its prompt is complete once NEW_TASKS is streamed.
+        if speculation is None:
+            return evaluator_md
+        return before_decision(evaluator_md) or evaluator_md
+
+    def _tasker_key(user_msg: str) -> str:
+        return f"{router.model('tasker')}\n{user_msg}"
+
+    def _tasker_messages(user_msg: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": SYSTEM_TASKER},
+            {"role": "user", "content": user_msg},
+        ]
+
+    def _tasker_call(
+        user_msg: str, iter_no: int, cancel=None, crash_marker: bool = True
+    ):
+        # Tasker output is JSON; tolerate malformed replies via repair-and-retry
+        return invoke_structured(
+            router.llm("tasker"),
+            _tasker_messages(user_msg),
+            TASKER_SCHEMA,
+            validate_tasker,
+            "TASKER",
+            iter_no,
+            native=args.structured,
+            cancel=cancel,
+            crash_marker=crash_marker,
+            json_instructions=TASKER_JSON_INSTRUCTIONS,
+        )
+
+    def tasker_node(state: State) -> State:
+        if state.get("plan") == "reduced":
+            # Budget scheduler chose Coder+Evaluator only; code the Evaluator's NEW_TASKS
+            vprint(f"[iter {state.get('iter','?')}] TASKER: skipped (reduced plan)")
+            if speculation:
+                speculation.cancel("reduced plan")
+            return state
+        feedback = _tasker_feedback(state.get("evaluator_md", "(none yet)"))
+        user_msg = tasker_user_message(
+            requirements, feedback, state.get("task_list", [])
+        )
         # Debug
         state["step"] = int(state.get("step", 0)) + 1
         prefix = f"[iter {state.get('iter','?')} | step {state.get('step','?')}]"
         vprint(f"{prefix} TASKER: invoking")
-        resp = safe_invoke(
-            llm_tasker,
-            [
-                {"role": "system", "content": SYSTEM_TASKER},
-                {"role": "user", "content": user_msg},
-            ],
+        _profile_prompt(
+            "tasker",
             "TASKER",
             int(state.get("iter", 0)),
+            _tasker_messages(user_msg),
+            requirements=requirements,
+            evaluator_feedback=feedback,
+            task_list=json.dumps(state.get("task_list", []), ensure_ascii=False),
         )
-        # Tokens
-        it, ot, cit = extract_usage(resp)
-        add_usage("tasker", it, ot, cit)
+        seeded = _tasker_seed(user_msg) if int(state.get("iter", 0)) == 1 else None
+        ahead = speculation.take(_tasker_key(user_msg)) if speculation else None
+        if seeded:
+            data, text, calls = seeded
+            vprint(f"{prefix} TASKER: using batch reply from {TASKER_SEED}")
+        elif ahead:
+            data, text, calls = ahead
+            vprint(f"{prefix} TASKER: using reply started during the Evaluator stream")
+        else:
+            data, text, calls = _tasker_call(user_msg, int(state.get("iter", 0)))
+        if seeded:
+            it, ot, cit = usage_totals(calls)
+            router.add_batch_usage("tasker", it, ot, cit)
+        else:
+            it, ot, cit = book_calls("tasker", calls)
         if args.verbose:
             vprint(
                 f"{prefix} TASKER tokens: input={it}, cached_input={cit}, output={ot}"
             )
-
-        text = normalize_content(resp.content)
-        if args.verbose:
             preview = (text[:400] + "…") if len(text) > 400 else text
             vprint(f"{prefix} TASKER output (preview): {preview}")
 
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError as e:
-            vprint(f"{prefix} TASKER JSON ERROR. Raw:\n{text}")
-            raise ValueError(f"Tasker did not return valid JSON. Got:\n{text}") from e
+        _log_routing(
+            router.note_tasker_parse(data is not None, int(state.get("iter", 0)))
+        )
+        if data is None:
+            # Do not kill the run: keep the current task list and continue.
+            vprint(
+                f"{prefix} TASKER JSON ERROR after retries; keeping tasks. Raw:\n{text}"
+            )
+            data = {"task_list": []}
 
         new_list = data.get("task_list", [])
         # Evaluator is authoritative for 'done'; do not modify state['done'] here.
@@ -169,26 +411,20 @@ def run_multi(args) -> None:
             report_md_lines.append("(none)")
         report_md = "\n".join(report_md_lines)
 
-        latest_path = pathlib.Path(args.output, "tasker_report.md")
-        versioned_path = pathlib.Path(args.output, f"tasker_report_iter{iter_no}.md")
-        latest_path.write_text(report_md, encoding="utf-8")
-        if not versioned_path.exists():
-            versioned_path.write_text(report_md, encoding="utf-8")
-            if args.verbose:
-                vprint(
-                    f"{prefix} TASKER: wrote tasker_report.md and {versioned_path.name}"
-                )
-        else:
-            if args.verbose:
-                vprint(
-                    f"{prefix} TASKER: versioned exists, skipping overwrite of {versioned_path.name}"
-                )
+        # The versioned report is never overwritten once it exists
+        versioned_name = f"tasker_report_iter{iter_no}.md"
+        writer.write_versioned(
+            "tasker_report.md", versioned_name, report_md, overwrite=False
+        )
+        if args.verbose:
+            vprint(f"{prefix} TASKER: queued tasker_report.md and {versioned_name}")
 
         return state
 
     def coder_node(state: State) -> State:
         tasks_str = "\n".join(f"- {t}" for t in state["task_list"]) or "(no tasks)"
-        user_msg = f"""Requirements (for reference): {requirements}
+        req_label, req_text = _coder_requirements(state)
+        user_msg = f"""{req_label}: {req_text}
         Tasks to implement now:
         {tasks_str}
 
@@ -199,45 +435,382 @@ def run_multi(args) -> None:
         prefix = f"[iter {state.get('iter','?')} | step {state.get('step','?')}]"
         vprint(f"{prefix} CODER: invoking with {len(state['task_list'])} task(s)")
 
-        resp = safe_invoke(
-            llm_coder,
-            [
-                {"role": "system", "content": SYSTEM_CODER},
-                {"role": "user", "content": user_msg},
-            ],
+        iter_no = int(state.get("iter", 0))
+        code = None
+        if args.coder_shards > 1:
+            code = _sharded_code(state, iter_no, prefix, req_text)
+        if code is None and args.coder_regions:
+            code = _region_code(state, iter_no, prefix, req_label, req_text)
+        if code is not None:
+            state["code_tsx"] = code
+            writer.write_versioned("app.ts", f"code_iter{iter_no}.tsx", code)
+            return state
+
+        messages = [
+            {"role": "system", "content": SYSTEM_CODER},
+            {"role": "user", "content": user_msg},
+        ]
+        _profile_prompt(
+            "coder",
             "CODER",
-            iter_no=state.get("iter", 0),
+            iter_no,
+            messages,
+            requirements=req_text,
+            task_list=tasks_str,
+            code=state["code_tsx"],
         )
-        it, ot, cit = extract_usage(resp)
-        add_usage("coder", it, ot, cit)
+        text, code, calls = invoke_file(
+            router.llm("coder"),
+            messages,
+            "CODER",
+            iter_no,
+            max_continuations=args.max_continuations,
+        )
+        it, ot, cit = book_calls("coder", calls)
         if args.verbose:
             vprint(
                 f"{prefix} CODER tokens: input={it}, cached_input={cit}, output={ot}"
             )
 
-        text = normalize_content(resp.content)
-        start = text.find("<FILE>")
-        end = text.find("</FILE>")
-        code = text[start + 6 : end] if start != -1 and end != -1 else text
+        if code is None:
+            # Truncated even after continuations: keep the previous artifact
+            # rather than saving a partial file; keep the raw output for audit.
+            print(
+                f"[WARN] CODER output incomplete in iter {iter_no}; keeping previous app.ts"
+            )
+            writer.write(f"TRUNCATED_CODER_iter{iter_no}.txt", text)
+            return state
         state["code_tsx"] = code
 
         # Save artifacts
-        pathlib.Path(args.output, "app.ts").write_text(
-            state["code_tsx"], encoding="utf-8"
+        writer.write_versioned("app.ts", f"code_iter{iter_no}.tsx", state["code_tsx"])
+        if args.verbose:
+            vprint(
+                f"{prefix} CODER: queued app.ts and code_iter{iter_no}.tsx (chars={len(state['code_tsx'])})"
+            )
+        return state
+
+    # Structural index of the current app.ts (--coder-regions); None = rebuild
+    code_index: Dict[str, Optional[CodeIndex]] = {"index": None}
+
+    def _region_code(
+        state: State, iter_no: int, prefix: str, req_label: str, req_text: str
+    ) -> Optional[str]:
+        """
+        --coder-regions: send the Coder an outline of app.ts plus only the
+        blocks its tasks touch, and splice the returned blocks back in place.
+        Returns the new file, or None to fall back to the full-file Coder.
+        """
+        index = code_index["index"]
+        if index is None or index.code != state["code_tsx"]:
+            index = code_index["index"] = CodeIndex(state["code_tsx"])
+        sel, reason = index.select(state["task_list"], args.coder_regions)
+        record: Dict[str, Any] = {"iter": iter_no, "blocks": len(index.blocks)}
+        if sel is None:
+            vprint(f"{prefix} CODER: full file ({reason})")
+            return None
+        tasks_str = "\n".join(f"- {t}" for t in state["task_list"])
+        outline = index.outline()
+        regions = index.message_regions(sel["ids"])
+        user_msg = f"""{req_label}: {req_text}
+        Tasks to implement now:
+        {tasks_str}
+
+        Outline of app.ts (block id, kind, name, lines):
+        {outline}
+
+        Regions to edit (return each one you change, in full):
+        {regions}
+        """
+        vprint(
+            f"{prefix} CODER: {len(sel['ids'])} of {len(index.blocks)} region(s) "
+            f"({sum(len(index.blocks[i]['text']) for i in sel['ids'])}/"
+            f"{len(index.code)} chars)"
+        )
+        messages = [
+            {"role": "system", "content": SYSTEM_CODER + REGION_INSTRUCTIONS},
+            {"role": "user", "content": user_msg},
+        ]
+        _profile_prompt(
+            "coder",
+            "CODER_REGIONS",
+            iter_no,
+            messages,
+            requirements=req_text,
+            task_list=tasks_str,
+            outline=outline,
+            code=regions,
+        )
+        text, out, calls = invoke_file(
+            router.llm("coder"),
+            messages,
+            "CODER_REGIONS",
+            iter_no,
+            max_continuations=args.max_continuations,
         )
+        book_calls("coder", calls)
+        record.update(
+            given=[f"{i}: {index.blocks[i]['name']}" for i in sel["ids"]],
+            scores=sel["scores"],
+        )
+        merged, error = None, ""
+        if out is None:
+            error = "reply incomplete"
+        else:
+            try:
+                merged, new_index, edited = index.splice(sel["ids"], out)
+                code_index["index"] = new_index
+                record["edited"] = edited
+            except ValueError as e:
+                error = str(e)
+        record["fallback_reason"] = error
+        writer.write(
+            f"coder_regions_iter{iter_no}.json",
+            json.dumps(record, ensure_ascii=False, indent=2),
+        )
+        if error:
+            print(
+                f"[WARN] CODER regions not applied in iter {iter_no} ({error}); sending full file"
+            )
+        return merged
+
+    def _coder_requirements(state: State) -> Tuple[str, str]:
+        """
+        --req-sections: after the first --req-full-iters iterations, send the
+        Coder only the requirement sections relevant to its tasks (full
+        document on low-confidence matches). Returns (prompt label, text).
+        """
         iter_no = int(state.get("iter", 0))
-        versioned_name = f"code_iter{iter_no}.tsx"
-        pathlib.Path(args.output, versioned_name).write_text(
-            state["code_tsx"], encoding="utf-8"
+        if req_index is None or iter_no <= args.req_full_iters:
+            return "Requirements (for reference)", requirements
+        sel = req_index.select(
+            state["task_list"], args.req_sections, args.req_min_score
+        )
+        vprint(
+            f"[iter {iter_no}] CODER requirements: {sel['reason']} "
+            f"({len(sel['text'])}/{len(requirements)} chars)"
+        )
+        writer.write(
+            f"coder_requirements_iter{iter_no}.json",
+            json.dumps(
+                {k: v for k, v in sel.items() if k != "text"},
+                ensure_ascii=False,
+                indent=2,
+            ),
+        )
+        if sel["full"]:
+            return "Requirements (for reference)", requirements
+        return (
+            "Requirements (sections relevant to these tasks; the rest is unchanged)",
+            sel["text"],
+        )
+
+    def _sharded_code(state: State, iter_no: int, prefix: str, req_text: str):
+        """
+        --coder-shards: one Coder call per group of tasks touching the same
+        app.ts regions, run concurrently and spliced back together. Returns the
+        merged file, or None to fall back to the serial Coder.
+        """
+        regions = split_regions(state["code_tsx"])
+        shards = plan_shards(state["task_list"], regions, args.coder_shards)
+        record = {"iter": iter_no, "regions": [r["title"] for r in regions]}
+        if not shards:
+            vprint(f"{prefix} CODER: tasks not shardable; running serially")
+            return None
+        vprint(f"{prefix} CODER: {len(shards)} shard(s) in parallel")
+
+        def _run(n: int, shard):
+            messages = [
+                {"role": "system", "content": SYSTEM_CODER + SHARD_INSTRUCTIONS},
+                {"role": "user", "content": shard_message(shard, regions, req_text)},
+            ]
+            _profile_prompt(
+                "coder",
+                f"CODER_SHARD{n}",
+                iter_no,
+                messages,
+                requirements=req_text,
+                task_list="\n".join(f"- {t}" for t in shard["tasks"]),
+                code="".join(regions[i]["text"] for i in shard["regions"]),
+            )
+            return invoke_file(
+                router.llm("coder"),
+                messages,
+                f"CODER_SHARD{n}",
+                iter_no,
+                max_continuations=args.max_continuations,
+            )
+
+        # Each worker runs in a copy of this run's context (args, token counters)
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, _run, n, shard)
+                for n, shard in enumerate(shards)
+            ]
+        results, error = [], ""
+        for f in futures:
+            try:
+                results.append(f.result())
+            except Exception as e:
+                error = f"shard call failed: {e}"
+        # Booked here, per call, under the model that served each shard
+        for _text, _code, calls in results:
+            book_calls("coder", calls)
+
+        merged = None
+        if not error and any(code is None for _t, code, _u in results):
+            error = "shard output incomplete"
+        if not error:
+            try:
+                merged = merge_shards(regions, shards, [c for _t, c, _u in results])
+            except ShardConflict as e:
+                error = f"merge conflict: {e}"
+        record["shards"] = [
+            {"regions": s["regions"], "tasks": s["tasks"]} for s in shards
+        ]
+        record["merged"] = merged is not None
+        record["fallback_reason"] = error
+        writer.write(
+            f"coder_shards_iter{iter_no}.json",
+            json.dumps(record, ensure_ascii=False, indent=2),
         )
+        if error:
+            print(
+                f"[WARN] CODER shards not merged in iter {iter_no} ({error}); running serially"
+            )
+        return merged
+
+    # Last evaluated artifact and verdict, for incremental (diff-only) evaluation
+    last_eval = {"code": None, "md": "", "failing_items": [], "full_iter": 0}
+
+    def _speculate_tasker(iter_no: int) -> Callable[[str], None]:
+        """
+        on_text callback for the streamed Evaluator (--pipeline): once every
+        section before DECISION is complete, start the next iteration's Tasker
+        call with the prompt it will get after a FAIL; cancel it on PASS.
+        """
+        started = {"done": False}
+
+        def on_text(text: str) -> None:
+            if started["done"]:
+                if speculation.pending and decided_pass(text):
+                    speculation.cancel("decision PASS")
+                return
+            if args.structured:
+                verdict = partial_verdict(text)
+                if verdict is None:
+                    return
+                feedback = _tasker_feedback(render_verdict_md(verdict))
+                tasks = verdict["new_tasks"]
+            else:
+                feedback = before_decision(text)
+                if feedback is None:
+                    return
+                tasks = _parse_list_section(feedback, "NEW_TASKS")
+            started["done"] = True
+            if not tasks:
+                return  # most likely a PASS; nothing to plan
+            user_msg = tasker_user_message(requirements, feedback, tasks)
+            vprint(f"[iter {iter_no}] TASKER: starting next call from partial verdict")
+            speculation.start(
+                "tasker",
+                _tasker_key(user_msg),
+                # A failed speculative call falls back to a live one: no CRASH_* marker
+                lambda cancel: _tasker_call(
+                    user_msg, iter_no + 1, cancel, crash_marker=False
+                ),
+                _tasker_messages(user_msg),
+                router.model("tasker"),
+            )
+
+        return on_text
+
+    def _evaluate(user_msg: str, iter_no: int, prefix: str, sections: Dict[str, str]):
+        messages = [
+            {"role": "system", "content": SYSTEM_EVAL},
+            {"role": "user", "content": user_msg},
+        ]
+        on_text = None
+        if speculation and iter_no < MAX_ITERS:
+            on_text = _speculate_tasker(iter_no)
+        verdict = None
+        if args.structured:
+            messages[0]["content"] = SYSTEM_EVAL + EVALUATOR_JSON_INSTRUCTIONS
+        _profile_prompt("evaluator", "EVALUATOR", iter_no, messages, **sections)
+        if args.structured:
+            # --pipeline parses the JSON from streamed text (native output is not streamed)
+            verdict, text, calls = invoke_structured(
+                router.llm("evaluator"),
+                messages,
+                EVALUATOR_SCHEMA,
+                validate_verdict,
+                "EVALUATOR",
+                iter_no,
+                native=speculation is None,
+                on_text=on_text,
+            )
+        elif on_text:
+            resp = stream_invoke(
+                router.llm("evaluator"), messages, "EVALUATOR", iter_no, on_text
+            )
+            calls = [call_usage(resp)]
+            text = normalize_content(resp.content)
+        else:
+            resp = safe_invoke(router.llm("evaluator"), messages, "EVALUATOR", iter_no)
+            calls = [call_usage(resp)]
+            text = normalize_content(resp.content)
+        it, ot, cit = book_calls("evaluator", calls)
         if args.verbose:
             vprint(
-                f"{prefix} CODER: wrote app.ts and code_iter{iter_no}.tsx (chars={len(state['code_tsx'])})"
+                f"{prefix} EVALUATOR tokens: input={it}, cached_input={cit}, output={ot}"
             )
-        return state
+        # Structured verdicts are rendered to the usual Markdown report; if the
+        # structured reply could not be parsed, fall back to Markdown scraping.
+        if verdict is not None:
+            text = render_verdict_md(verdict)
+        return verdict, text
+
+    def _incremental_msg(state: State, iter_no: int):
+        """
+        Diff-only evaluation prompt and its sections, or None when a full
+        evaluation is due.
+        """
+        if not args.eval_incremental or last_eval["code"] is None:
+            return None
+        if iter_no - last_eval["full_iter"] >= args.eval_full_every:
+            return None
+        diff = code_diff(last_eval["code"], state["code_tsx"])
+        # Large rewrites are cheaper to review in full than as a diff
+        if not diff or len(diff) > len(state["code_tsx"]) // 2:
+            return None
+        failing = "\n".join(f"- {x}" for x in last_eval["failing_items"]) or "(none)"
+        sections = {
+            "requirements": requirements,
+            "evaluator_feedback": last_eval["md"],
+            "failing_items": failing,
+            "code": diff,
+        }
+        msg = f"""Incremental evaluation of the current artifact.
+        Requirements:
+        {requirements}
+
+        Previous verdict:
+        {last_eval['md']}
+
+        Previous FAILING_ITEMS:
+        {failing}
+
+        Changes to app.ts since the previous verdict (unified diff):
+        {diff}
+
+        Judge only (1) whether each previous FAILING_ITEM is now fixed and
+        (2) whether the diff introduces regressions against the Requirements.
+        Everything outside the diff is unchanged from the previous verdict.
+        """
+        return msg, sections
 
     def evaluator_node(state: State) -> State:
-        user_msg = f"""Evaluate the current artifact.
+        full_msg = f"""Evaluate the current artifact.
         Requirements:
         {requirements}
 
@@ -246,34 +819,39 @@ def run_multi(args) -> None:
         """
         state["step"] = int(state.get("step", 0)) + 1
         prefix = f"[iter {state.get('iter','?')} | step {state.get('step','?')}]"
-        vprint(f"{prefix} EVALUATOR: invoking")
-        resp = safe_invoke(
-            llm_eval,
-            [
-                {"role": "system", "content": SYSTEM_EVAL},
-                {"role": "user", "content": user_msg},
-            ],
-            "EVALUATOR",
-            int(state.get("iter", 0)),
+        iter_no = int(state.get("iter", 0))
+        full_sections = {"requirements": requirements, "code": state["code_tsx"]}
+        inc_msg, inc_sections = _incremental_msg(state, iter_no) or (None, None)
+        state["eval_mode"] = "incremental" if inc_msg else "full"
+        vprint(f"{prefix} EVALUATOR: invoking ({state['eval_mode']})")
+        verdict, text = _evaluate(
+            inc_msg or full_msg, iter_no, prefix, inc_sections or full_sections
         )
-        it, ot, cit = extract_usage(resp)
-        add_usage("evaluator", it, ot, cit)
-        if args.verbose:
-            vprint(
-                f"{prefix} EVALUATOR tokens: input={it}, cached_input={cit}, output={ot}"
-            )
-
-        text = normalize_content(resp.content)
+        decision = verdict["decision"] if verdict else _parse_decision(text)
+        if inc_msg and decision == "PASS":
+            # Never accept PASS from a diff-only review; confirm with a full one.
+            vprint(f"{prefix} EVALUATOR: incremental PASS, confirming with full review")
+            state["eval_mode"] = "incremental+full"
+            verdict, text = _evaluate(full_msg, iter_no, prefix, full_sections)
+            inc_msg = None
         state["evaluator_md"] = text
 
-        pathlib.Path(args.output, "evaluator_report.md").write_text(
-            text, encoding="utf-8"
+        last_eval["code"] = state["code_tsx"]
+        last_eval["md"] = text
+        last_eval["failing_items"] = (
+            verdict["failing_items"]
+            if verdict
+            else _parse_list_section(text, "FAILING_ITEMS")
         )
-        iter_no = int(state.get("iter", 0))
-        versioned_name = f"evaluator_report_iter{iter_no}.md"
-        pathlib.Path(args.output, versioned_name).write_text(text, encoding="utf-8")
+        if not inc_msg:
+            last_eval["full_iter"] = iter_no
 
-        decision = _parse_decision(text)
+        writer.write_versioned(
+            "evaluator_report.md", f"evaluator_report_iter{iter_no}.md", text
+        )
+
+        decision = verdict["decision"] if verdict else _parse_decision(text)
+        _log_routing(router.note_verdict(decision, last_eval["failing_items"], iter_no))
 
         if args.verbose:
             preview_tasks = state.get("task_list", [])[:3]
@@ -284,31 +862,16 @@ def run_multi(args) -> None:
         if decision == "PASS":
             state["done"] = True
             state["task_list"] = []
+            if speculation:
+                speculation.cancel("decision PASS")
         else:
             # Evaluator is authoritative: FAIL means we are not done.
             state["done"] = False
-
-            # Parse NEW_TASKS and filter out sentinel non-tasks.
-            def _is_sentinel_task(s: str) -> bool:
-                return s.strip().lower() in {"none", "none.", "n/a", "no tasks", ""}
-
-            tasks = []
-            capture = False
-            for ln in text.splitlines():
-                if ln.strip().upper().startswith("NEW_TASKS"):
-                    capture = True
-                    continue
-                if capture:
-                    if ln.strip().startswith(("-", "1.", "2.", "3.")):
-                        clean = (
-                            ln.lstrip("- ").split(".", 1)[-1].strip()
-                            if ln.strip()[0].isdigit()
-                            else ln.lstrip("- ").strip()
-                        )
-                        if not _is_sentinel_task(clean):
-                            tasks.append(clean)
-                    elif ln.strip() == "":
-                        break
+            tasks = (
+                verdict["new_tasks"]
+                if verdict
+                else _parse_list_section(text, "NEW_TASKS")
+            )
             # Use evaluator-provided tasks directly (no retention of stale tasks).
             state["task_list"] = tasks
             if args.verbose:
@@ -317,28 +880,40 @@ def run_multi(args) -> None:
                 )
         return state
 
-    # GRAPH
-    g = StateGraph(State)
-    g.add_node("tasker", tasker_node)
-    g.add_node("coder", coder_node)
-    g.add_node("evaluator", evaluator_node)
+    # Per-role wall-clock of the current iteration (feeds log.jsonl and the scheduler)
+    role_seconds: Dict[str, float] = {}
 
-    # Always proceed Tasker -> Coder; Evaluator alone can set done=True (PASS)
-    g.add_edge("tasker", "coder")
-    g.add_edge("coder", "evaluator")
+    def _timed(role: str, fn):
+        def wrapper(state: State) -> State:
+            t = time.perf_counter()
+            try:
+                return fn(state)
+            finally:
+                role_seconds[role] = role_seconds.get(role, 0.0) + (
+                    time.perf_counter() - t
+                )
 
-    def _next_after_evaluator(state: State) -> str:
-        return "end"
+        return wrapper
 
-    g.add_conditional_edges(
-        "evaluator",
-        _next_after_evaluator,
-        {
-            "end": END,
-        },
+    tasker_node = _timed("tasker", tasker_node)
+    coder_node = _timed("coder", coder_node)
+    evaluator_node = _timed("evaluator", evaluator_node)
+
+    # Optional per-node profiling (--profile); wraps _timed so the profiler's
+    # own overhead stays out of role_seconds (and the budget scheduler)
+    profiler = NodeProfiler(args.output) if args.profile else None
+    finalize = finalize_summary
+    if profiler:
+        tasker_node = profiler.wrap("tasker_node", tasker_node)
+        coder_node = profiler.wrap("coder_node", coder_node)
+        evaluator_node = profiler.wrap("evaluator_node", evaluator_node)
+        finalize = profiler.wrap("finalize_summary", finalize_summary)
+
+    # GRAPH: shared compiled graph, dispatching to this run's nodes
+    _NODES.set(
+        {"tasker": tasker_node, "coder": coder_node, "evaluator": evaluator_node}
     )
-    g.set_entry_point("tasker")
-    app = g.compile()
+    app = _compiled_graph()
 
     # PASS/FAIL parsing helpers
     def _parse_decision(md: str) -> str:
@@ -361,12 +936,39 @@ def run_multi(args) -> None:
                 break
         return "FAIL"
 
+    def _parse_list_section(md: str, section: str) -> List[str]:
+        # Parse a list section (NEW_TASKS, FAILING_ITEMS) and filter out sentinel non-tasks.
+        tasks = []
+        capture = False
+        for ln in md.splitlines():
+            if ln.strip().upper().startswith(section):
+                capture = True
+                continue
+            if capture:
+                if ln.strip().startswith(("-", "1.", "2.", "3.")):
+                    clean = (
+                        ln.lstrip("- ").split(".", 1)[-1].strip()
+                        if ln.strip()[0].isdigit()
+                        else ln.lstrip("- ").strip()
+                    )
+                    if not is_sentinel_task(clean):
+                        tasks.append(clean)
+                elif ln.strip() == "":
+                    break
+        return tasks
+
     def _pass_from_md(md: str) -> bool:
         return _parse_decision(md) == "PASS"
 
+    # Optional deadline / cost budget (--deadline / --budget-usd)
+    scheduler = BudgetScheduler(
+        args.deadline, args.budget_usd, None if pricing_missing else pricing
+    )
+    if args.budget_usd is not None and pricing_missing:
+        print("[WARN] --budget-usd ignored: " + pricing_missing)
+    exhausted = None
+
     # RUN LOOP
-    logf = open(os.path.join(args.output, "log.jsonl"), "a", encoding="utf-8")
-    statef = open(os.path.join(args.output, "state.jsonl"), "a", encoding="utf-8")
     prev_totals = {"input": 0, "output": 0}
 
     print(
@@ -374,9 +976,49 @@ def run_multi(args) -> None:
     )
     for i in range(MAX_ITERS):
         vprint(f"==== Iteration {i+1}/{MAX_ITERS} ====")
+        if scheduler.enabled:
+            spent = 0.0 if pricing_missing else sum(router.role_costs(pricing).values())
+            decision = scheduler.decide(
+                time.time() - run_t0, spent, can_reduce=bool(state["task_list"])
+            )
+            vprint(
+                f"[iter {i+1}] SCHEDULER: {decision['action']} — {decision['reason']}; "
+                f"predicted={decision['predicted']} remaining={decision['remaining']}"
+            )
+            if decision["action"] == "stop":
+                exhausted = decision
+                print(f"Stopping before iter {i+1}: {decision['reason']}")
+                writer.write(
+                    "BUDGET_EXHAUSTED",
+                    json.dumps({"before_iter": i + 1, **decision}, indent=2) + "\n",
+                )
+                break
+            state["plan"] = "reduced" if decision["action"] == "reduced" else "full"
         t0 = time.time()
+        role_seconds.clear()
+        iter_models = router.models()
         state["iter"] = i + 1
-        state_local = cast(State, app.invoke(state))  # safe cast
+        if registry:
+            registry.set_iter(run_id, i + 1)
+        try:
+            state_local = cast(State, app.invoke(state))  # safe cast
+        except Exception:
+            try:
+                if speculation:
+                    speculation.close()
+                if profiler:
+                    profiler.close()
+            finally:
+                # Always drain artifacts and release the registry connection
+                try:
+                    writer.close()
+                finally:
+                    if registry:
+                        try:
+                            registry.finish_run(run_id, "crash", args.output)
+                        finally:
+                            registry.close()
+            raise
         state.update(state_local)
         # Belt-and-suspenders: if evaluator reports PASS, force done=True
         try:
@@ -385,9 +1027,7 @@ def run_multi(args) -> None:
                 # Write a marker file once for auditability
                 marker = os.path.join(args.output, "PASS_MARKER")
                 if not os.path.exists(marker):
-                    pathlib.Path(marker).write_text(
-                        "evaluator decision PASS\n", encoding="utf-8"
-                    )
+                    writer.write("PASS_MARKER", "evaluator decision PASS\n")
         except Exception:
             # Non-fatal; keep running with evaluator-set state
             pass
@@ -406,36 +1046,82 @@ def run_multi(args) -> None:
             f"tokens(in={delta_in}, out={delta_out})"
         )
 
-        logf.write(
-            json.dumps(
-                {
-                    "iter": i + 1,
-                    "mode": "multi",
-                    "done": state["done"],
-                    "task_list": state["task_list"],
-                    "duration_s": dur,
-                    "tokens_iter": {"input": delta_in, "output": delta_out},
-                    "tokens_cumulative": {
-                        "input": TOK["total"]["input"],
-                        "output": TOK["total"]["output"],
-                    },
-                    "tokens_by_agent": TOK,  # snapshot
-                },
-                ensure_ascii=False,
-            )
-            + "\n"
+        log_entry = {
+            "iter": i + 1,
+            "mode": "multi",
+            "done": state["done"],
+            "task_list": state["task_list"],
+            "duration_s": dur,
+            "eval_mode": state.get("eval_mode", "full"),
+            "plan": state.get("plan", "full"),
+            "role_seconds": {k: round(v, 3) for k, v in role_seconds.items()},
+            "models": iter_models,
+            "tokens_iter": {"input": delta_in, "output": delta_out},
+            "tokens_cumulative": {
+                "input": TOK["total"]["input"],
+                "output": TOK["total"]["output"],
+            },
+            "tokens_by_agent": {k: dict(v) for k, v in TOK.items()},  # snapshot
+        }
+        if speculation:
+            log_entry["pipeline"] = speculation.drain_events()
+        if prompt_profile:
+            log_entry["prompt_sections"] = prompt_profile.drain()
+        if router.hedges:
+            log_entry["hedging"] = router.hedges.drain()
+        scheduler.observe(
+            log_entry, None if pricing_missing else router.role_costs(pricing)
         )
-        logf.flush()
-
-        statef.write(json.dumps(state, ensure_ascii=False) + "\n")
-        statef.flush()
+        writer.append("log.jsonl", json.dumps(log_entry, ensure_ascii=False))
+        writer.append("state.jsonl", json.dumps(state, ensure_ascii=False))
+        if registry:
+            registry.record_iteration(run_id, log_entry)
+        if on_event:
+            on_event({"type": "iteration", **log_entry})
 
         print(f"Iter {i+1} done. done={state['done']}, tasks={len(state['task_list'])}")
         if state["done"]:
             break
 
-    logf.close()
-    statef.close()
+    if speculation:
+        speculation.close()
+    # Drain pending artifact writes before the summary
+    writer.close()
 
     # Final summary
-    finalize_summary(args.output, pricing, pricing_missing, args.verbose)
+    extra: Dict[str, Any] = {}
+    if router.enabled or router.hedges:
+        extra.update(router.summary(None if pricing_missing else pricing))
+    if speculation:
+        extra["pipeline"] = speculation.summary()
+    if prompt_profile:
+        extra["prompt_sections"] = prompt_profile.summary()
+    if router.hedges:
+        extra["hedging"] = router.hedges.summary(None if pricing_missing else pricing)
+    summary = finalize(
+        args.output,
+        pricing,
+        pricing_missing,
+        args.verbose,
+        extra=extra or None,
+        role_costs=None if pricing_missing else router.role_costs(pricing),
+    )
+    if profiler:
+        profiler.write_summary()
+        profiler.close()
+    status = "pass" if state["done"] else "fail"
+    if exhausted:
+        status = "budget_exhausted"
+    if registry:
+        registry.finish_run(run_id, status, args.output, summary)
+        registry.close()
+    if on_event:
+        on_event(
+            {
+                "type": "finished",
+                "status": status,
+                "iterations": state["iter"],
+                "summary": summary,
+            }
+        )
+    return summary
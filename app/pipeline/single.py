@@ -2,29 +2,80 @@ import json
 import time
 import os
 import pathlib
+from typing import Iterator, List
 
 from app.constants import INIT_CODE
-from app.utils.io import vprint, safe_invoke, normalize_content, set_args
-from app.utils.tokens import TOK, add_usage, extract_usage
+from app.utils.io import vprint, set_args
+from app.utils.tokens import book_calls, usage_scope
+from app.utils.continuation import invoke_file
+from app.utils.artifacts import ArtifactWriter
+from app.registry import open_registry
 from app.utils.pricing import load_pricing
 from app.utils.summary import finalize_summary
 from provider import make_llm
 
 
-def run_single(args) -> None:
+def load_script(path: str) -> List[str]:
+    """
+    Turns for a scripted (--script) session, in order. Either a JSON list whose
+    items are strings or {"instruction": ...} / {"command": "accept"|"cancel"|...}
+    objects, or plain text with one turn per line (blank lines and '#' comments
+    are skipped).
+    """
+    text = pathlib.Path(path).read_text(encoding="utf-8")
+    if path.endswith(".json"):
+        turns = []
+        for item in json.loads(text):
+            if isinstance(item, dict):
+                item = item.get("instruction") or item.get("command") or ""
+            if not isinstance(item, str) or not item.strip():
+                raise ValueError(f"{path}: every turn must be a non-empty string")
+            turns.append(item.strip())
+        return turns
+    return [
+        line.strip()
+        for line in text.splitlines()
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
+
+
+def _interactive_turns() -> Iterator[str]:
+    while True:
+        try:
+            yield input("> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print("\nExiting (no acceptance). Writing summary…")
+            return
+
+
+def _scripted_turns(turns: List[str]) -> Iterator[str]:
+    for cmd in turns:
+        print(f"> {cmd}")
+        yield cmd
+    print("Script ended without accept. Writing summary…")
+
+
+def run_single(args) -> str:
     """
     Single-agent programmer with human-in-the-loop interactive loop.
-    Mirrors behavior from the previous run.py single mode.
+    Mirrors behavior from the previous run.py single mode. With --script the
+    turns are replayed from a file instead of read from stdin.
+    Returns the session outcome: "accepted" or "cancelled".
     """
     # Make io utils aware of args for vprint/safe_invoke
     set_args(args)
+    # Token counters for this run only
+    TOK = usage_scope()
 
     vprint(
         "CONFIG (single):",
         f"programmer_prompt={'(fallback to --coder)' if not args.programmer else args.programmer}",
         f"requirements={args.requirements}",
         f"output={args.output}",
+        f"script={args.script or '(interactive)'}",
     )
+    # Read the script up front so a bad file fails before any LLM call
+    script = load_script(args.script) if args.script else None
 
     # Programmer system prompt: prefer --programmer, else fallback to --coder if provided, else a minimal built-in.
     prog_path = args.programmer or args.coder
@@ -56,9 +107,20 @@ def run_single(args) -> None:
                 f"coder in={pricing['coder']['in']}, cached_in={pricing['coder']['cached_in']}, out={pricing['coder']['out']} (used for single mode)",
             )
 
-    # Initialize log files
-    logf = open(os.path.join(args.output, "log.jsonl"), "a", encoding="utf-8")
-    statef = open(os.path.join(args.output, "state.jsonl"), "a", encoding="utf-8")
+    # Artifacts and logs are written off the critical path by a background thread
+    writer = ArtifactWriter(args.output)
+
+    # Optional SQLite run registry (--registry / RUN_REGISTRY)
+    registry = open_registry(args.registry)
+    if registry:
+        run_id = registry.start_run(
+            args.output,
+            "single",
+            requirements=args.requirements,
+            provider=os.getenv("LLM_PROVIDER", "openai"),
+            models={"programmer": str(getattr(llm_prog, "model_name", "(unknown)"))},
+        )
+        registry.set_iter(run_id, 1)
     prev_totals = {"input": 0, "output": 0}
 
     # Conversation messages
@@ -76,23 +138,24 @@ def run_single(args) -> None:
     iter_no = 1
     code_html = INIT_CODE
 
-    print("Starting single-agent HITL session…")
+    print(
+        "Starting single-agent HITL session…"
+        if script is None
+        else f"Replaying scripted session ({len(script)} turns)…"
+    )
     t0 = time.time()
-    resp = safe_invoke(llm_prog, messages, "PROGRAMMER", iter_no)
-    it, ot, cit = extract_usage(resp)
-    add_usage("coder", it, ot, cit)  # map to coder bucket for pricing
-    text = normalize_content(resp.content)
-
-    start = text.find("<FILE>")
-    end = text.find("</FILE>")
-    code = text[start + 6 : end] if start != -1 and end != -1 else text
-    code_html = code
-
-    # Save artifacts
-    pathlib.Path(args.output, "index.html").write_text(code_html, encoding="utf-8")
-    pathlib.Path(args.output, f"index_iter{iter_no}.html").write_text(
-        code_html, encoding="utf-8"
+    text, code, calls = invoke_file(
+        llm_prog, messages, "PROGRAMMER", iter_no, args.max_continuations
     )
+    it, ot, cit = book_calls("coder", calls)  # map to coder bucket for pricing
+
+    if code is not None:
+        code_html = code
+        # Save artifacts
+        writer.write_versioned("index.html", f"index_iter{iter_no}.html", code_html)
+    else:
+        print("[WARN] PROGRAMMER output incomplete; initial artifact not written")
+        writer.write(f"TRUNCATED_PROGRAMMER_iter{iter_no}.txt", text)
 
     # Log iteration
     dur = round(time.time() - t0, 2)
@@ -101,26 +164,22 @@ def run_single(args) -> None:
     prev_totals["input"] = TOK["total"]["input"]
     prev_totals["output"] = TOK["total"]["output"]
 
-    logf.write(
-        json.dumps(
-            {
-                "iter": iter_no,
-                "mode": "single",
-                "done": False,
-                "task_list": [],  # not used in single mode
-                "duration_s": dur,
-                "tokens_iter": {"input": delta_in, "output": delta_out},
-                "tokens_cumulative": {
-                    "input": TOK["total"]["input"],
-                    "output": TOK["total"]["output"],
-                },
-                "tokens_by_agent": TOK,
-            },
-            ensure_ascii=False,
-        )
-        + "\n"
-    )
-    logf.flush()
+    log_entry = {
+        "iter": iter_no,
+        "mode": "single",
+        "done": False,
+        "task_list": [],  # not used in single mode
+        "duration_s": dur,
+        "tokens_iter": {"input": delta_in, "output": delta_out},
+        "tokens_cumulative": {
+            "input": TOK["total"]["input"],
+            "output": TOK["total"]["output"],
+        },
+        "tokens_by_agent": TOK,
+    }
+    writer.append("log.jsonl", json.dumps(log_entry, ensure_ascii=False))
+    if registry:
+        registry.record_iteration(run_id, log_entry)
 
     # State snapshot
     state_snapshot = {
@@ -131,24 +190,22 @@ def run_single(args) -> None:
         "iter": iter_no,
         "mode": "single",
     }
-    statef.write(json.dumps(state_snapshot, ensure_ascii=False) + "\n")
-    statef.flush()
+    writer.append("state.jsonl", json.dumps(state_snapshot, ensure_ascii=False))
 
     print(f"Initial implementation saved to {args.output}/index.html")
     print(
         "Commands: accept | status | help | cancel; or type instructions to the programmer to iterate."
     )
 
-    # Interactive loop
-    while True:
-        try:
-            cmd = input("> ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\nExiting (no acceptance). Writing summary…")
-            break
-
+    # Interactive (or scripted) loop
+    status = "cancelled"
+    turns = _interactive_turns() if script is None else _scripted_turns(script)
+    for cmd in turns:
+        if not cmd:
+            continue
         if cmd.lower() in ("accept", "a"):
             # finalize
+            status = "accepted"
             break
         if cmd.lower() in ("cancel",):
             # Just exit; still write summary
@@ -168,23 +225,20 @@ def run_single(args) -> None:
         # Treat any other input as user instruction
         messages.append({"role": "user", "content": cmd})
         iter_no += 1
+        if registry:
+            registry.set_iter(run_id, iter_no)
 
         t0 = time.time()
-        resp = safe_invoke(llm_prog, messages, "PROGRAMMER", iter_no)
-        it, ot, cit = extract_usage(resp)
-        add_usage("coder", it, ot, cit)
-        text = normalize_content(resp.content)
-
-        if "<FILE>" in text and "</FILE>" in text:
-            start = text.find("<FILE>")
-            end = text.find("</FILE>")
-            new_code = text[start + 6 : end]
-            pathlib.Path(args.output, "index.html").write_text(
-                new_code, encoding="utf-8"
-            )
-            pathlib.Path(args.output, f"index_iter{iter_no}.html").write_text(
-                new_code, encoding="utf-8"
-            )
+        text, new_code, calls = invoke_file(
+            llm_prog, messages, "PROGRAMMER", iter_no, args.max_continuations
+        )
+        it, ot, cit = book_calls("coder", calls)
+
+        if "<FILE>" in text and new_code is None:
+            print("[WARN] PROGRAMMER output incomplete; artifact not updated")
+            writer.write(f"TRUNCATED_PROGRAMMER_iter{iter_no}.txt", text)
+        elif "<FILE>" in text:
+            writer.write_versioned("index.html", f"index_iter{iter_no}.html", new_code)
             code_html = new_code
             print(f"Updated artifact written: index_iter{iter_no}.html")
         else:
@@ -201,26 +255,22 @@ def run_single(args) -> None:
         prev_totals["input"] = TOK["total"]["input"]
         prev_totals["output"] = TOK["total"]["output"]
 
-        logf.write(
-            json.dumps(
-                {
-                    "iter": iter_no,
-                    "mode": "single",
-                    "done": False,
-                    "task_list": [],
-                    "duration_s": dur,
-                    "tokens_iter": {"input": delta_in, "output": delta_out},
-                    "tokens_cumulative": {
-                        "input": TOK["total"]["input"],
-                        "output": TOK["total"]["output"],
-                    },
-                    "tokens_by_agent": TOK,
-                },
-                ensure_ascii=False,
-            )
-            + "\n"
-        )
-        logf.flush()
+        log_entry = {
+            "iter": iter_no,
+            "mode": "single",
+            "done": False,
+            "task_list": [],
+            "duration_s": dur,
+            "tokens_iter": {"input": delta_in, "output": delta_out},
+            "tokens_cumulative": {
+                "input": TOK["total"]["input"],
+                "output": TOK["total"]["output"],
+            },
+            "tokens_by_agent": TOK,
+        }
+        writer.append("log.jsonl", json.dumps(log_entry, ensure_ascii=False))
+        if registry:
+            registry.record_iteration(run_id, log_entry)
 
         state_snapshot = {
             "code_html": code_html,
@@ -230,12 +280,14 @@ def run_single(args) -> None:
             "iter": iter_no,
             "mode": "single",
         }
-        statef.write(json.dumps(state_snapshot, ensure_ascii=False) + "\n")
-        statef.flush()
+        writer.append("state.jsonl", json.dumps(state_snapshot, ensure_ascii=False))
 
-    # Close logs
-    logf.close()
-    statef.close()
+    # Drain pending artifact writes before the summary
+    writer.close()
 
     # Final summary
-    finalize_summary(args.output, pricing, pricing_missing, args.verbose)
+    summary = finalize_summary(args.output, pricing, pricing_missing, args.verbose)
+    if registry:
+        registry.finish_run(run_id, status, args.output, summary)
+        registry.close()
+    return status
@@ -0,0 +1,420 @@
+"""
+SQLite registry of pipeline runs and their artifacts.
+
+run_multi/run_single record runs, iterations and LLM calls as they go when a
+registry path is given (--registry or RUN_REGISTRY). Existing workspace
+directories can be imported, and runs queried, from the command line:
+
+    python -m app.registry import workspace/ --db runs.sqlite
+    python -m app.registry query --db runs.sqlite --status pass --max-iters 3 --max-cost 1.0
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.utils import tokens
+from app.utils.runlog import JsonlIndex, iter_run_dirs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    output_dir TEXT NOT NULL UNIQUE,
+    mode TEXT,
+    requirements TEXT,
+    provider TEXT,
+    models TEXT,
+    status TEXT NOT NULL,
+    iterations INTEGER NOT NULL DEFAULT 0,
+    duration_s REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cached_input_tokens INTEGER,
+    cost_usd REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, iterations, cost_usd);
+CREATE INDEX IF NOT EXISTS idx_runs_cost ON runs(cost_usd);
+
+CREATE TABLE IF NOT EXISTS iterations (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    iter INTEGER NOT NULL,
+    done INTEGER,
+    duration_s REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    task_count INTEGER,
+    eval_mode TEXT,
+    PRIMARY KEY (run_id, iter)
+);
+
+CREATE TABLE IF NOT EXISTS calls (
+    call_id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    iter INTEGER,
+    role TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cached_input_tokens INTEGER,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_calls_run ON calls(run_id, iter, role);
+
+CREATE TABLE IF NOT EXISTS token_usage (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cached_input_tokens INTEGER,
+    cost_usd REAL,
+    PRIMARY KEY (run_id, role)
+);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    kind TEXT,
+    iter INTEGER,
+    size_bytes INTEGER,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_kind ON artifacts(kind);
+"""
+
+ROLES = ("tasker", "coder", "evaluator")
+
+
+def _artifact_kind(name: str) -> str:
+    if name.startswith("CRASH_"):
+        return "crash"
+    if name.startswith("TRUNCATED_"):
+        return "truncated"
+    if name == "PASS_MARKER":
+        return "marker"
+    if name.endswith(".jsonl") or name.endswith(".json"):
+        return "log"
+    if name.endswith((".ts", ".tsx", ".html")):
+        return "code"
+    if name.endswith(".md"):
+        return "report"
+    return "other"
+
+
+def _artifact_iter(name: str) -> Optional[int]:
+    stem = os.path.splitext(name)[0]
+    if "_iter" in stem:
+        tail = stem.rsplit("_iter", 1)[1]
+        if tail.isdigit():
+            return int(tail)
+    return None
+
+
+def _run_status(names: List[str]) -> str:
+    if "PASS_MARKER" in names:
+        return "pass"
+    if any(n.startswith("CRASH_") for n in names):
+        return "crash"
+    return "fail"
+
+
+class Registry:
+    """Thread-safe SQLite run registry (WAL mode, safe for concurrent writer processes)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+        self._active: Dict[int, int] = {}  # run_id -> current iteration
+        self._hooks: Dict[int, Any] = {}  # run_id -> usage hook
+
+    def close(self) -> None:
+        for run_id in list(self._hooks):
+            self._unhook(run_id)
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    # ---- live recording ----
+    def start_run(
+        self,
+        output_dir: str,
+        mode: str,
+        requirements: str = "",
+        provider: str = "",
+        models: Optional[Dict[str, str]] = None,
+    ) -> int:
+        """Register (or restart) a run and record each LLM call made while it is active."""
+        output_dir = os.path.abspath(output_dir)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM runs WHERE output_dir = ?", (output_dir,))
+            cur = self._conn.execute(
+                "INSERT INTO runs (output_dir, mode, requirements, provider, models, status, started_at)"
+                " VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                (
+                    output_dir,
+                    mode,
+                    requirements,
+                    provider,
+                    json.dumps(models or {}),
+                    time.time(),
+                ),
+            )
+        run_id = int(cur.lastrowid)
+        self._active[run_id] = 0
+
+        def _on_usage(
+            agent: str, it: int, ot: int, cit: int, model: Optional[str]
+        ) -> None:
+            self.record_call(run_id, self._active.get(run_id, 0), agent, it, ot, cit)
+
+        self._hooks[run_id] = _on_usage
+        tokens.add_usage_hook(_on_usage)
+        return run_id
+
+    def _unhook(self, run_id: int) -> None:
+        hook = self._hooks.pop(run_id, None)
+        if hook is not None:
+            tokens.remove_usage_hook(hook)
+
+    def set_iter(self, run_id: int, iter_no: int) -> None:
+        self._active[run_id] = iter_no
+
+    def record_call(
+        self, run_id: int, iter_no: int, role: str, it: int, ot: int, cit: int
+    ) -> None:
+        self._execute(
+            "INSERT INTO calls (run_id, iter, role, input_tokens, output_tokens, cached_input_tokens, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, iter_no, role, it, ot, cit, time.time()),
+        )
+
+    def record_iteration(self, run_id: int, entry: Dict[str, Any]) -> None:
+        """Record one log.jsonl entry."""
+        tok = entry.get("tokens_iter", {})
+        self._execute(
+            "INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                entry["iter"],
+                int(bool(entry.get("done"))),
+                entry.get("duration_s"),
+                tok.get("input"),
+                tok.get("output"),
+                len(entry.get("task_list") or []),
+                entry.get("eval_mode"),
+            ),
+        )
+        self._execute(
+            "UPDATE runs SET iterations = MAX(iterations, ?) WHERE run_id = ?",
+            (entry["iter"], run_id),
+        )
+
+    def finish_run(
+        self,
+        run_id: int,
+        status: str,
+        output_dir: str,
+        summary: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Close a run: status, totals from tokens_summary, and the artifact index."""
+        self._active.pop(run_id, None)
+        self._unhook(run_id)
+        self._store_summary(run_id, summary)
+        self._store_artifacts(run_id, output_dir)
+        self._execute(
+            "UPDATE runs SET status = ?, finished_at = ?,"
+            " duration_s = (SELECT SUM(duration_s) FROM iterations WHERE run_id = ?)"
+            " WHERE run_id = ?",
+            (status, time.time(), run_id, run_id),
+        )
+
+    def _store_summary(self, run_id: int, summary: Optional[Dict[str, Any]]) -> None:
+        if not summary:
+            return
+        cost = summary.get("cost_computation", {})
+        details = cost.get("details", {})
+        by_agent = summary.get("by_agent", {})
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE runs SET input_tokens = ?, output_tokens = ?, cached_input_tokens = ?,"
+                " cost_usd = ? WHERE run_id = ?",
+                (
+                    summary.get("total_input_tokens"),
+                    summary.get("total_output_tokens"),
+                    summary.get("total_cached_input_tokens"),
+                    cost.get("total_cost_usd"),
+                    run_id,
+                ),
+            )
+            for role, usage in by_agent.items():
+                if role == "total":
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO token_usage VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        run_id,
+                        role,
+                        usage.get("input"),
+                        usage.get("output"),
+                        usage.get("cached_input"),
+                        details.get(role, {}).get("cost_usd"),
+                    ),
+                )
+
+    def _store_artifacts(self, run_id: int, output_dir: str) -> None:
+        rows = []
+        with os.scandir(output_dir) as it:
+            for e in it:
+                if e.is_file() and not e.name.startswith("."):
+                    rows.append(
+                        (
+                            run_id,
+                            e.name,
+                            _artifact_kind(e.name),
+                            _artifact_iter(e.name),
+                            e.stat().st_size,
+                        )
+                    )
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM artifacts WHERE run_id = ?", (run_id,))
+            self._conn.executemany("INSERT INTO artifacts VALUES (?, ?, ?, ?, ?)", rows)
+
+    # ---- import of existing workspace directories ----
+    def import_run(self, output_dir: str) -> Optional[int]:
+        """Index one run directory from its log.jsonl/tokens_summary.json/markers."""
+        log_path = os.path.join(output_dir, "log.jsonl")
+        if not os.path.isfile(log_path):
+            return None
+        summary = None
+        summary_path = os.path.join(output_dir, "tokens_summary.json")
+        if os.path.isfile(summary_path):
+            with open(summary_path, encoding="utf-8") as f:
+                summary = json.load(f)
+
+        log = JsonlIndex(log_path)
+        mode = log.get(0).get("mode", "multi") if len(log) else "multi"
+        run_id = self.start_run(output_dir, mode)
+        # No live calls happen during an import
+        self._unhook(run_id)
+        prev = {r: {"input": 0, "output": 0, "cached_input": 0} for r in ROLES}
+        for entry in log:
+            self.record_iteration(run_id, entry)
+            # Per-call rows are approximated from per-iteration role deltas
+            for role in ROLES:
+                snap = entry.get("tokens_by_agent", {}).get(role)
+                if not snap:
+                    continue
+                d = {k: snap.get(k, 0) - prev[role][k] for k in prev[role]}
+                if any(d.values()):
+                    self.record_call(
+                        run_id,
+                        entry["iter"],
+                        role,
+                        d["input"],
+                        d["output"],
+                        d["cached_input"],
+                    )
+                prev[role] = {k: snap.get(k, 0) for k in prev[role]}
+        log.close()
+        names = os.listdir(output_dir)
+        self.finish_run(run_id, _run_status(names), output_dir, summary)
+        return run_id
+
+    def import_tree(self, root: str) -> List[int]:
+        """Import every run directory (one containing log.jsonl) below root."""
+        ids = []
+        for dirpath in iter_run_dirs(root):
+            run_id = self.import_run(dirpath)
+            if run_id is not None:
+                ids.append(run_id)
+        return ids
+
+    # ---- queries ----
+    def query_runs(
+        self,
+        status: Optional[str] = None,
+        max_iters: Optional[int] = None,
+        max_cost: Optional[float] = None,
+    ) -> List[sqlite3.Row]:
+        sql = "SELECT * FROM runs WHERE 1=1"
+        params: List[Any] = []
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        if max_iters is not None:
+            sql += " AND iterations <= ?"
+            params.append(max_iters)
+        if max_cost is not None:
+            sql += " AND cost_usd <= ?"
+            params.append(max_cost)
+        with self._lock:
+            return self._conn.execute(sql + " ORDER BY run_id", params).fetchall()
+
+
+def open_registry(path: Optional[str]) -> Optional[Registry]:
+    """Open the registry at path, or return None when no path is configured."""
+    path = path or os.getenv("RUN_REGISTRY", "").strip()
+    if not path:
+        return None
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    return Registry(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run registry over workspace artifacts."
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="Import existing run directories")
+    p_imp.add_argument("root", help="Workspace root to scan for run directories")
+    p_imp.add_argument("--db", required=True, help="SQLite registry path")
+    p_q = sub.add_parser("query", help="List runs matching filters")
+    p_q.add_argument("--db", required=True, help="SQLite registry path")
+    p_q.add_argument(
+        "--status",
+        choices=["pass", "fail", "crash", "running", "accepted", "cancelled"],
+    )
+    p_q.add_argument("--max-iters", type=int)
+    p_q.add_argument("--max-cost", type=float)
+    args = parser.parse_args()
+
+    reg = Registry(args.db)
+    try:
+        if args.cmd == "import":
+            ids = reg.import_tree(args.root)
+            print(f"Imported {len(ids)} run(s) into {args.db}")
+        else:
+            for row in reg.query_runs(args.status, args.max_iters, args.max_cost):
+                print(
+                    json.dumps(
+                        {
+                            "output_dir": row["output_dir"],
+                            "status": row["status"],
+                            "iterations": row["iterations"],
+                            "cost_usd": row["cost_usd"],
+                            "duration_s": row["duration_s"],
+                        }
+                    )
+                )
+    finally:
+        reg.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Long-lived pipeline server.
+
+Keeps one interpreter warm across runs: SDK imports, pooled provider HTTP
+clients, chat model instances, prompt/requirements texts and the compiled
+LangGraph graph are loaded once and reused by every submission. Runs execute in a bounded thread pool; each run has
+its own token counters, args and registry hooks (context-local), so concurrent
+runs do not mix their accounting. A run whose output dir is still used by a
+queued or running run is rejected (409).
+
+    python -m app.server --port 8765 --workers 4
+    python -m app.server --unix-socket /tmp/pipeline.sock
+
+API (JSON):
+    POST /runs                         {"args": [...run.py argv, multi mode...]}
+                                       -> 202 {"id": ..., "status": "queued", ...}
+                                          400 bad args, 409 output dir busy
+    GET  /runs                         list of runs
+    GET  /runs/<id>                    status, timings, last event
+    GET  /runs/<id>/events?after=N     progress as server-sent events until the run ends
+    GET  /runs/<id>/artifacts          artifact file names in the run's output dir
+    GET  /runs/<id>/artifacts/<name>   raw artifact content
+
+Provider selection (LLM_PROVIDER, models, keys) comes from the server's
+environment/.env; per-run argv controls prompts, requirements, output and flags.
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+from app.cli import parse_args, validate_args
+from app.pipeline.multi import run_multi
+
+# Keys of a run record that are returned to clients
+_PUBLIC = (
+    "id",
+    "status",
+    "output_dir",
+    "args",
+    "created_at",
+    "started_at",
+    "finished_at",
+    "error",
+)
+
+
+class OutputDirBusy(ValueError):
+    """Another queued or running run writes to the same output dir."""
+
+
+class PipelineServer:
+    """Run bookkeeping plus the bounded executor shared by the HTTP handlers."""
+
+    def __init__(self, workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="run")
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.runs: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, argv: List[str]) -> Dict[str, Any]:
+        """
+        Validate argv like run.py and queue the run; raises ValueError on bad
+        args and OutputDirBusy if an active run already writes to its output dir.
+        """
+        try:
+            args = parse_args(argv)
+            validate_args(args)
+        except (SystemExit, FileNotFoundError) as e:
+            raise ValueError(f"invalid run arguments: {e}") from None
+        if args.mode != "multi":
+            raise ValueError("server only runs --mode multi")
+
+        run = {
+            "id": uuid.uuid4().hex[:12],
+            "status": "queued",
+            "output_dir": os.path.abspath(args.output),
+            "args": list(argv),
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": "",
+            "events": [],
+        }
+        with self._lock:
+            for other in self.runs.values():
+                if (
+                    other["output_dir"] == run["output_dir"]
+                    and other["finished_at"] is None
+                ):
+                    raise OutputDirBusy(
+                        f"output dir {run['output_dir']} is in use by run {other['id']}"
+                    )
+            self.runs[run["id"]] = run
+        # Fresh context per run: args, token counters and hooks stay isolated
+        ctx = contextvars.Context()
+        self._pool.submit(ctx.run, self._execute, run, args)
+        return self.public(run)
+
+    def _execute(self, run: Dict[str, Any], args) -> None:
+        self._update(run, status="running", started_at=time.time())
+        self._emit(run, {"type": "started"})
+        try:
+            run_multi(args, on_event=lambda ev: self._emit(run, ev))
+            # The "finished" event carries pass | fail | budget_exhausted
+            self._update(run, status=run["events"][-1]["status"])
+        except BaseException as e:
+            tb = traceback.format_exc()
+            if os.path.isdir(args.output):
+                with open(
+                    os.path.join(args.output, "CRASH_SERVER.txt"), "w", encoding="utf-8"
+                ) as f:
+                    f.write(tb)
+            self._update(run, status="crash", error=f"{type(e).__name__}: {e}")
+            self._emit(run, {"type": "crashed", "error": run["error"]})
+        finally:
+            self._update(run, finished_at=time.time())
+            with self._changed:
+                self._changed.notify_all()
+
+    def _update(self, run: Dict[str, Any], **fields: Any) -> None:
+        with self._lock:
+            run.update(fields)
+
+    def _emit(self, run: Dict[str, Any], event: Dict[str, Any]) -> None:
+        with self._changed:
+            run["events"].append(
+                {"seq": len(run["events"]), "ts": time.time(), **event}
+            )
+            self._changed.notify_all()
+
+    def public(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            out = {k: run[k] for k in _PUBLIC}
+            out["events"] = len(run["events"])
+            out["last_event"] = run["events"][-1] if run["events"] else None
+        return out
+
+    def events_after(
+        self, run: Dict[str, Any], after: int, timeout: float
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Events with seq >= after (waiting up to timeout for new ones) and whether the run ended."""
+        with self._changed:
+            if len(run["events"]) <= after and run["finished_at"] is None:
+                self._changed.wait(timeout)
+            return run["events"][after:], run["finished_at"] is not None
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "PipelineServer/1"
+    pipeline: PipelineServer  # set by make_handler
+
+    # ---- helpers ----
+    def _json(self, code: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _run_or_404(self, run_id: str) -> Optional[Dict[str, Any]]:
+        run = self.pipeline.runs.get(run_id)
+        if run is None:
+            self._json(404, {"error": f"unknown run {run_id}"})
+        return run
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port)
+        return self.client_address[0] if self.client_address else "unix"
+
+    # ---- routes ----
+    def do_POST(self) -> None:
+        if urlparse(self.path).path.rstrip("/") != "/runs":
+            return self._json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            argv = body.get("args")
+            if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+                raise ValueError('body must be {"args": [<run.py arguments>]}')
+            run = self.pipeline.submit(argv)
+        except OutputDirBusy as e:
+            return self._json(409, {"error": str(e)})
+        except (ValueError, json.JSONDecodeError) as e:
+            return self._json(400, {"error": str(e)})
+        self._json(202, run)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["runs"]:
+            runs = list(self.pipeline.runs.values())
+            return self._json(200, [self.pipeline.public(r) for r in runs])
+        if len(parts) < 2 or parts[0] != "runs":
+            return self._json(404, {"error": "not found"})
+
+        run = self._run_or_404(parts[1])
+        if run is None:
+            return
+        if len(parts) == 2:
+            return self._json(200, self.pipeline.public(run))
+        if parts[2:] == ["events"]:
+            try:
+                after = int(parse_qs(url.query).get("after", ["0"])[0])
+            except ValueError:
+                return self._json(400, {"error": "after must be an integer"})
+            if after < 0:
+                return self._json(400, {"error": "after must be >= 0"})
+            return self._stream_events(run, after)
+        if parts[2] == "artifacts":
+            return self._artifacts(run, parts[3:])
+        self._json(404, {"error": "not found"})
+
+    def _stream_events(self, run: Dict[str, Any], after: int) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            while True:
+                events, ended = self.pipeline.events_after(run, after, timeout=15)
+                for ev in events:
+                    self.wfile.write(
+                        f"id: {ev['seq']}\ndata: {json.dumps(ev)}\n\n".encode("utf-8")
+                    )
+                after += len(events)
+                if ended and not events:
+                    return
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _artifacts(self, run: Dict[str, Any], rest: List[str]) -> None:
+        root = run["output_dir"]
+        if not rest:
+            names = (
+                sorted(
+                    n
+                    for n in os.listdir(root)
+                    if not n.startswith(".") and os.path.isfile(os.path.join(root, n))
+                )
+                if os.path.isdir(root)
+                else []
+            )
+            return self._json(200, names)
+        path = os.path.realpath(os.path.join(root, *rest))
+        if not path.startswith(os.path.realpath(root) + os.sep) or not os.path.isfile(
+            path
+        ):
+            return self._json(404, {"error": "no such artifact"})
+        with open(path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        ctype = (
+            "application/json" if path.endswith((".json", ".jsonl")) else "text/plain"
+        )
+        self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_handler(pipeline: PipelineServer):
+    return type("PipelineHandler", (_Handler,), {"pipeline": pipeline})
+
+
+class _ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    workers: int = 2,
+    unix_socket: Optional[str] = None,
+) -> None:
+    pipeline = PipelineServer(workers)
+    handler = make_handler(pipeline)
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = _ThreadingUnixHTTPServer(unix_socket, handler)
+        where = f"unix:{unix_socket}"
+    else:
+        httpd = ThreadingHTTPServer((host, port), handler)
+        where = f"http://{host}:{httpd.server_address[1]}"
+    print(f"Pipeline server on {where} (workers={workers})", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        pipeline.shutdown()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Serve multi-agent runs from one warm process."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent runs")
+    parser.add_argument(
+        "--unix-socket", default=None, help="Listen on a Unix socket instead of TCP"
+    )
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
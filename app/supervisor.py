@@ -0,0 +1,213 @@
+"""
+Process-isolated execution of many multi-agent runs on one host.
+
+Each run executes run_multi in its own child process (at most --workers at a
+time). The parent enforces a per-run wall-clock deadline and RSS limit, kills
+runs that exceed them, captures crashes into the run directory and returns a
+structured outcome per run (also written to <output>/supervisor_outcome.json).
+
+    python -m app.supervisor jobs.json --workers 4 --timeout 3600 --max-rss-mb 2048
+
+jobs.json is a list of run.py argument lists (multi mode, or single mode with
+--script), e.g.
+    [["--tasker", "prompts/prompt_tasker.txt", "--coder", "...", "--eval", "...",
+      "--requirements", "...", "--output", "workspace/x/run1"],
+     ["--mode", "single", "--script", "scripts/s1.txt", "--requirements", "...",
+      "--output", "workspace/x/single1"], ...]
+A scripted single-mode run counts as "pass" when the script accepts.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional, TypedDict
+
+
+class RunOutcome(TypedDict):
+    output_dir: str
+    status: str  # pass | fail | budget_exhausted | crash | timeout | rss_limit
+    exitcode: Optional[int]
+    duration_s: float
+    peak_rss_mb: Optional[float]
+    error: str
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process in MB (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/statm", encoding="ascii") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _child(argv: List[str], conn) -> None:
+    """Child entry point: run one multi-agent run and report how it ended."""
+    from app.cli import parse_args, validate_args
+    from app.pipeline.multi import run_multi
+    from app.pipeline.single import run_single
+
+    result: Dict[str, Any] = {"status": "crash", "error": ""}
+    args = None
+    try:
+        args = parse_args(argv)
+        validate_args(args)
+        if args.mode == "multi":
+            # Status as reported by this run (never by marker files an earlier
+            # run may have left in the output dir)
+            finished: Dict[str, Any] = {}
+
+            def _on_event(ev: Dict[str, Any]) -> None:
+                if ev["type"] == "finished":
+                    finished.update(ev)
+
+            run_multi(args, on_event=_on_event)
+            status = finished["status"]
+        elif args.script:
+            status = "pass" if run_single(args) == "accepted" else "fail"
+        else:
+            raise SystemExit("supervisor runs --mode multi or scripted --mode single")
+        result = {"status": status, "error": ""}
+    except BaseException as e:
+        tb = traceback.format_exc()
+        result = {"status": "crash", "error": f"{type(e).__name__}: {e}"}
+        if args is not None and getattr(args, "output", None):
+            with open(
+                os.path.join(args.output, "CRASH_SUPERVISOR.txt"), "w", encoding="utf-8"
+            ) as f:
+                f.write(tb)
+    finally:
+        conn.send(result)
+        conn.close()
+
+
+def _output_of(argv: List[str]) -> str:
+    return argv[argv.index("--output") + 1] if "--output" in argv else ""
+
+
+def _finish(output_dir: str, outcome: RunOutcome) -> RunOutcome:
+    if output_dir and os.path.isdir(output_dir):
+        with open(
+            os.path.join(output_dir, "supervisor_outcome.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(outcome, f, indent=2)
+    return outcome
+
+
+def supervise(
+    jobs: List[List[str]],
+    workers: int = 2,
+    timeout_s: Optional[float] = None,
+    max_rss_mb: Optional[float] = None,
+    poll_s: float = 0.5,
+) -> List[RunOutcome]:
+    """Run every job (a run.py argv list) in its own process; return outcomes in job order."""
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    ctx = mp.get_context("spawn")  # fresh interpreter state (token counters) per run
+    pending = deque(enumerate(jobs))
+    running: Dict[int, Dict[str, Any]] = {}
+    outcomes: Dict[int, RunOutcome] = {}
+
+    while pending or running:
+        while pending and len(running) < workers:
+            idx, argv = pending.popleft()
+            parent_conn, child_conn = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_child, args=(argv, child_conn), daemon=True)
+            proc.start()
+            child_conn.close()
+            running[idx] = {
+                "proc": proc,
+                "conn": parent_conn,
+                "start": time.time(),
+                "peak": None,
+                "output": _output_of(argv),
+            }
+
+        time.sleep(poll_s)
+        for idx, r in list(running.items()):
+            proc = r["proc"]
+            elapsed = time.time() - r["start"]
+            rss = _rss_mb(proc.pid) if proc.is_alive() else None
+            if rss is not None:
+                r["peak"] = max(r["peak"] or 0.0, rss)
+
+            killed = ""
+            if proc.is_alive() and timeout_s and elapsed > timeout_s:
+                killed = "timeout"
+            elif proc.is_alive() and max_rss_mb and rss and rss > max_rss_mb:
+                killed = "rss_limit"
+            if killed:
+                proc.kill()
+                proc.join()
+                msg = (
+                    f"exceeded wall-clock deadline of {timeout_s}s"
+                    if killed == "timeout"
+                    else f"exceeded RSS limit of {max_rss_mb} MB (rss={rss:.0f} MB)"
+                )
+                if r["output"] and os.path.isdir(r["output"]):
+                    path = os.path.join(r["output"], f"CRASH_SUPERVISOR_{killed}.txt")
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(msg + "\n")
+                status, error = killed, msg
+            elif not proc.is_alive():
+                proc.join()
+                result = r["conn"].recv() if r["conn"].poll() else None
+                if result is None:
+                    status = "crash"
+                    error = f"child exited with code {proc.exitcode} without reporting"
+                else:
+                    status, error = result["status"], result["error"]
+            else:
+                continue
+
+            r["conn"].close()
+            outcomes[idx] = _finish(
+                r["output"],
+                {
+                    "output_dir": r["output"],
+                    "status": status,
+                    "exitcode": proc.exitcode,
+                    "duration_s": round(elapsed, 2),
+                    "peak_rss_mb": round(r["peak"], 1) if r["peak"] else None,
+                    "error": error,
+                },
+            )
+            del running[idx]
+
+    return [outcomes[i] for i in range(len(jobs))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run many multi-agent runs in isolated child processes."
+    )
+    parser.add_argument("jobs", help="JSON file: list of run.py argument lists")
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent runs")
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="Per-run wall-clock limit (s)"
+    )
+    parser.add_argument(
+        "--max-rss-mb", type=float, default=None, help="Per-run RSS limit (MB)"
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error("--timeout must be > 0")
+    if args.max_rss_mb is not None and args.max_rss_mb <= 0:
+        parser.error("--max-rss-mb must be > 0")
+
+    with open(args.jobs, encoding="utf-8") as f:
+        jobs = json.load(f)
+    for outcome in supervise(jobs, args.workers, args.timeout, args.max_rss_mb):
+        print(json.dumps(outcome))
+
+
+if __name__ == "__main__":
+    main()
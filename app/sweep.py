@@ -0,0 +1,616 @@
+"""
+Queue-backed sweep execution.
+
+A coordinator expands a sweep spec into jobs (requirements x provider/model x rep)
+in a SQLite queue; any number of workers claim jobs under a lease, heartbeat
+while running, and mark them done or failed. A job whose worker dies is
+re-claimed when its lease expires; finished jobs are never re-run, and
+re-enqueueing a spec only adds new jobs.
+
+Workers on the coordinator's host may open the database directly (--db).
+Workers on other hosts go through `serve`, a small HTTP lease server in front
+of the same jobs table (--queue http://host:port): SQLite in WAL mode is not
+safe on a network filesystem, so the database file itself is never shared.
+
+    python -m app.sweep enqueue sweep.json --db sweep.sqlite
+    python -m app.sweep serve --db sweep.sqlite --host 0.0.0.0 --port 8766
+    python -m app.sweep worker --db sweep.sqlite              # same host
+    python -m app.sweep worker --queue http://coordinator:8766  # any host
+    python -m app.sweep status --db sweep.sqlite
+
+Spec format (JSON):
+    {
+      "requirements": ["requirements/password_recovery_health/....md", ...],
+      "prompts": {"tasker": "...", "coder": "...", "eval": "..."},
+      "models": [{"provider": "openrouter", "model": "openai/gpt-5"}, ...],
+      "reps": 3,
+      "output_root": "workspace/sweeps/example",
+      "max_iters": 12,
+      "extra_args": ["--eval-incremental"]
+    }
+
+Each job runs `run.py --mode multi` in its own process, writing artifacts to
+<output_root>/<requirements stem>/<provider>_<model>/rep<N>/ on the worker's
+host (point output_root at shared storage, or collect the directories, when
+workers run on several hosts). A retry clears the previous attempt's artifacts
+first; worker.log (every attempt's output) and a batch Tasker seed are kept.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROLES = ("tasker", "coder", "evaluator", "programmer")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    job_key TEXT NOT NULL UNIQUE,
+    spec TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker TEXT,
+    lease_until REAL,
+    heartbeat_at REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, lease_until);
+"""
+
+
+def connect(db: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db, timeout=60, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=60000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", s).strip("-")
+
+
+def expand_spec(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Expand a sweep spec into one job dict per (requirements, model, rep)."""
+    jobs = []
+    for req in spec["requirements"]:
+        for m in spec["models"]:
+            for rep in range(1, int(spec.get("reps", 1)) + 1):
+                output_dir = os.path.join(
+                    spec["output_root"],
+                    os.path.splitext(os.path.basename(req))[0],
+                    f"{m['provider']}_{_slug(m['model'])}",
+                    f"rep{rep}",
+                )
+                jobs.append(
+                    {
+                        "requirements": req,
+                        "prompts": spec["prompts"],
+                        "provider": m["provider"],
+                        "model": m["model"],
+                        "rep": rep,
+                        "max_iters": int(spec.get("max_iters", 8)),
+                        "extra_args": list(spec.get("extra_args", [])),
+                        "output_dir": output_dir,
+                    }
+                )
+    return jobs
+
+
+def enqueue(
+    conn: sqlite3.Connection, jobs: List[Dict[str, Any]], max_attempts: int
+) -> int:
+    """Insert jobs not already in the queue; returns the number added."""
+    added = 0
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for job in jobs:
+            key_src = json.dumps(
+                [
+                    job["requirements"],
+                    job["provider"],
+                    job["model"],
+                    job["rep"],
+                    job["output_dir"],
+                ]
+            )
+            key = hashlib.sha1(key_src.encode("utf-8")).hexdigest()
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, spec, output_dir, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(job), job["output_dir"], max_attempts, now, now),
+            )
+            added += cur.rowcount
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+
+def claim(
+    conn: sqlite3.Connection, worker: str, lease_s: float
+) -> Optional[sqlite3.Row]:
+    """Atomically lease the next queued job (or one whose lease has expired)."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued'"
+            " OR (status = 'leased' AND lease_until < ?)"
+            " ORDER BY job_id LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        if row["attempts"] >= row["max_attempts"]:
+            # Expired lease on the last allowed attempt: give up on this job.
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ?",
+                ("lease expired on final attempt", now, row["job_id"]),
+            )
+            conn.execute("COMMIT")
+            return claim(conn, worker, lease_s)
+        conn.execute(
+            "UPDATE jobs SET status = 'leased', worker = ?, attempts = attempts + 1,"
+            " lease_until = ?, heartbeat_at = ?, updated_at = ? WHERE job_id = ?",
+            (worker, now + lease_s, now, now, row["job_id"]),
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return conn.execute(
+        "SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)
+    ).fetchone()
+
+
+def heartbeat(
+    conn: sqlite3.Connection, job_id: int, worker: str, lease_s: float
+) -> bool:
+    """Extend a lease; False if the job is no longer held by this worker."""
+    now = time.time()
+    cur = conn.execute(
+        "UPDATE jobs SET lease_until = ?, heartbeat_at = ?, updated_at = ?"
+        " WHERE job_id = ? AND worker = ? AND status = 'leased'",
+        (now + lease_s, now, now, job_id, worker),
+    )
+    return cur.rowcount == 1
+
+
+def complete(
+    conn: sqlite3.Connection,
+    job_id: int,
+    worker: str,
+    ok: bool,
+    result: Dict[str, Any],
+    error: str = "",
+) -> None:
+    """Mark a leased job done, or requeue/fail it after an unsuccessful attempt."""
+    now = time.time()
+    if ok:
+        status_sql = "'done'"
+    else:
+        status_sql = (
+            "CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END"
+        )
+    conn.execute(
+        f"UPDATE jobs SET status = {status_sql}, result = ?, error = ?, lease_until = NULL,"
+        " updated_at = ? WHERE job_id = ? AND worker = ?",
+        (json.dumps(result), error, now, job_id, worker),
+    )
+
+
+def job_command(job: Dict[str, Any]) -> List[str]:
+    p = job["prompts"]
+    return [
+        sys.executable,
+        os.path.join(REPO_ROOT, "run.py"),
+        "--mode",
+        "multi",
+        "--tasker",
+        p["tasker"],
+        "--coder",
+        p["coder"],
+        "--eval",
+        p["eval"],
+        "--requirements",
+        job["requirements"],
+        "--output",
+        job["output_dir"],
+        "--max-iters",
+        str(job["max_iters"]),
+        *job["extra_args"],
+    ]
+
+
+def job_env(job: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Environment pinning every role to the job's provider/model; model cascades
+    and hedging (which would serve calls with other models) are switched off.
+    They are set empty rather than removed, so the child's load_dotenv() cannot
+    bring them back from .env.
+    """
+    env = dict(os.environ)
+    provider = job["provider"].lower()
+    prefix = provider.upper()
+    env["LLM_PROVIDER"] = provider
+    env[f"{prefix}_MODEL"] = job["model"]
+    env[f"{prefix}_MODEL_CASCADE"] = ""
+    env["LLM_HEDGE_PROVIDER"] = ""
+    for role in ROLES:
+        env[f"{prefix}_{role.upper()}_MODEL"] = job["model"]
+        env[f"{prefix}_{role.upper()}_MODEL_CASCADE"] = ""
+    return env
+
+
+class SqliteQueue:
+    """Queue operations on the SQLite file itself (workers on the coordinator's host)."""
+
+    def __init__(self, db: str):
+        self.conn = connect(db)
+
+    def claim(self, worker: str, lease_s: float) -> Optional[Dict[str, Any]]:
+        row = claim(self.conn, worker, lease_s)
+        return dict(row) if row is not None else None
+
+    def heartbeat(self, job_id: int, worker: str, lease_s: float) -> bool:
+        return heartbeat(self.conn, job_id, worker, lease_s)
+
+    def complete(
+        self,
+        job_id: int,
+        worker: str,
+        ok: bool,
+        result: Dict[str, Any],
+        error: str = "",
+    ) -> None:
+        complete(self.conn, job_id, worker, ok, result, error)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class HttpQueue:
+    """The same operations through a `serve` coordinator (workers on any host)."""
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        self.client = httpx.Client(base_url=url.rstrip("/"), timeout=timeout)
+
+    def _post(self, op: str, **payload: Any) -> Dict[str, Any]:
+        resp = self.client.post(f"/{op}", json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
+    def claim(self, worker: str, lease_s: float) -> Optional[Dict[str, Any]]:
+        return self._post("claim", worker=worker, lease_s=lease_s)["job"]
+
+    def heartbeat(self, job_id: int, worker: str, lease_s: float) -> bool:
+        return bool(
+            self._post("heartbeat", job_id=job_id, worker=worker, lease_s=lease_s)["ok"]
+        )
+
+    def complete(
+        self,
+        job_id: int,
+        worker: str,
+        ok: bool,
+        result: Dict[str, Any],
+        error: str = "",
+    ) -> None:
+        self._post(
+            "complete", job_id=job_id, worker=worker, ok=ok, result=result, error=error
+        )
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def open_queue(target: str):
+    """HttpQueue for an http(s):// coordinator URL, else SqliteQueue on a database path."""
+    if target.startswith(("http://", "https://")):
+        return HttpQueue(target)
+    return SqliteQueue(target)
+
+
+class _QueueHandler(BaseHTTPRequestHandler):
+    server_version = "SweepQueue/1"
+    db: str  # set by serve_queue
+
+    def log_message(self, *a) -> None:
+        pass
+
+    def _json(self, code: int, payload: Any) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") != "/status":
+            return self._json(404, {"error": "not found"})
+        conn = connect(self.db)
+        try:
+            counts = {
+                row["status"]: row["n"]
+                for row in conn.execute(
+                    "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+                )
+            }
+        finally:
+            conn.close()
+        self._json(200, counts)
+
+    def do_POST(self) -> None:
+        op = self.path.strip("/")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            worker, lease_s = str(req["worker"]), float(req.get("lease_s") or 0)
+            job_id = int(req.get("job_id") or 0)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._json(400, {"error": f"bad request: {e}"})
+        # One connection per request; claim() serialises writers with BEGIN IMMEDIATE
+        conn = connect(self.db)
+        try:
+            if op == "claim":
+                row = claim(conn, worker, lease_s)
+                payload = {"job": dict(row) if row is not None else None}
+            elif op == "heartbeat":
+                payload = {"ok": heartbeat(conn, job_id, worker, lease_s)}
+            elif op == "complete":
+                complete(
+                    conn,
+                    job_id,
+                    worker,
+                    bool(req.get("ok")),
+                    req.get("result") or {},
+                    str(req.get("error") or ""),
+                )
+                payload = {"ok": True}
+            else:
+                return self._json(404, {"error": "not found"})
+        finally:
+            conn.close()
+        self._json(200, payload)
+
+
+def serve_queue(db: str, host: str = "127.0.0.1", port: int = 8766) -> None:
+    """Serve the jobs table in db to workers on other hosts until interrupted."""
+    connect(db).close()  # create the schema up front
+    handler = type("SweepQueueHandler", (_QueueHandler,), {"db": db})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    print(f"Sweep queue {db} on http://{host}:{httpd.server_address[1]}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def reset_output(output_dir: str) -> None:
+    """
+    Remove a previous attempt's artifacts (log.jsonl, CRASH_*, ...); worker.log
+    and the batch Tasker seed (app.batch) are kept.
+    """
+    from app.pipeline.multi import TASKER_SEED
+
+    for name in os.listdir(output_dir):
+        if name in ("worker.log", TASKER_SEED):
+            continue
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def run_job(
+    job: Dict[str, Any], attempt: int = 1, lost: Optional[threading.Event] = None
+) -> Dict[str, Any]:
+    """
+    Run one job in a child process; returns its outcome. The child is
+    terminated when `lost` is set (the lease went to another worker).
+    """
+    os.makedirs(job["output_dir"], exist_ok=True)
+    if attempt > 1:
+        reset_output(job["output_dir"])
+    t0 = time.time()
+    lease_lost = False
+    with open(
+        os.path.join(job["output_dir"], "worker.log"), "a", encoding="utf-8"
+    ) as log:
+        log.write(f"=== attempt {attempt} ===\n")
+        log.flush()
+        proc = subprocess.Popen(
+            job_command(job),
+            cwd=REPO_ROOT,
+            env=job_env(job),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        while True:
+            try:
+                proc.wait(timeout=1.0)
+                break
+            except subprocess.TimeoutExpired:
+                if lost is not None and lost.is_set():
+                    lease_lost = True
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+                    break
+    return {
+        "returncode": proc.returncode,
+        "passed": os.path.exists(os.path.join(job["output_dir"], "PASS_MARKER")),
+        "duration_s": round(time.time() - t0, 2),
+        "lease_lost": lease_lost,
+    }
+
+
+def worker_loop(
+    queue: str,
+    lease_s: float,
+    max_jobs: Optional[int],
+    idle_exit: bool,
+    poll_s: float,
+) -> None:
+    """Claim and run jobs from queue (a database path or a `serve` URL)."""
+    worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    q = open_queue(queue)
+    done = 0
+    print(f"Worker {worker} started (queue={queue})")
+    while max_jobs is None or done < max_jobs:
+        row = q.claim(worker, lease_s)
+        if row is None:
+            if idle_exit:
+                break
+            time.sleep(poll_s)
+            continue
+        job = json.loads(row["spec"])
+        print(f"[job {row['job_id']}] attempt {row['attempts']}: {job['output_dir']}")
+
+        # Heartbeat on its own connection while the job runs; a lost lease
+        # (the job was re-claimed elsewhere) stops the child
+        stop, lost = threading.Event(), threading.Event()
+
+        def _beat(job_id: int = row["job_id"]) -> None:
+            hb = open_queue(queue)
+            try:
+                while not stop.wait(lease_s / 3):
+                    try:
+                        held = hb.heartbeat(job_id, worker, lease_s)
+                    except (httpx.HTTPError, sqlite3.Error) as e:
+                        # Transient; the lease only lapses after lease_s
+                        print(f"[job {job_id}] heartbeat failed: {e}")
+                        continue
+                    if not held:
+                        print(f"[job {job_id}] lease lost; stopping the run")
+                        lost.set()
+                        break
+            finally:
+                hb.close()
+
+        beater = threading.Thread(target=_beat, daemon=True)
+        beater.start()
+        try:
+            result = run_job(job, row["attempts"], lost)
+            ok, error = result["returncode"] == 0, ""
+            if not ok:
+                error = f"run.py exited with {result['returncode']}"
+        except Exception as e:
+            result, ok, error = {}, False, str(e)
+        finally:
+            stop.set()
+            beater.join()
+        if lost.is_set():
+            # The job belongs to another worker now; leave its row alone
+            print(f"[job {row['job_id']}] abandoned (lease lost)")
+            done += 1
+            continue
+        q.complete(row["job_id"], worker, ok, result, error)
+        print(f"[job {row['job_id']}] {'done' if ok else 'failed'} {result}")
+        done += 1
+    q.close()
+
+
+def print_status(conn: sqlite3.Connection) -> None:
+    for row in conn.execute(
+        "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status ORDER BY status"
+    ):
+        print(f"{row['status']}: {row['n']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Queue-backed sweep coordinator/worker."
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_enq = sub.add_parser("enqueue", help="Add the jobs of a sweep spec to the queue")
+    p_enq.add_argument("spec", help="Path to sweep spec JSON")
+    p_enq.add_argument("--db", required=True, help="SQLite queue path")
+    p_enq.add_argument("--max-attempts", type=int, default=3)
+    p_srv = sub.add_parser(
+        "serve", help="Serve the queue over HTTP to workers on other hosts"
+    )
+    p_srv.add_argument("--db", required=True, help="SQLite queue path")
+    p_srv.add_argument("--host", default="127.0.0.1")
+    p_srv.add_argument("--port", type=int, default=8766)
+    p_w = sub.add_parser("worker", help="Claim and run jobs until stopped")
+    where = p_w.add_mutually_exclusive_group(required=True)
+    where.add_argument("--db", help="SQLite queue path (on this host)")
+    where.add_argument("--queue", help="URL of a `serve` coordinator")
+    p_w.add_argument(
+        "--lease", type=float, default=600.0, help="Lease seconds (default: 600)"
+    )
+    p_w.add_argument("--max-jobs", type=int, default=None)
+    p_w.add_argument(
+        "--idle-exit", action="store_true", help="Exit when the queue is empty"
+    )
+    p_w.add_argument(
+        "--poll", type=float, default=5.0, help="Idle poll interval seconds"
+    )
+    p_s = sub.add_parser("status", help="Show job counts by status")
+    p_s.add_argument("--db", required=True, help="SQLite queue path")
+    args = parser.parse_args()
+
+    if args.cmd == "worker":
+        if args.lease <= 0:
+            p_w.error("--lease must be > 0")
+        if args.poll <= 0:
+            p_w.error("--poll must be > 0")
+        if args.max_jobs is not None and args.max_jobs < 1:
+            p_w.error("--max-jobs must be >= 1")
+        worker_loop(
+            args.queue or args.db, args.lease, args.max_jobs, args.idle_exit, args.poll
+        )
+        return
+    if args.cmd == "enqueue" and args.max_attempts < 1:
+        p_enq.error("--max-attempts must be >= 1")
+    if args.cmd == "serve":
+        serve_queue(args.db, args.host, args.port)
+        return
+    conn = connect(args.db)
+    try:
+        if args.cmd == "enqueue":
+            with open(args.spec, encoding="utf-8") as f:
+                jobs = expand_spec(json.load(f))
+            added = enqueue(conn, jobs, args.max_attempts)
+            print(f"Enqueued {added} new job(s) ({len(jobs) - added} already present)")
+        else:
+            print_status(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
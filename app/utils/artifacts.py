@@ -0,0 +1,157 @@
+import atexit
+import hashlib
+import os
+import queue
+import threading
+from typing import Dict, Optional, Set, TextIO
+
+
+class ArtifactWriter:
+    """
+    Writes run artifacts from a background thread so file I/O stays off the
+    critical path between LLM calls.
+      - whole-file writes are atomic (temp file + os.replace)
+      - identical content is hard-linked to the first file that holds it
+        (falls back to a normal write where links are unsupported)
+      - appends (log.jsonl/state.jsonl) are batched and flushed per batch
+      - close() (also registered with atexit) drains the queue and fsyncs everything
+    """
+
+    _BATCH = 64
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._q: "queue.Queue" = queue.Queue()
+        self._appends: Dict[str, TextIO] = {}
+        self._by_hash: Dict[str, str] = {}  # content sha1 -> path holding it
+        self._hash_of: Dict[str, str] = {}  # path -> content sha1
+        self._written: Set[str] = set()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="artifact-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- public API (called from pipeline threads) ----
+    def write(self, name: str, text: str) -> None:
+        """Atomically replace <output>/<name> with text."""
+        self._put(("write", name, text, True))
+
+    def write_versioned(
+        self, latest: str, versioned: str, text: str, overwrite: bool = True
+    ) -> None:
+        """Write a per-iteration file and point the 'latest' file at the same content."""
+        self._put(("write", versioned, text, overwrite))
+        self._put(("write", latest, text, True))
+
+    def append(self, name: str, line: str) -> None:
+        """Append a line (newline added) to <output>/<name>."""
+        self._put(("append", name, line + "\n", True))
+
+    def flush(self) -> None:
+        """Block until every queued write has reached the OS."""
+        self._q.join()
+        if self._error:
+            raise RuntimeError(
+                f"artifact writer failed: {self._error}"
+            ) from self._error
+
+    def close(self) -> None:
+        """Drain the queue, fsync written files and stop the thread."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._q.put(None)
+        self._thread.join()
+        for f in self._appends.values():
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        for path in self._written:
+            if os.path.exists(path):
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        if self._error:
+            raise RuntimeError(
+                f"artifact writer failed: {self._error}"
+            ) from self._error
+
+    # ---- background thread ----
+    def _put(self, op) -> None:
+        if self._closed:
+            raise RuntimeError("artifact writer is closed")
+        self._q.put(op)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < self._BATCH:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            touched = set()
+            stop = False
+            for op in batch:
+                if op is None:
+                    stop = True
+                    continue
+                try:
+                    kind, name, text, overwrite = op
+                    if kind == "append":
+                        self._append(name, text)
+                        touched.add(name)
+                    else:
+                        self._write(name, text, overwrite)
+                except BaseException as e:  # surfaced on flush()/close()
+                    self._error = self._error or e
+            for name in touched:
+                self._appends[name].flush()
+            for _ in batch:
+                self._q.task_done()
+            if stop:
+                return
+
+    def _append(self, name: str, text: str) -> None:
+        f = self._appends.get(name)
+        if f is None:
+            f = open(os.path.join(self.output_dir, name), "a", encoding="utf-8")
+            self._appends[name] = f
+        f.write(text)
+
+    def _write(self, name: str, text: str, overwrite: bool) -> None:
+        path = os.path.join(self.output_dir, name)
+        if not overwrite and os.path.exists(path):
+            return
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if self._hash_of.get(path) == digest and os.path.exists(path):
+            # Unchanged; a link to itself would make os.replace a no-op and leave the tmp
+            return
+        # The path is about to hold new content; forget what it held before.
+        prev = self._hash_of.pop(path, None)
+        if prev and self._by_hash.get(prev) == path:
+            del self._by_hash[prev]
+        src = self._by_hash.get(digest)
+        tmp = os.path.join(self.output_dir, f".{name}.tmp")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        linked = False
+        if src and os.path.exists(src):
+            try:
+                os.link(src, tmp)
+                linked = True
+            except OSError:
+                pass  # links unsupported here; write a copy instead
+        if not linked:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+        os.replace(tmp, path)
+        self._by_hash.setdefault(digest, path)
+        self._hash_of[path] = digest
+        self._written.add(path)
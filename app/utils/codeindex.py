@@ -0,0 +1,333 @@
+import re
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+from app.utils.reqindex import BM25
+from app.utils.sharding import parse_regions
+
+_DECL = re.compile(
+    r"^(?:export\s+)?(?:"
+    r"(?:async\s+)?function\s*\*?\s*(?P<fn>\w+)"
+    r"|(?:const|let|var)\s+(?P<var>\w+)"
+    r"|(?:type|interface|class|enum)\s+(?P<type>\w+)"
+    r"|(?P<call>[A-Za-z_$][\w$.]*)\s*\("
+    r")"
+)
+# Inner split points of long blocks: nested functions (client script) and HTML landmarks
+_INNER = re.compile(
+    r"^\s{2,6}(?:(?:async\s+)?function\s+(?P<fn>\w+)"
+    r"|(?:const|let)\s+(?P<var>\w+)\s*=\s*(?:async\s*)?(?:\(|function\b))"
+    r"|^\s*<(?P<tag>section|form|main|header|footer|nav|style|dialog)\b[^>]*?"
+    r"(?:id=[\"'](?P<id>[\w-]+))?"
+)
+_ROUTE_COMMENT = re.compile(r"^\s*//\s*(GET|POST|PUT|PATCH|DELETE)\s+(/\S*)")
+_BANNER = re.compile(r"^\s*//\s*(?:={3,}|-{3,})")
+_IDENT = re.compile(r"/api/[\w\-/]+|/[\w\-]+\.\w+|\b[a-z]+[A-Z]\w*\b|#[\w-]+")
+# Blocks longer than this are split at inner functions / HTML landmarks
+SUBSPLIT_LINES = 80
+# Below this size the whole file is cheap enough to send as is
+REGION_MIN_CHARS = 8000
+
+REGION_INSTRUCTIONS = """
+
+TARGETED EDIT (overrides the output rules above):
+You are given an outline of the whole app.ts and, in full, only the regions that
+the tasks need. Everything outside those regions stays exactly as it is. Between
+<FILE> and </FILE>, return each region you changed, in full, as
+<REGION id="N">...</REGION>; omit regions you did not change. New code goes into
+the region it belongs next to. Use only identifiers that exist in the outline or
+that you define."""
+
+
+class Block(TypedDict):
+    kind: str  # preamble | function | route | const | type | statement | client | html
+    name: str
+    level: int  # 0 = top-level declaration, 1 = split out of a long block
+    section: str  # closest banner title above
+    text: str
+
+
+class RegionSelection(TypedDict):
+    ids: List[int]
+    scores: Dict[str, float]  # task -> best block score
+
+
+def _top_level_starts(code: str) -> List[bool]:
+    """For each line: does it start outside any brace, string, template or comment?"""
+    flags = []
+    stack: List[str] = []  # "{", "`" (template) or "${" (template expression)
+    in_block_comment = False
+    i, n = 0, len(code)
+    flags.append(True)
+    while i < n:
+        c = code[i]
+        if c == "\n":
+            flags.append(not stack and not in_block_comment)
+            i += 1
+            continue
+        if in_block_comment:
+            if code.startswith("*/", i):
+                in_block_comment = False
+                i += 2
+            else:
+                i += 1
+            continue
+        if stack and stack[-1] == "`":
+            if c == "\\":
+                i += 2
+            elif c == "`":
+                stack.pop()
+                i += 1
+            elif code.startswith("${", i):
+                stack.append("${")
+                i += 2
+            else:
+                i += 1
+            continue
+        if code.startswith("//", i):
+            j = code.find("\n", i)
+            i = n if j == -1 else j
+        elif code.startswith("/*", i):
+            in_block_comment = True
+            i += 2
+        elif c in "'\"":
+            j = i + 1
+            while j < n and code[j] not in (c, "\n"):
+                j += 2 if code[j] == "\\" else 1
+            # An unterminated quote (e.g. a regex literal) ends at the line break
+            i = j + 1 if j < n and code[j] == c else j
+        elif c == "`":
+            stack.append("`")
+            i += 1
+        elif c == "{":
+            stack.append("{")
+            i += 1
+        elif c == "}":
+            if stack and stack[-1] in ("{", "${"):
+                stack.pop()
+            i += 1
+        else:
+            i += 1
+    return flags
+
+
+def _camel_words(text: str) -> str:
+    return re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+
+
+def _leading_comment_start(lines: List[str], start: int, floor: int) -> int:
+    """Index of the first line of the comment run directly above lines[start]."""
+    i = start
+    while i > floor:
+        j = i
+        # A comment run may be separated from the code by blank lines
+        while j > floor and not lines[j - 1].strip():
+            j -= 1
+        if j > floor and lines[j - 1].lstrip().startswith("//"):
+            i = j - 1
+        else:
+            break
+    return i
+
+
+def _route_name(lines: List[str], name: str) -> Tuple[str, str]:
+    for line in lines:
+        m = _ROUTE_COMMENT.match(line)
+        if m:
+            return "route", f"{name} ({m.group(1)} {m.group(2)})"
+        if not line.lstrip().startswith("//"):
+            break
+    if name.startswith("handle") or name == "router":
+        return "route", name
+    return "function", name
+
+
+def _split_inner(text: str, kind: str, section: str) -> List[Block]:
+    """Split a long block at nested functions / HTML landmarks (level-1 blocks)."""
+    lines = text.splitlines(keepends=True)
+    cuts = [0]
+    names = [""]
+    for i, line in enumerate(lines):
+        m = _INNER.match(line)
+        if i and m:
+            cut = _leading_comment_start(lines, i, cuts[-1] + 1)
+            cuts.append(cut)
+            names.append(
+                m.group("fn") or m.group("var") or m.group("id") or m.group("tag")
+            )
+    blocks: List[Block] = []
+    for k, start in enumerate(cuts):
+        end = cuts[k + 1] if k + 1 < len(cuts) else len(lines)
+        chunk = "".join(lines[start:end])
+        if chunk:
+            blocks.append(
+                {
+                    "kind": kind,
+                    "name": names[k] or "(start)",
+                    "level": 1,
+                    "section": section,
+                    "text": chunk,
+                }
+            )
+    return blocks
+
+
+def parse_blocks(code: str, section: str = "") -> List[Block]:
+    """Partition app.ts into top-level blocks (leading comments included)."""
+    lines = code.splitlines(keepends=True)
+    top = _top_level_starts(code)
+    # Banner title in effect at each line
+    sections = []
+    for j, line in enumerate(lines):
+        nxt = lines[j + 1] if j + 1 < len(lines) else ""
+        if _BANNER.match(line) and nxt.lstrip().startswith("//"):
+            title = nxt.strip().lstrip("/").strip()
+            if title and not _BANNER.match(nxt):
+                section = title
+        sections.append(section)
+    starts: List[Tuple[int, int, str, str]] = []  # (start, decl line, kind, name)
+    for i, line in enumerate(lines):
+        if not top[i] or line[:1].isspace():
+            continue
+        m = _DECL.match(line)
+        if not m:
+            continue
+        floor = starts[-1][0] + 1 if starts else 0
+        start = _leading_comment_start(lines, i, floor)
+        if m.group("fn"):
+            kind, name = _route_name(lines[start : i + 1], m.group("fn"))
+        elif m.group("var"):
+            kind, name = "const", m.group("var")
+        elif m.group("type"):
+            kind, name = "type", m.group("type")
+        else:
+            kind, name = "statement", m.group("call")
+        starts.append((start, i, kind, name))
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, 0, "preamble", "(preamble)"))
+
+    blocks: List[Block] = []
+    for k, (start, decl, kind, name) in enumerate(starts):
+        end = starts[k + 1][0] if k + 1 < len(starts) else len(lines)
+        chunk_lines = lines[start:end]
+        section = sections[decl] if sections else section
+        text = "".join(chunk_lines)
+        if not text:
+            continue
+        if len(chunk_lines) > SUBSPLIT_LINES:
+            inner_kind = "html" if "<html" in text or "<body" in text else "client"
+            if kind in ("function", "const") and "`" in text:
+                pieces = _split_inner(text, inner_kind, section)
+                pieces[0]["name"] = name
+                blocks.extend(pieces)
+                continue
+        blocks.append(
+            {"kind": kind, "name": name, "level": 0, "section": section, "text": text}
+        )
+    return blocks
+
+
+class CodeIndex:
+    """
+    Structural index of app.ts: an ordered partition into blocks (functions,
+    route handlers, declarations, and pieces of long client-script/HTML
+    templates). Used to send the Coder only the blocks a task touches and to
+    splice its edits back; the spliced file is re-parsed as a whole, so the
+    new index is always the one a fresh parse would give.
+    """
+
+    def __init__(self, code: str):
+        self.code = code
+        self.blocks = parse_blocks(code)
+        self._bm25: Optional[BM25] = None
+
+    def _search(self) -> BM25:
+        if self._bm25 is None:
+            self._bm25 = BM25(
+                [
+                    f"{_camel_words(b['name'])} {_camel_words(b['text'])}"
+                    for b in self.blocks
+                ]
+            )
+        return self._bm25
+
+    def outline(self) -> str:
+        rows, line, section = [], 1, None
+        for i, b in enumerate(self.blocks):
+            n = b["text"].count("\n") or 1
+            if b["section"] != section:
+                section = b["section"]
+                rows.append(f"== {section or '(top)'} ==")
+            indent = "    " if b["level"] else "  "
+            rows.append(
+                f"{indent}{i}. [{b['kind']}] {b['name']} (lines {line}-{line + n - 1})"
+            )
+            line += n
+        return "\n".join(rows)
+
+    def select(
+        self,
+        tasks: List[str],
+        max_regions: int,
+        per_task: int = 2,
+        min_score: float = 2.0,
+    ) -> Tuple[Optional[RegionSelection], str]:
+        """Blocks the tasks touch; (None, reason) when the full file should be sent."""
+        if len(self.code) < REGION_MIN_CHARS:
+            return None, "file is small"
+        if not tasks:
+            return None, "no tasks"
+        bm25 = self._search()
+        chosen = set()
+        best: Dict[str, float] = {}
+        for task in tasks:
+            scores = bm25.scores(_camel_words(task))
+            for ident in set(_IDENT.findall(task)):
+                for i, b in enumerate(self.blocks):
+                    if ident in b["text"]:
+                        scores[i] += 5.0
+            ranked = sorted(((s, i) for i, s in enumerate(scores)), reverse=True)
+            top = ranked[0][0]
+            best[task] = round(top, 3)
+            if top < min_score:
+                return None, f"low-confidence match for task: {task[:80]}"
+            chosen.update(
+                i for s, i in ranked[:per_task] if s >= max(min_score, 0.6 * top)
+            )
+        if len(chosen) > max_regions:
+            return None, f"tasks touch {len(chosen)} regions (> {max_regions})"
+        size = sum(len(self.blocks[i]["text"]) for i in chosen)
+        if size > 0.6 * len(self.code):
+            return None, "selected regions cover most of the file"
+        return {"ids": sorted(chosen), "scores": best}, ""
+
+    def message_regions(self, ids: List[int]) -> str:
+        return "\n".join(
+            f'<REGION id="{i}">\n{self.blocks[i]["text"]}</REGION>' for i in ids
+        )
+
+    def splice(self, ids: List[int], output: str) -> Tuple[str, "CodeIndex", List[int]]:
+        """
+        Apply a targeted-edit reply. Returns (new code, updated index, edited ids);
+        raises ValueError when the reply cannot be applied safely.
+        """
+        found = parse_regions(output)
+        if not found:
+            raise ValueError("no <REGION> blocks in reply")
+        foreign = sorted(set(found) - set(ids))
+        if foreign:
+            raise ValueError(f"reply edits regions that were not given: {foreign}")
+        texts: List[str] = []
+        for i, b in enumerate(self.blocks):
+            body = found.get(i)
+            if body is None:
+                texts.append(b["text"])
+                continue
+            if not body.strip():
+                raise ValueError(f"region {i} came back empty")
+            if b["text"].endswith("\n") and not body.endswith("\n"):
+                body += "\n"
+            texts.append(body)
+        # Block boundaries depend on their neighbours (leading comments, section
+        # banners, sub-splits), so only a full parse stays consistent
+        code = "".join(texts)
+        return code, CodeIndex(code), sorted(found)
@@ -0,0 +1,219 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.io import vprint, safe_invoke, normalize_content
+from app.utils.tokens import CallUsage, call_usage
+
+# finish/stop reasons meaning "hit the output token limit" (OpenAI | Anthropic)
+_LENGTH_REASONS = {"length", "max_tokens"}
+
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue exactly where it stopped: output only "
+    "the remaining text (do not repeat anything)."
+)
+# For a reply that opened <FILE>
+CONTINUE_FILE_PROMPT = (
+    "Your previous reply was cut off. Continue exactly where it stopped: output only "
+    "the remaining text (do not repeat anything, do not reopen <FILE>) and finish with </FILE>."
+)
+
+_CLOSERS = {")": "(", "]": "[", "}": "{"}
+# Characters after which "/" starts a regex literal rather than a division
+_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+def finish_reason(resp: Any) -> str:
+    """Return the provider finish/stop reason of a LangChain response ('' if unknown)."""
+    rm = getattr(resp, "response_metadata", None) or {}
+    return str(rm.get("finish_reason") or rm.get("stop_reason") or "")
+
+
+def extract_file(text: str) -> Optional[str]:
+    """
+    Return the content between <FILE> and </FILE>.
+    Without any <FILE> tag the whole text is taken as the file (legacy behavior);
+    an opened but unclosed <FILE> is incomplete and yields None.
+    """
+    start = text.find("<FILE>")
+    if start == -1:
+        return text if "</FILE>" not in text else None
+    end = text.find("</FILE>", start)
+    if end == -1:
+        return None
+    return text[start + 6 : end]
+
+
+def _stitch(head: str, tail: str, min_overlap: int = 16) -> str:
+    """Append a continuation, dropping any text the model repeated from the end of head."""
+    if tail.lstrip().startswith("<FILE>"):
+        # The model restarted the file instead of continuing; take the new attempt.
+        return tail
+    for k in range(min(len(head), len(tail), 2000), min_overlap - 1, -1):
+        if head.endswith(tail[:k]):
+            return head + tail[k:]
+    return head + tail
+
+
+def _balanced(code: str) -> bool:
+    """
+    True if (), [], {} and template literals of JS/TS code balance; strings,
+    comments and regex literals are skipped. Used to catch a stitched reply
+    that lost or repeated text at the seam.
+    """
+    stack: List[str] = []  # open brackets, "`" for a template, "${" for a substitution
+    i, n, prev = 0, len(code), ""
+    while i < n:
+        c = code[i]
+        if stack and stack[-1] == "`":
+            if c == "\\":
+                i += 2
+                continue
+            if c == "`":
+                stack.pop()
+                prev = "`"
+            elif code.startswith("${", i):
+                stack.append("${")
+                i += 1
+            i += 1
+            continue
+        if c in " \t\r\n":
+            i += 1
+            continue
+        if code.startswith("//", i):
+            i = code.find("\n", i)
+            i = n if i == -1 else i
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                return False
+            i = end + 2
+            continue
+        if c in "'\"":
+            j = i + 1
+            while j < n and code[j] != c and code[j] != "\n":
+                j += 2 if code[j] == "\\" else 1
+            if j >= n or code[j] != c:
+                return False
+            i, prev = j + 1, c
+            continue
+        if c == "/" and prev in _REGEX_AFTER:
+            j, in_class = i + 1, False
+            while j < n and code[j] != "\n":
+                if code[j] == "\\":
+                    j += 2
+                    continue
+                if code[j] == "[":
+                    in_class = True
+                elif code[j] == "]":
+                    in_class = False
+                elif code[j] == "/" and not in_class:
+                    break
+                j += 1
+            if j >= n or code[j] != "/":
+                return False
+            i, prev = j + 1, "/"
+            continue
+        if c == "`":
+            stack.append("`")
+        elif c in "([{":
+            stack.append(c)
+        elif c in _CLOSERS:
+            if not stack:
+                return False
+            top = stack.pop()
+            if top == "${":
+                if c != "}":
+                    return False
+            elif top != _CLOSERS[c]:
+                return False
+        prev = c
+        i += 1
+    return not stack
+
+
+def _seam_repeats(head: str, tail: str, lines: int = 3, window: int = 200) -> bool:
+    """
+    True if the continuation restarts from earlier text: its first `lines`
+    non-blank lines already appear, in a row, near the end of head.
+    """
+    first = [ln.strip() for ln in tail.splitlines() if ln.strip()][:lines]
+    if len(first) < lines or sum(len(ln) for ln in first) < 24:
+        return False
+    recent = [ln.strip() for ln in head.splitlines()[-window:]]
+    return any(
+        recent[k : k + len(first)] == first for k in range(len(recent) - len(first) + 1)
+    )
+
+
+def _looks_like_markup(code: str) -> bool:
+    return code.lstrip().startswith("<")
+
+
+def invoke_file(
+    llm,
+    messages: List[Dict[str, str]],
+    who: str,
+    iter_no: int,
+    max_continuations: int = 2,
+) -> Tuple[str, Optional[str], List[CallUsage]]:
+    """
+    Invoke an LLM expected to answer with <FILE>...</FILE>. When the reply is
+    truncated (finish_reason length/max_tokens, or an unclosed <FILE>), request
+    up to `max_continuations` continuations and stitch them together. A
+    stitched file is rejected (None) when a continuation restarted from
+    earlier text, or when its JS/TS brackets and template literals do not
+    balance (HTML files only get the first check).
+    Returns (stitched text, validated file content or None, usage of each call).
+    """
+    calls: List[CallUsage] = []
+    text = ""
+    seam_repeat = False
+    for n in range(max_continuations + 1):
+        msgs = messages
+        if n:
+            msgs = messages + [
+                {"role": "assistant", "content": text},
+                {
+                    "role": "user",
+                    "content": (
+                        CONTINUE_FILE_PROMPT if "<FILE>" in text else CONTINUE_PROMPT
+                    ),
+                },
+            ]
+        resp = safe_invoke(llm, msgs, who, iter_no)
+        calls.append(call_usage(resp))
+        part = normalize_content(resp.content)
+        if n:
+            stitched = _stitch(text, part)
+            if stitched.startswith(text):
+                seam_repeat = seam_repeat or _seam_repeats(text, stitched[len(text) :])
+            else:
+                seam_repeat = False  # the model restarted the file
+            text = stitched
+        else:
+            text = part
+
+        cut_off = finish_reason(resp) in _LENGTH_REASONS
+        if "<FILE>" in text and "</FILE>" not in text:
+            cut_off = True
+        if not cut_off:
+            break
+        vprint(
+            f"[iter {iter_no}] {who}: output truncated at {len(text)} chars "
+            f"(finish_reason={finish_reason(resp) or 'n/a'}); continuation {n + 1}/{max_continuations}"
+        )
+    else:
+        # Still truncated after all continuations: do not hand back a partial file.
+        return text, None, calls
+
+    code = extract_file(text)
+    if code is not None and not code.strip():
+        code = None
+    if code is not None and n:
+        if seam_repeat:
+            vprint(f"[iter {iter_no}] {who}: continuation repeats earlier text")
+            code = None
+        elif not _looks_like_markup(code) and not _balanced(code):
+            vprint(f"[iter {iter_no}] {who}: stitched file does not balance")
+            code = None
+    return text, code, calls
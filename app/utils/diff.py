@@ -0,0 +1,17 @@
+import difflib
+
+
+def code_diff(old: str, new: str, name: str = "app.ts", context: int = 3) -> str:
+    """Unified diff between two versions of an artifact ('' if identical)."""
+    lines = difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        fromfile=f"a/{name}",
+        tofile=f"b/{name}",
+        n=context,
+    )
+    # A last line without newline would run into the next one; mark it like git
+    return "".join(
+        ln if ln.endswith("\n") else ln + "\n\\ No newline at end of file\n"
+        for ln in lines
+    )
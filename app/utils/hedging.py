@@ -0,0 +1,306 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, TypedDict
+
+from app.utils.pricing import model_usage_cost
+from app.utils.promptprofile import count_message_tokens
+from app.utils.tokens import SERVED_BY, add_usage, extract_usage
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+
+class HedgeEvent(TypedDict):
+    role: str
+    call: str  # invoke | structured | stream
+    outcome: str  # hedge_won | hedge_lost | failover
+    delay_s: Optional[float]  # when the duplicate was sent (None: never)
+    seconds: float
+    winner: str
+    loser: Optional[str]
+    loser_state: Optional[str]  # cancelled | failed
+
+
+# Recent primary latencies per (role, model), shared by every run in the process
+_LATENCY: Dict[str, Deque[float]] = {}
+_LATENCY_LOCK = threading.Lock()
+
+
+def hedge_delay(key: str) -> float:
+    """
+    Seconds to wait for the primary before sending the duplicate: the
+    LLM_HEDGE_PERCENTILE latency of the last LLM_HEDGE_WINDOW calls once
+    LLM_HEDGE_MIN_SAMPLES are known (never below LLM_HEDGE_MIN_DELAY),
+    LLM_HEDGE_DELAY before that.
+    """
+    with _LATENCY_LOCK:
+        samples = sorted(_LATENCY.get(key, ()))
+    if len(samples) < int(_env_number("LLM_HEDGE_MIN_SAMPLES", 5)):
+        return _env_number("LLM_HEDGE_DELAY", 30)
+    pct = min(max(_env_number("LLM_HEDGE_PERCENTILE", 95), 0), 100)
+    # Nearest-rank percentile
+    rank = max(int(-(-pct * len(samples) // 100)) - 1, 0)
+    return max(samples[rank], _env_number("LLM_HEDGE_MIN_DELAY", 2))
+
+
+def _observe(key: str, seconds: float) -> None:
+    with _LATENCY_LOCK:
+        window = _LATENCY.get(key)
+        if window is None:
+            window = _LATENCY[key] = deque(
+                maxlen=int(_env_number("LLM_HEDGE_WINDOW", 50))
+            )
+        window.append(seconds)
+
+
+def _tag_served(resp: Any, model: str) -> None:
+    """Record on a reply (or streamed chunk) that model served it; see tokens.served_model."""
+    rm = getattr(resp, "response_metadata", None)
+    if isinstance(rm, dict):
+        rm[SERVED_BY] = model
+
+
+# One event loop thread for every hedged call: async clients stay on one loop
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(
+                target=_LOOP.run_forever, name="hedge-loop", daemon=True
+            ).start()
+        return _LOOP
+
+
+async def _race(primary, alternate, messages, delay: float):
+    """
+    Run primary; after `delay` (or at once if it fails) also run alternate.
+    Returns (winner index, result, loser index or None, loser state, sent_at).
+    The loser is cancelled (its request aborted) as soon as a winner is known.
+    """
+    t0 = time.perf_counter()
+    tasks = [asyncio.ensure_future(primary.ainvoke(messages))]
+    await asyncio.wait(tasks, timeout=delay)
+    if tasks[0].done() and tasks[0].exception() is None:
+        return 0, tasks[0].result(), None, None, None
+    sent_at = time.perf_counter() - t0
+    tasks.append(asyncio.ensure_future(alternate.ainvoke(messages)))
+    pending = {t for t in tasks if not t.done()}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            if t.exception() is None:
+                won = tasks.index(t)
+                for other in pending:
+                    other.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return (
+                    won,
+                    t.result(),
+                    1 - won,
+                    "cancelled" if pending else "failed",
+                    sent_at,
+                )
+    # Both failed: surface the primary's error
+    raise tasks[0].exception()
+
+
+class HedgeStats:
+    """Hedged-call events and per-model usage of one run (for log.jsonl / tokens_summary.json)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events: List[HedgeEvent] = []
+        self.outcomes: Dict[str, int] = {}
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, event: HedgeEvent) -> None:
+        with self._lock:
+            self.events.append(event)
+            self.outcomes[event["outcome"]] = self.outcomes.get(event["outcome"], 0) + 1
+
+    def usage(
+        self,
+        model: str,
+        role: str,
+        won: bool,
+        it: int,
+        ot: int,
+        cit: int,
+        estimated: bool = False,
+    ) -> None:
+        with self._lock:
+            u = self.by_model.setdefault(
+                model,
+                {
+                    "roles": [],
+                    "calls": 0,
+                    "won": 0,
+                    "input": 0,
+                    "output": 0,
+                    "cached_input": 0,
+                    "estimated_input": 0,
+                },
+            )
+            if role not in u["roles"]:
+                u["roles"].append(role)
+            u["calls"] += 1
+            u["won"] += int(won)
+            u["input"] += it
+            u["output"] += ot
+            u["cached_input"] += cit
+            if estimated:
+                u["estimated_input"] += it
+
+    def drain(self) -> List[HedgeEvent]:
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def summary(self, pricing: Optional[Dict]) -> Dict[str, Any]:
+        """Outcomes and per-model token usage/cost of hedged calls (losers included)."""
+        by_model = {}
+        for model, u in self.by_model.items():
+            rates, cost = model_usage_cost(model, u, pricing)
+            by_model[model] = {**u, "rates_per_1M": rates, "cost_usd": cost}
+        return {"outcomes": dict(self.outcomes), "by_model": by_model}
+
+
+def _model_name(llm) -> str:
+    return str(
+        getattr(llm, "model_name", None) or getattr(llm, "model", None) or "(unknown)"
+    )
+
+
+class HedgedLLM:
+    """
+    Chat model that sends a duplicate request to an alternate provider/model
+    when the primary is slower than its recent latency percentile, or at once
+    when the primary fails; the first valid reply wins and the other request
+    is cancelled. The winner's usage is booked by the caller as usual; a reply
+    from the alternate carries its model in response_metadata[SERVED_BY] so
+    the booking is priced at that model. A cancelled loser is booked here with
+    its prompt tokens (estimated; providers do not report usage for aborted
+    requests) under its own model.
+    """
+
+    def __init__(self, role: str, primary, alternate, stats: HedgeStats):
+        self.role = role
+        self.primary = primary
+        self.alternate = alternate
+        self.stats = stats
+        self.model_name = _model_name(primary)
+        self._key = f"{role}:{self.model_name}"
+
+    def invoke(self, messages, **kwargs):
+        return self._call(self.primary, self.alternate, messages, "invoke", lambda r: r)
+
+    def with_structured_output(self, schema, **kwargs):
+        return _HedgedRunnable(
+            self,
+            self.primary.with_structured_output(schema, **kwargs),
+            self.alternate.with_structured_output(schema, **kwargs),
+        )
+
+    def stream(self, messages, **kwargs):
+        """Not hedged; the alternate takes over if the primary fails before its first chunk."""
+        t0 = time.perf_counter()
+        started = False
+        try:
+            for chunk in self.primary.stream(messages, **kwargs):
+                started = True
+                yield chunk
+            return
+        except Exception:
+            if started:
+                raise
+        self.stats.add(
+            {
+                "role": self.role,
+                "call": "stream",
+                "outcome": "failover",
+                "delay_s": None,
+                "seconds": round(time.perf_counter() - t0, 3),
+                "winner": _model_name(self.alternate),
+                "loser": self.model_name,
+                "loser_state": "failed",
+            }
+        )
+        first = True
+        for chunk in self.alternate.stream(messages, **kwargs):
+            if first:
+                # Merged chunks keep the tag (later chunks do not carry the key)
+                _tag_served(chunk, _model_name(self.alternate))
+                first = False
+            yield chunk
+
+    def _call(self, primary, alternate, messages, call: str, raw: Callable[[Any], Any]):
+        delay = hedge_delay(self._key)
+        t0 = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(
+            _race(primary, alternate, messages, delay), _loop()
+        )
+        won, result, lost, loser_state, sent_at = future.result()
+        seconds = time.perf_counter() - t0
+        llms = (self.primary, self.alternate)
+        # A primary cancelled in flight contributes a lower bound on its latency
+        if won == 0 or loser_state == "cancelled":
+            _observe(self._key, seconds)
+        if lost is None:
+            return result
+        if won == 0:
+            outcome = "hedge_lost"
+        else:
+            outcome = "failover" if loser_state == "failed" else "hedge_won"
+        self.stats.add(
+            {
+                "role": self.role,
+                "call": call,
+                "outcome": outcome,
+                "delay_s": round(sent_at, 3),
+                "seconds": round(seconds, 3),
+                "winner": _model_name(llms[won]),
+                "loser": _model_name(llms[lost]),
+                "loser_state": loser_state,
+            }
+        )
+        it, ot, cit = extract_usage(raw(result))
+        self.stats.usage(_model_name(llms[won]), self.role, True, it, ot, cit)
+        if loser_state == "cancelled":
+            est = count_message_tokens(messages, _model_name(llms[lost]))
+            self.stats.usage(
+                _model_name(llms[lost]), self.role, False, est, 0, 0, estimated=True
+            )
+            add_usage(self.role, est, 0, 0, _model_name(llms[lost]))
+        if won:
+            _tag_served(raw(result), _model_name(llms[won]))
+        return result
+
+
+class _HedgedRunnable:
+    """with_structured_output() of a HedgedLLM (replies are {"raw", "parsed", ...})."""
+
+    def __init__(self, owner: HedgedLLM, primary, alternate):
+        self.owner = owner
+        self.primary = primary
+        self.alternate = alternate
+
+    def invoke(self, messages, **kwargs):
+        return self.owner._call(
+            self.primary,
+            self.alternate,
+            messages,
+            "structured",
+            lambda r: r["raw"] if isinstance(r, dict) else r,
+        )
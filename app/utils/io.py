@@ -1,43 +1,133 @@
 import pathlib
+import os
+from contextvars import ContextVar
+import threading
+import time
 from datetime import datetime
+from typing import Callable, Dict, Optional
 from httpx import HTTPError, ReadTimeout
 
-# args holder to avoid circular imports and keep vprint/safe_invoke simple
-ARGS = None
+# args holder to avoid circular imports and keep vprint/safe_invoke simple;
+# context-local so concurrent runs in one process (app.server) keep their own
+_ARGS: ContextVar = ContextVar("pipeline_args", default=None)
+
+# Cumulative wall-clock spent waiting on LLM calls (used by --profile); each
+# run started with set_args() counts into its own copy, like the token counters
+NET_WAIT = {"seconds": 0.0, "calls": 0}
+_NET_WAIT: ContextVar[Dict[str, float]] = ContextVar("net_wait", default=NET_WAIT)
 
 
 def set_args(args):
-    """Set global args for this module (to support vprint/safe_invoke)."""
-    global ARGS
-    ARGS = args
+    """Set args for the current run (to support vprint/safe_invoke) and reset its network-wait counter."""
+    _ARGS.set(args)
+    _NET_WAIT.set({"seconds": 0.0, "calls": 0})
+
+
+def get_args():
+    return _ARGS.get()
+
+
+def net_wait() -> Dict[str, float]:
+    """Network-wait counter of the current run."""
+    return _NET_WAIT.get()
+
+
+def _note_wait(t0: float) -> None:
+    counter = _NET_WAIT.get()
+    counter["seconds"] += time.perf_counter() - t0
+    counter["calls"] += 1
 
 
 def vprint(*msg):
     """Verbose print with timestamp if args.verbose is True."""
-    if ARGS and getattr(ARGS, "verbose", False):
+    args = _ARGS.get()
+    if args and getattr(args, "verbose", False):
         print(f"[{datetime.now().strftime('%H:%M:%S')}]", *msg, flush=True)
 
 
-def safe_invoke(llm, messages, who: str, iter_no: int):
-    """Invoke an LLM with basic crash handling and on-disk markers."""
+def _crash(who: str, iter_no: int, e: Exception, marker: bool = True) -> None:
+    if not marker:
+        vprint(f"[iter {iter_no}] {who}: call failed ({e})")
+        return
+    if isinstance(e, (ReadTimeout, HTTPError)):
+        print(f"[FATAL] {who} request failed: {e}")
+    else:
+        print(f"[FATAL] {who} unexpected error: {e}")
+    args = _ARGS.get()
+    if args and getattr(args, "output", None):
+        pathlib.Path(args.output, f"CRASH_{who}_iter{iter_no}.txt").write_text(
+            str(e), encoding="utf-8"
+        )
+
+
+def safe_invoke(llm, messages, who: str, iter_no: int, crash_marker: bool = True):
+    """
+    Invoke an LLM with basic crash handling and on-disk markers.
+    crash_marker=False (speculative calls whose failure the run survives)
+    only logs the error instead of writing CRASH_* files.
+    """
     vprint(f"[iter {iter_no}] {who}: invoking")
+    t0 = time.perf_counter()
     try:
         resp = llm.invoke(messages)
         return resp
-    except (ReadTimeout, HTTPError) as e:
-        print(f"[FATAL] {who} request failed: {e}")
-        if ARGS and getattr(ARGS, "output", None):
-            pathlib.Path(ARGS.output, f"CRASH_{who}_iter{iter_no}.txt").write_text(
-                str(e), encoding="utf-8"
-            )
+    except Exception as e:
+        _crash(who, iter_no, e, crash_marker)
         raise
+    finally:
+        _note_wait(t0)
+
+
+def stream_invoke(
+    llm,
+    messages,
+    who: str,
+    iter_no: int,
+    on_text: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    crash_marker: bool = True,
+):
+    """
+    safe_invoke over llm.stream(): on_text receives the text so far after every
+    chunk, and setting `cancel` closes the stream (aborting the request).
+    Returns the merged message (partial when cancelled), or None if cancelled
+    before the first chunk.
+    """
+    vprint(f"[iter {iter_no}] {who}: invoking (streamed)")
+    t0 = time.perf_counter()
+    merged = None
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            merged = chunk if merged is None else merged + chunk
+            if on_text:
+                on_text(normalize_content(merged.content))
+            if cancel is not None and cancel.is_set():
+                vprint(f"[iter {iter_no}] {who}: stream cancelled")
+                break
+        return merged
     except Exception as e:
-        print(f"[FATAL] {who} unexpected error: {e}")
-        if ARGS and getattr(ARGS, "output", None):
-            pathlib.Path(ARGS.output, f"CRASH_{who}_iter{iter_no}.txt").write_text(
-                str(e), encoding="utf-8"
-            )
+        _crash(who, iter_no, e, crash_marker)
         raise
+    finally:
+        stream.close()
+        _note_wait(t0)
+
+
+# path -> (mtime_ns, size, text); prompts/requirements reused across runs in one process
+_TEXT_CACHE = {}
+
+
+def read_text_cached(path) -> str:
+    """Read a UTF-8 file, reusing the previous read while its mtime/size are unchanged."""
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    hit = _TEXT_CACHE.get(key)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    text = pathlib.Path(key).read_text(encoding="utf-8")
+    _TEXT_CACHE[key] = (st.st_mtime_ns, st.st_size, text)
+    return text
 
 
 def normalize_content(content) -> str:
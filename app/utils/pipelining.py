@@ -0,0 +1,175 @@
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+from app.utils.promptprofile import count_message_tokens
+from app.utils.tokens import CallUsage, book_calls, usage_totals
+
+# Start of the DECISION line of a Markdown evaluator report ("DECISION: FAIL",
+# "## DECISION", "**DECISION**"); a bare header still being streamed counts too
+_DECISION_LINE = re.compile(r"^[ \t#*\-]*DECISION[ \t*]*(?::|$)", re.I | re.M)
+_DECIDED_PASS = re.compile(r"DECISION\W*PASS|\"decision\"\s*:\s*\"PASS\"", re.I)
+
+# (data, raw text, per-call usage), as returned by invoke_structured
+CallResult = Tuple[Optional[Any], str, List[CallUsage]]
+
+
+class SpeculationEvent(TypedDict):
+    role: str
+    outcome: str  # hit | miss | cancelled | failed
+    reason: str
+    ahead_s: float  # how long the call ran before its result was asked for
+
+
+def before_decision(md: str) -> Optional[str]:
+    """Report text before its DECISION line; None while that line has not started."""
+    m = _DECISION_LINE.search(md)
+    return md[: m.start()].rstrip() if m else None
+
+
+def decided_pass(text: str) -> bool:
+    return bool(_DECIDED_PASS.search(text))
+
+
+class Speculation:
+    """
+    At most one LLM call running ahead of the graph, started from a partially
+    streamed upstream reply. The node that would make the call adopts the
+    result only when its own inputs (the key) are identical; otherwise the call
+    is cancelled. Tokens of calls that are not adopted are still booked to the
+    role (they were paid for) and counted in wasted; a call aborted before its
+    usage arrived is booked with its estimated prompt tokens.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate")
+        self._lock = threading.Lock()
+        self._cur: Optional[Dict[str, Any]] = None
+        self.events: List[SpeculationEvent] = []
+        self.outcomes: Dict[str, int] = {}
+        self.wasted = {
+            "calls": 0,
+            "input": 0,
+            "output": 0,
+            "cached_input": 0,
+            "estimated_input": 0,
+        }
+
+    @property
+    def pending(self) -> bool:
+        return self._cur is not None
+
+    def start(
+        self,
+        role: str,
+        key: str,
+        fn: Callable[[threading.Event], CallResult],
+        messages: List[Dict[str, str]],
+        model: str,
+    ) -> None:
+        """
+        Run fn(cancel_event) in the background (in a copy of the current
+        context); messages/model are used to estimate the prompt if it is aborted.
+        """
+        self.cancel("superseded")
+        cur: Dict[str, Any] = {
+            "role": role,
+            "key": key,
+            "messages": messages,
+            "model": model,
+            "cancel": threading.Event(),
+            "t0": time.perf_counter(),
+            "t1": None,
+            "discarded": False,
+            "result": None,
+        }
+        ctx = contextvars.copy_context()
+        cur["future"] = self._pool.submit(ctx.run, self._run, fn, cur)
+        self._cur = cur
+
+    def _run(self, fn, cur: Dict[str, Any]) -> Optional[CallResult]:
+        try:
+            result = fn(cur["cancel"])
+        finally:
+            cur["t1"] = time.perf_counter()
+        with self._lock:
+            cur["result"] = result
+            if cur["discarded"]:
+                self._waste(cur)
+        return result
+
+    def _waste(self, cur: Dict[str, Any]) -> None:
+        calls: List[CallUsage] = list(cur["result"][2])
+        it, ot, cit = usage_totals(calls)
+        if not it:
+            # Aborted streams never get their usage chunk, but the prompt is billed
+            model = calls[-1].model if calls else None
+            it = count_message_tokens(cur["messages"], model or cur["model"])
+            self.wasted["estimated_input"] += it
+            calls = [CallUsage(model, it, ot, cit)]
+        book_calls(cur["role"], calls)
+        self.wasted["calls"] += 1
+        self.wasted["input"] += it
+        self.wasted["output"] += ot
+        self.wasted["cached_input"] += cit
+
+    def _record(self, cur: Dict[str, Any], outcome: str, reason: str = "") -> None:
+        end = cur["t1"] or time.perf_counter()
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        self.events.append(
+            {
+                "role": cur["role"],
+                "outcome": outcome,
+                "reason": reason,
+                "ahead_s": round(end - cur["t0"], 3),
+            }
+        )
+
+    def _discard(self, cur: Dict[str, Any], outcome: str, reason: str) -> None:
+        cur["cancel"].set()
+        with self._lock:
+            cur["discarded"] = True
+            if cur["result"] is not None:
+                self._waste(cur)
+        self._record(cur, outcome, reason)
+
+    def cancel(self, reason: str) -> None:
+        cur, self._cur = self._cur, None
+        if cur is not None:
+            self._discard(cur, "cancelled", reason)
+
+    def take(self, key: str) -> Optional[CallResult]:
+        """The speculative result if it was made for exactly this key, else None."""
+        cur = self._cur
+        if cur is None:
+            return None
+        self._cur = None
+        if cur["key"] != key:
+            self._discard(cur, "miss", "inputs changed")
+            return None
+        try:
+            result = cur["future"].result()
+        except Exception as e:
+            self._record(cur, "failed", str(e))
+            return None
+        if result is None or result[0] is None:
+            self._discard(cur, "failed", "no valid reply")
+            return None
+        self._record(cur, "hit")
+        return result
+
+    def drain_events(self) -> List[SpeculationEvent]:
+        events, self.events = self.events, []
+        return events
+
+    def close(self) -> None:
+        """Cancel the pending call and wait for it, so its tokens are booked before the summary."""
+        self.cancel("run finished")
+        # A blocking (native structured) call cannot be interrupted; it runs to completion
+        self._pool.shutdown(wait=True)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"outcomes": dict(self.outcomes), "wasted": dict(self.wasted)}
@@ -1,4 +1,5 @@
 import os
+import re
 from typing import Dict, Tuple, Optional
 
 
@@ -67,6 +68,54 @@ def load_pricing() -> Tuple[Dict[str, Dict[str, Optional[float]]], Optional[str]
     return pr, None
 
 
+def batch_price_factor() -> float:
+    """
+    Fraction of the live price billed for batch-API requests
+    (PRICE_BATCH_FACTOR, default 0.5: OpenAI and Anthropic batches cost half).
+    """
+    factor = _getenv_float("PRICE_BATCH_FACTOR")
+    return 0.5 if factor is None else factor
+
+
+def model_rates(model: str) -> Dict[str, Optional[float]]:
+    """
+    Per-model prices (USD per 1M tokens) from PRICE_MODEL_<MODEL>_{INPUT,CACHED_INPUT,OUTPUT}_PER_1M,
+    where <MODEL> is the model name upper-cased with non-alphanumerics as '_'
+    (e.g. openai/gpt-4o-mini -> PRICE_MODEL_OPENAI_GPT_4O_MINI_INPUT_PER_1M).
+    Missing entries are None (callers fall back to role/default rates).
+    """
+    key = re.sub(r"[^A-Z0-9]+", "_", model.upper()).strip("_")
+    return {
+        "in": _resolve_rate_per_1M(f"PRICE_MODEL_{key}_INPUT_PER_1M"),
+        "cached_in": _resolve_rate_per_1M(f"PRICE_MODEL_{key}_CACHED_INPUT_PER_1M"),
+        "out": _resolve_rate_per_1M(f"PRICE_MODEL_{key}_OUTPUT_PER_1M"),
+    }
+
+
+def model_usage_cost(
+    model: str, usage: Dict, pricing: Optional[Dict]
+) -> Tuple[Dict[str, Optional[float]], Optional[float]]:
+    """
+    (rates, cost in USD) of one model's usage {"roles", "input", "cached_input",
+    "output"}; per-model prices first, then the roles' and default rates.
+    """
+    rates = model_rates(model)
+    for kind in rates:
+        for fallback in [*usage["roles"], "default"]:
+            if rates[kind] is not None or not pricing:
+                break
+            rates[kind] = pricing.get(fallback, {}).get(kind)
+    cost = None
+    if any(v is not None for v in rates.values()):
+        cost = round(
+            usage["input"] / 1_000_000.0 * (rates["in"] or 0.0)
+            + usage["cached_input"] / 1_000_000.0 * (rates["cached_in"] or 0.0)
+            + usage["output"] / 1_000_000.0 * (rates["out"] or 0.0),
+            6,
+        )
+    return rates, cost
+
+
 def compute_cost_usd_per_1M(
     pricing: Dict[str, Dict[str, Optional[float]]], usage_by_agent: Dict
 ) -> Tuple[Dict, float]:
@@ -0,0 +1,165 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+from app.utils import io as io_utils
+
+# Profilers of concurrent runs share tracemalloc: it is started by the first one
+# (unless something else already traces) and stopped when the last one closes
+_TRACE_LOCK = threading.Lock()
+_TRACE_USERS = 0
+_TRACE_OWNED = False
+# Bumped by every new profiler; a call during which it changed was not alone
+_TRACE_GEN = 0
+
+
+class NodeProfiler:
+    """
+    Wraps pipeline nodes with cProfile and tracemalloc (--profile).
+    Per call it writes into <output>/profile/:
+      - <node>_iter{N}.prof        pstats dump (open with snakeviz / pstats)
+      - <node>_iter{N}_top.txt     top functions by cumulative time
+      - <node>_iter{N}_alloc.txt   top allocation sites during the call
+    and write_summary() aggregates wall, network-wait, local and CPU time plus
+    peak traced memory per node into profile_summary.json.
+    cProfile is skipped for a call while another profiler is active (Python
+    3.12+ allows only one); close() stops tracemalloc once no profiler needs it.
+    Peak memory is process-wide (tracemalloc.reset_peak() is global), so it is
+    only measured for calls made while this is the only profiler; with
+    concurrent profiled runs (app.server) peak_traced_kb stays null and the
+    skipped calls are counted in peak_skipped. It also includes whatever
+    other threads of the process allocate during the call.
+    """
+
+    def __init__(self, output_dir: str, top_n: int = 30):
+        self.dir = os.path.join(output_dir, "profile")
+        os.makedirs(self.dir, exist_ok=True)
+        self.top_n = top_n
+        self.summary: Dict[str, Dict[str, Any]] = {}
+        self._closed = False
+        global _TRACE_USERS, _TRACE_OWNED, _TRACE_GEN
+        with _TRACE_LOCK:
+            if _TRACE_USERS == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                _TRACE_OWNED = True
+            _TRACE_USERS += 1
+            _TRACE_GEN += 1
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            state = a[0] if a and isinstance(a[0], dict) else {}
+            tag = f"{name}_iter{state['iter']}" if "iter" in state else name
+
+            net0 = io_utils.net_wait()["seconds"]
+            snap0 = tracemalloc.take_snapshot()
+            with _TRACE_LOCK:
+                gen0, alone = _TRACE_GEN, _TRACE_USERS == 1
+                if alone:
+                    tracemalloc.reset_peak()
+            cpu0, t0 = time.process_time(), time.perf_counter()
+            prof: Optional[cProfile.Profile] = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # Another profiler (or a concurrent run's) holds the hook
+                prof = None
+            try:
+                return fn(*a, **kw)
+            finally:
+                if prof is not None:
+                    prof.disable()
+                wall = time.perf_counter() - t0
+                cpu = time.process_time() - cpu0
+                with _TRACE_LOCK:
+                    alone = alone and _TRACE_USERS == 1 and _TRACE_GEN == gen0
+                peak = tracemalloc.get_traced_memory()[1] if alone else None
+                net = io_utils.net_wait()["seconds"] - net0
+                self._dump(tag, prof, snap0)
+                self._record(name, wall, net, cpu, peak)
+
+        return wrapper
+
+    def _dump(self, tag: str, prof: Optional[cProfile.Profile], snap0: Any) -> None:
+        if prof is not None:
+            prof.dump_stats(os.path.join(self.dir, f"{tag}.prof"))
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(
+                self.top_n
+            )
+            with open(
+                os.path.join(self.dir, f"{tag}_top.txt"), "w", encoding="utf-8"
+            ) as f:
+                f.write(buf.getvalue())
+
+        # Leave out the profiler's own bookkeeping
+        noise = [
+            tracemalloc.Filter(False, f)
+            for f in (
+                tracemalloc.__file__,
+                cProfile.__file__,
+                pstats.__file__,
+                __file__,
+            )
+        ]
+        snap1 = tracemalloc.take_snapshot().filter_traces(noise)
+        diff = snap1.compare_to(snap0.filter_traces(noise), "lineno")
+        with open(
+            os.path.join(self.dir, f"{tag}_alloc.txt"), "w", encoding="utf-8"
+        ) as f:
+            for stat in diff[: self.top_n]:
+                f.write(f"{stat}\n")
+
+    def _record(
+        self, name: str, wall: float, net: float, cpu: float, peak: Optional[int]
+    ) -> None:
+        s = self.summary.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_s": 0.0,
+                "network_wait_s": 0.0,
+                "local_s": 0.0,
+                "cpu_s": 0.0,
+                "peak_traced_kb": None,
+                "peak_skipped": 0,
+            },
+        )
+        s["calls"] += 1
+        s["wall_s"] += wall
+        s["network_wait_s"] += net
+        s["local_s"] += wall - net
+        s["cpu_s"] += cpu
+        if peak is None:
+            s["peak_skipped"] += 1
+        else:
+            s["peak_traced_kb"] = max(s["peak_traced_kb"] or 0.0, peak / 1024)
+
+    def write_summary(self) -> None:
+        out = {
+            name: {k: v if v is None else round(v, 4) for k, v in s.items()}
+            for name, s in self.summary.items()
+        }
+        with open(
+            os.path.join(self.dir, "profile_summary.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(out, f, indent=2)
+
+    def close(self) -> None:
+        """End of the run: stop tracemalloc if profilers started it and none is left."""
+        global _TRACE_USERS, _TRACE_OWNED
+        if self._closed:
+            return
+        self._closed = True
+        with _TRACE_LOCK:
+            _TRACE_USERS -= 1
+            if _TRACE_USERS == 0 and _TRACE_OWNED:
+                tracemalloc.stop()
+                _TRACE_OWNED = False
@@ -0,0 +1,136 @@
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, TypedDict
+
+# Fallback when tiktoken or its encoding files are unavailable (offline):
+# roughly 4 characters per token for English text and code
+_CHARS_PER_TOKEN = 4
+# Per-message overhead of the chat format (role markers), OpenAI cookbook estimate
+_MESSAGE_OVERHEAD = 3
+_DEFAULT_ENCODING = "o200k_base"
+
+_ENC_LOCK = threading.Lock()
+_ENCODINGS: Dict[str, Any] = (
+    {}
+)  # encoding name -> tiktoken.Encoding, or None if unavailable
+
+
+class PromptCall(TypedDict):
+    role: str
+    call: str  # who label of the call (TASKER, CODER_REGIONS, ...)
+    iter: int
+    sections: Dict[str, int]  # section -> tokens; "framing" = labels and chat overhead
+    total: int
+
+
+def _encoding_name(model: str) -> str:
+    try:
+        import tiktoken
+
+        # OpenRouter ids carry a vendor prefix ("openai/gpt-4o")
+        return tiktoken.encoding_name_for_model(model.rsplit("/", 1)[-1])
+    except Exception:
+        # Non-OpenAI models: an OpenAI encoding is still a close proxy
+        return _DEFAULT_ENCODING
+
+
+def _encoding(name: str):
+    with _ENC_LOCK:
+        if name not in _ENCODINGS:
+            try:
+                import tiktoken
+
+                _ENCODINGS[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                print(
+                    f"[WARN] tiktoken encoding {name} unavailable ({e.__class__.__name__}); "
+                    f"estimating {_CHARS_PER_TOKEN} chars per token"
+                )
+                _ENCODINGS[name] = None
+        return _ENCODINGS[name]
+
+
+@lru_cache(maxsize=512)
+def count_tokens(text: str, encoding: str = _DEFAULT_ENCODING) -> int:
+    """Token count of text (cached: prompts and requirements repeat every call)."""
+    enc = _encoding(encoding)
+    if enc is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    """Input tokens of a chat prompt for model (approximate for non-OpenAI models)."""
+    enc = _encoding_name(model)
+    return sum(count_tokens(m["content"], enc) + _MESSAGE_OVERHEAD for m in messages)
+
+
+class PromptProfile:
+    """
+    Per-call token breakdown of prompts by the sections a node assembled
+    (system prompt, requirements, feedback, tasks, code). Whatever the sections
+    do not cover (labels, chat overhead) is reported as "framing".
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[PromptCall] = []
+        self.by_role: Dict[str, Dict[str, int]] = {}
+        self.by_role_iter: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.encodings: Dict[str, str] = {}  # model -> encoding used
+
+    def record(
+        self,
+        role: str,
+        call: str,
+        iter_no: int,
+        model: str,
+        messages: List[Dict[str, str]],
+        sections: Dict[str, Optional[str]],
+    ) -> PromptCall:
+        if model not in self.encodings:
+            self.encodings[model] = _encoding_name(model)
+        enc = self.encodings[model]
+        counts = {k: count_tokens(v, enc) for k, v in sections.items() if v}
+        total = count_message_tokens(messages, model)
+        counts["framing"] = max(total - sum(counts.values()), 0)
+        entry: PromptCall = {
+            "role": role,
+            "call": call,
+            "iter": iter_no,
+            "sections": counts,
+            "total": total,
+        }
+        with self._lock:
+            self.calls.append(entry)
+            for bucket in (
+                self.by_role.setdefault(role, {}),
+                self.by_role_iter.setdefault(role, {}).setdefault(str(iter_no), {}),
+            ):
+                for k, n in counts.items():
+                    bucket[k] = bucket.get(k, 0) + n
+        return entry
+
+    def drain(self) -> List[PromptCall]:
+        with self._lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+    def summary(self) -> Dict[str, Any]:
+        share = {}
+        for role, counts in self.by_role.items():
+            total = sum(counts.values()) or 1
+            share[role] = {
+                k: round(n / total, 3)
+                for k, n in sorted(counts.items(), key=lambda kv: -kv[1])
+            }
+        return {
+            "encodings": dict(self.encodings),
+            "estimated": any(
+                e in _ENCODINGS and _ENCODINGS[e] is None
+                for e in self.encodings.values()
+            ),
+            "by_role": self.by_role,
+            "share_by_role": share,
+            "by_role_iter": self.by_role_iter,
+        }
@@ -0,0 +1,185 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NUMBERED = re.compile(r"^\s*\d+\.\s+\S")
+_BULLET = re.compile(r"^\s*(?:[•*\-]|\d+\.\d*\s)")
+_STOP = {
+    "a",
+    "an",
+    "and",
+    "are",
+    "as",
+    "be",
+    "by",
+    "for",
+    "from",
+    "in",
+    "is",
+    "it",
+    "must",
+    "no",
+    "not",
+    "of",
+    "on",
+    "or",
+    "should",
+    "so",
+    "that",
+    "the",
+    "their",
+    "them",
+    "this",
+    "to",
+    "with",
+}
+# Sections sent on every call: global constraints (single file, Bun, no frameworks)
+PINNED_TITLES = ("purpose", "deliverables")
+
+
+class Section(TypedDict):
+    title: str
+    text: str
+
+
+class Selection(TypedDict):
+    text: str
+    full: bool
+    reason: str
+    sections: List[str]
+    scores: Dict[str, float]  # task -> best section score
+
+
+def _terms(text: str) -> List[str]:
+    out = []
+    for w in _WORD.findall(text.lower()):
+        if w in _STOP or len(w) < 2:
+            continue
+        # Light suffix folding so "tokens"/"token", "hashed"/"hash" match
+        for suf in ("ing", "ed", "es", "s"):
+            if len(w) > len(suf) + 3 and w.endswith(suf):
+                w = w[: -len(suf)]
+                break
+        out.append(w)
+    return out
+
+
+def _is_title(line: str, prev: str, nxt: str) -> bool:
+    s = line.strip()
+    if not s or _BULLET.match(s) and not _NUMBERED.match(s):
+        return False
+    if s.startswith("#") or _NUMBERED.match(s):
+        return True
+    # Short label line ("Purpose", "Use-case description:") opening a block
+    if len(s) > 60 or s.endswith((".", ",", ";")):
+        return False
+    return s.endswith(":") or not prev.strip() or not nxt.strip()
+
+
+def split_sections(text: str) -> List[Section]:
+    """Split a requirements document at headings, label lines and numbered items."""
+    lines = text.splitlines()
+    sections: List[Section] = []
+    title, body = "(preamble)", []
+    for i, line in enumerate(lines):
+        prev = lines[i - 1] if i else ""
+        nxt = lines[i + 1] if i + 1 < len(lines) else ""
+        if _is_title(line, prev, nxt):
+            if "".join(body).strip():
+                sections.append({"title": title, "text": "\n".join(body).strip()})
+            title, body = line.strip().lstrip("#").strip().rstrip(":"), [line]
+        else:
+            body.append(line)
+    if "".join(body).strip():
+        sections.append({"title": title, "text": "\n".join(body).strip()})
+    return sections
+
+
+class BM25:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, docs: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self._tf = [Counter(_terms(d)) for d in docs]
+        self._len = [sum(tf.values()) for tf in self._tf]
+        self._avg = (sum(self._len) / len(self._len)) if self._len else 0.0
+        df: Counter = Counter()
+        for tf in self._tf:
+            df.update(tf.keys())
+        n = len(docs)
+        self._idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in df.items()}
+
+    def scores(self, query: str) -> List[float]:
+        terms = set(_terms(query))
+        out = []
+        for tf, dl in zip(self._tf, self._len):
+            s = 0.0
+            for t in terms:
+                f = tf.get(t, 0)
+                if f:
+                    norm = self.k1 * (1 - self.b + self.b * dl / (self._avg or 1.0))
+                    s += self._idf[t] * f * (self.k1 + 1) / (f + norm)
+            out.append(s)
+        return out
+
+
+class RequirementsIndex:
+    """
+    BM25 index over the sections of a requirements document. Each task picks
+    its best-matching sections; if any task has no confident match, the full
+    document is used instead.
+    """
+
+    def __init__(self, text: str):
+        self.full_text = text
+        self.sections = split_sections(text)
+        self.bm25 = BM25([s["text"] for s in self.sections])
+
+    def _pinned(self) -> List[int]:
+        return [
+            i
+            for i, s in enumerate(self.sections)
+            if s["title"].lower().startswith(PINNED_TITLES)
+        ]
+
+    def select(self, tasks: List[str], per_task: int, min_score: float) -> Selection:
+        """Sections relevant to tasks (plus pinned ones), in document order."""
+
+        def full(reason: str, scores: Optional[Dict[str, float]] = None) -> Selection:
+            return {
+                "text": self.full_text,
+                "full": True,
+                "reason": reason,
+                "sections": [s["title"] for s in self.sections],
+                "scores": scores or {},
+            }
+
+        if len(self.sections) < 3:
+            return full("document has too few sections to index")
+        if not tasks:
+            return full("no tasks")
+        chosen = set(self._pinned())
+        best: Dict[str, float] = {}
+        for task in tasks:
+            ranked: List[Tuple[float, int]] = sorted(
+                ((s, i) for i, s in enumerate(self.bm25.scores(task))), reverse=True
+            )
+            top = ranked[0][0]
+            best[task] = round(top, 3)
+            if top < min_score:
+                return full(f"low-confidence match for task: {task[:80]}", best)
+            for s, i in ranked[:per_task]:
+                if s >= max(min_score, top / 2):
+                    chosen.add(i)
+        if len(chosen) >= len(self.sections):
+            return full("every section is relevant", best)
+        picked = sorted(chosen)
+        return {
+            "text": "\n\n".join(self.sections[i]["text"] for i in picked),
+            "full": False,
+            "reason": f"{len(picked)} of {len(self.sections)} sections",
+            "sections": [self.sections[i]["title"] for i in picked],
+            "scores": best,
+        }
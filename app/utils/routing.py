@@ -0,0 +1,203 @@
+import re
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.utils.io import vprint
+from app.utils.pricing import batch_price_factor, model_usage_cost
+from app.utils.tokens import add_usage, add_usage_hook
+from app.utils.hedging import HedgedLLM, HedgeStats
+from provider import hedge_provider, make_hedge_llm, make_llm, model_cascade
+
+# Roles the router escalates (see note_tasker_parse / note_verdict)
+ESCALATED = ("tasker", "coder")
+
+
+# Set while add_batch_usage books a batch-API reply (priced at the batch discount)
+_BATCH: ContextVar[bool] = ContextVar("batch_usage", default=False)
+
+
+def _new_usage() -> Dict[str, Any]:
+    return {
+        "roles": [],
+        "calls": 0,
+        "batch_calls": 0,
+        "input": 0,
+        "output": 0,
+        "cached_input": 0,
+    }
+
+
+def _norm(item: str) -> str:
+    return re.sub(r"\s+", " ", item).strip().lower()
+
+
+class ModelRouter:
+    """
+    Per-role model cascade. Each role with a configured cascade
+    ({PROVIDER}_{ROLE}_MODEL_CASCADE="cheap,...,strong") starts on its first
+    model and moves one step up when:
+      - the Tasker's output fails to parse (tasker), or
+      - the Evaluator FAILs `escalate_after` times in a row on overlapping
+        FAILING_ITEMS (coder; the tasker once the coder is at its top model).
+    Escalation is sticky for the rest of the run. Roles without a cascade keep
+    their usual model. The Evaluator is never escalated: it ignores the global
+    cascade and runs the last (strongest) model of its own one, if any.
+    Token usage is attributed to, and priced at the rates of, the model that served it.
+    With LLM_HEDGE_PROVIDER set, every role's model is wrapped in a HedgedLLM
+    (duplicate request to the alternate provider on slow or failed calls).
+    """
+
+    def __init__(
+        self, base: Dict[str, Any], temperature: float = 0.0, escalate_after: int = 2
+    ):
+        self.base = base  # role -> default LLM (used when the role has no cascade)
+        self.temperature = temperature
+        self.escalate_after = escalate_after
+        self.tiers: Dict[str, List[str]] = {
+            role: model_cascade(role, inherit=role in ESCALATED) for role in base
+        }
+        self.level: Dict[str, int] = {
+            role: 0 if role in ESCALATED else max(len(self.tiers[role]) - 1, 0)
+            for role in base
+        }
+        self.decisions: List[Dict[str, Any]] = []
+        self.usage: Dict[str, Dict[str, Any]] = {}
+        # (model, role, batch) -> usage; priced per cell so role rates (and the
+        # batch discount) still apply per role
+        self._cells: Dict[Tuple[str, str, bool], Dict[str, Any]] = {}
+        self._prev_failing: Set[str] = set()
+        self._repeats = 0
+        self.hedges: Optional[HedgeStats] = HedgeStats() if hedge_provider() else None
+        add_usage_hook(self._on_usage)
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.tiers.values())
+
+    def llm(self, role: str):
+        tiers = self.tiers[role]
+        if not tiers:
+            llm = self.base[role]
+        else:
+            llm = make_llm(role, self.temperature, model=tiers[self.level[role]])
+        if self.hedges is None:
+            return llm
+        alternate = make_hedge_llm(role, self.temperature)
+        return HedgedLLM(role, llm, alternate, self.hedges)
+
+    def model(self, role: str) -> str:
+        tiers = self.tiers[role]
+        if tiers:
+            return tiers[self.level[role]]
+        llm = self.base[role]
+        return str(
+            getattr(llm, "model_name", None)
+            or getattr(llm, "model", None)
+            or "(unknown)"
+        )
+
+    def models(self) -> Dict[str, str]:
+        return {role: self.model(role) for role in self.base}
+
+    def escalate(
+        self, role: str, iter_no: int, reason: str
+    ) -> Optional[Dict[str, Any]]:
+        """Move a role one model up its cascade; returns the decision (None at the top)."""
+        tiers = self.tiers[role]
+        if self.level[role] + 1 >= len(tiers):
+            return None
+        frm = tiers[self.level[role]]
+        self.level[role] += 1
+        decision = {
+            "iter": iter_no,
+            "role": role,
+            "from": frm,
+            "to": tiers[self.level[role]],
+            "reason": reason,
+        }
+        self.decisions.append(decision)
+        vprint(f"[iter {iter_no}] ROUTER: {role} {frm} -> {decision['to']} ({reason})")
+        return decision
+
+    def note_tasker_parse(self, ok: bool, iter_no: int) -> Optional[Dict[str, Any]]:
+        if ok:
+            return None
+        return self.escalate("tasker", iter_no, "tasker output failed to parse")
+
+    def note_verdict(
+        self, decision: str, failing_items: List[str], iter_no: int
+    ) -> Optional[Dict[str, Any]]:
+        """Track repeated FAILs on the same items; escalate once they persist."""
+        current = {_norm(x) for x in failing_items if x.strip()}
+        if decision == "PASS" or not current:
+            self._prev_failing, self._repeats = set(), 0
+            return None
+        self._repeats = self._repeats + 1 if current & self._prev_failing else 1
+        self._prev_failing = current
+        if self._repeats < self.escalate_after:
+            return None
+        self._repeats = 1
+        reason = f"evaluator failed {self.escalate_after}x on the same items"
+        return self.escalate("coder", iter_no, reason) or self.escalate(
+            "tasker", iter_no, reason
+        )
+
+    def _on_usage(
+        self, agent: str, it: int, ot: int, cit: int, model: Optional[str]
+    ) -> None:
+        role = agent if agent in self.base else "coder"
+        # A hedged call may have been served by the alternate provider's model
+        model = model or self.model(role)
+        batch = _BATCH.get()
+        for u in (
+            self.usage.setdefault(model, _new_usage()),
+            self._cells.setdefault((model, role, batch), _new_usage()),
+        ):
+            if role not in u["roles"]:
+                u["roles"].append(role)
+            u["calls"] += 1
+            u["batch_calls"] += int(batch)
+            u["input"] += it
+            u["output"] += ot
+            u["cached_input"] += cit
+
+    def add_batch_usage(self, role: str, it: int, ot: int, cit: int) -> None:
+        """Book the usage of a reply obtained through a provider batch API."""
+        token = _BATCH.set(True)
+        try:
+            add_usage(role, it, ot, cit)
+        finally:
+            _BATCH.reset(token)
+
+    def _cell_cost(
+        self, key: Tuple[str, str, bool], pricing: Optional[Dict]
+    ) -> Optional[float]:
+        model, _, batch = key
+        cost = model_usage_cost(model, self._cells[key], pricing)[1]
+        if cost is not None and batch:
+            cost *= batch_price_factor()
+        return cost
+
+    def role_costs(self, pricing: Optional[Dict]) -> Dict[str, float]:
+        """
+        Cost in USD per role so far, each call priced at its model's rates
+        (batch-API calls at the batch discount).
+        """
+        costs = {role: 0.0 for role in self.base}
+        for key in self._cells:
+            costs[key[1]] += self._cell_cost(key, pricing) or 0.0
+        return costs
+
+    def summary(self, pricing: Optional[Dict]) -> Dict[str, Any]:
+        """Token usage and cost per model plus the routing decisions (for tokens_summary.json)."""
+        by_model = {}
+        for model, u in self.usage.items():
+            rates = model_usage_cost(model, u, pricing)[0]
+            costs = [
+                self._cell_cost(key, pricing) for key in self._cells if key[0] == model
+            ]
+            cost = None
+            if any(c is not None for c in costs):
+                cost = round(sum(c or 0.0 for c in costs), 6)
+            by_model[model] = {**u, "rates_per_1M": rates, "cost_usd": cost}
+        return {"by_model": by_model, "routing": self.decisions}
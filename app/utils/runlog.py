@@ -0,0 +1,254 @@
+"""
+Random-access readers for run logs (log.jsonl / state.jsonl).
+
+Files are memory-mapped and described by a small offset-index sidecar
+(.<name>.idx next to the file: byte offset and "iter" of every line), so one
+iteration is fetched by slicing the map and decoding a single line instead of
+parsing the whole file. Indexes are validated against the file's size/mtime,
+extended in place when the file only grew (live runs), and rebuilt otherwise.
+
+    from app.utils.runlog import RunReader, iter_runs
+    with RunReader("workspace/x/run1") as run:
+        run.state_at(3)["code_tsx"]
+    for run in iter_runs("workspace"):
+        with run:
+            last = run.log.last()
+
+    python -m app.utils.runlog index workspace     # prebuild sidecars for a tree
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+# Top-level "iter" of a line without decoding it; escaped quotes (inside
+# embedded code strings) do not match.
+_ITER_RE = re.compile(rb'(?<!\\)"iter":\s*(-?\d+)')
+_INDEX_VERSION = 1
+
+
+class JsonlIndex:
+    """Memory-mapped JSONL file with O(1) access by line number or by "iter"."""
+
+    def __init__(self, path: str, persist: bool = True):
+        self.path = path
+        self.persist = persist
+        self.sidecar = os.path.join(
+            os.path.dirname(path), f".{os.path.basename(path)}.idx"
+        )
+        self._file = open(path, "rb")
+        self._mm: Optional[mmap.mmap] = None
+        self.offsets: List[int] = []  # start of each line; plus end of the last
+        self.keys: List[Optional[int]] = []
+        self._by_iter: Dict[int, int] = {}
+        self._load()
+
+    # ---- index ----
+    def _load(self) -> None:
+        st = os.fstat(self._file.fileno())
+        if st.st_size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        saved = self._read_sidecar()
+        if (
+            saved
+            and saved["size"] == st.st_size
+            and saved["mtime_ns"] == st.st_mtime_ns
+        ):
+            self.offsets, self.keys = saved["offsets"], saved["keys"]
+        elif (
+            saved and 0 < saved["size"] < st.st_size and self._ends_line(saved["size"])
+        ):
+            # Appended since last time: index only the new tail
+            self.offsets, self.keys = saved["offsets"], saved["keys"]
+            self._scan(saved["size"], st.st_size)
+            self._write_sidecar(st)
+        else:
+            self.offsets, self.keys = [0], []
+            self._scan(0, st.st_size)
+            self._write_sidecar(st)
+        self._by_iter = {k: i for i, k in enumerate(self.keys) if k is not None}
+
+    def _ends_line(self, pos: int) -> bool:
+        return self._mm is not None and self._mm[pos - 1 : pos] == b"\n"
+
+    def _scan(self, start: int, end: int) -> None:
+        mm, pos = self._mm, start
+        while mm is not None and pos < end:
+            nl = mm.find(b"\n", pos, end)
+            stop = end if nl == -1 else nl + 1
+            line = mm[pos:stop]
+            if line.strip():
+                m = _ITER_RE.search(line)
+                self.keys.append(int(m.group(1)) if m else None)
+                self.offsets.append(stop)
+            else:
+                # Blank line: fold into the previous entry's span
+                self.offsets[-1] = stop
+            pos = stop
+
+    def _read_sidecar(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.sidecar, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != _INDEX_VERSION:
+            return None
+        return data
+
+    def _write_sidecar(self, st: os.stat_result) -> None:
+        if not self.persist:
+            return
+        data = {
+            "version": _INDEX_VERSION,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "offsets": self.offsets,
+            "keys": self.keys,
+        }
+        tmp = self.sidecar + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.sidecar)
+        except OSError:
+            pass  # read-only tree: keep the index in memory only
+
+    # ---- access ----
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def raw(self, i: int) -> bytes:
+        """Undecoded bytes of line i (negative indexes count from the end)."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._mm[self.offsets[i] : self.offsets[i + 1]]
+
+    def get(self, i: int) -> Dict[str, Any]:
+        # An offset may start on blank lines folded into the previous span
+        return json.loads(self.raw(i).strip())
+
+    def by_iter(self, iter_no: int) -> Optional[Dict[str, Any]]:
+        """Entry whose top-level "iter" is iter_no (the last one if repeated)."""
+        i = self._by_iter.get(iter_no)
+        return None if i is None else self.get(i)
+
+    def iters(self) -> List[int]:
+        return sorted(self._by_iter)
+
+    def last(self) -> Optional[Dict[str, Any]]:
+        return self.get(-1) if len(self) else None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "JsonlIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class RunReader:
+    """Lazy access to one run directory's log.jsonl and state.jsonl."""
+
+    def __init__(self, output_dir: str, persist: bool = True):
+        self.output_dir = output_dir
+        self.persist = persist
+        self._log: Optional[JsonlIndex] = None
+        self._state: Optional[JsonlIndex] = None
+
+    def _open(self, name: str) -> JsonlIndex:
+        return JsonlIndex(os.path.join(self.output_dir, name), self.persist)
+
+    @property
+    def log(self) -> JsonlIndex:
+        if self._log is None:
+            self._log = self._open("log.jsonl")
+        return self._log
+
+    @property
+    def state(self) -> JsonlIndex:
+        if self._state is None:
+            self._state = self._open("state.jsonl")
+        return self._state
+
+    def log_at(self, iter_no: int) -> Optional[Dict[str, Any]]:
+        return self.log.by_iter(iter_no)
+
+    def state_at(self, iter_no: int) -> Optional[Dict[str, Any]]:
+        return self.state.by_iter(iter_no)
+
+    def close(self) -> None:
+        for idx in (self._log, self._state):
+            if idx is not None:
+                idx.close()
+        self._log = self._state = None
+
+    def __enter__(self) -> "RunReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_run_dirs(root: str) -> Iterator[str]:
+    """Run directories (those holding log.jsonl) below root, depth-first."""
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = sorted(os.scandir(path), key=lambda e: e.name, reverse=True)
+        except OSError:
+            continue
+        if any(e.name == "log.jsonl" and e.is_file() for e in entries):
+            yield path
+        stack.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+
+
+def iter_runs(root: str, persist: bool = True) -> Iterator[RunReader]:
+    for path in iter_run_dirs(root):
+        yield RunReader(path, persist)
+
+
+def iter_log_entries(root: str) -> Iterator[Dict[str, Any]]:
+    """Every log.jsonl entry below root, tagged with its output_dir, one file open at a time."""
+    for run in iter_runs(root):
+        with run:
+            for entry in run.log:
+                entry["output_dir"] = run.output_dir
+                yield entry
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run log index tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_index = sub.add_parser("index", help="Build/refresh .*.idx sidecars below a root")
+    p_index.add_argument("root")
+    args = parser.parse_args()
+
+    if args.cmd == "index":
+        runs = lines = 0
+        for run in iter_runs(args.root):
+            with run:
+                lines += len(run.log)
+                if os.path.isfile(os.path.join(run.output_dir, "state.jsonl")):
+                    lines += len(run.state)
+            runs += 1
+        print(f"Indexed {runs} run(s), {lines} line(s) below {args.root}")
+
+
+if __name__ == "__main__":
+    main()
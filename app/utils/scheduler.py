@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+ROLES = ("tasker", "coder", "evaluator")
+# Steps run by each plan; "reduced" skips the Tasker and codes the Evaluator's NEW_TASKS
+PLANS = {"full": ROLES, "reduced": ("coder", "evaluator")}
+
+
+class Decision(TypedDict):
+    action: str  # continue | reduced | stop
+    reason: str
+    predicted: Dict[str, Dict[str, Optional[float]]]  # plan -> {seconds, cost_usd}
+    remaining: Dict[str, Optional[float]]  # {seconds, cost_usd}
+
+
+class BudgetScheduler:
+    """
+    Decides before every iteration whether the run's wall-clock deadline
+    (--deadline) and cost budget (--budget-usd) can absorb another one.
+    Per-role latency and token counts are learned from the run's own log
+    entries (role_seconds + cumulative tokens_by_agent, as in log.jsonl) and,
+    when given, the cumulative cost per role (priced by the model that served
+    each call; role rates otherwise); a plan is affordable when its predicted latency/cost times `safety` fits in
+    what is left.
+    """
+
+    def __init__(
+        self,
+        deadline_s: Optional[float],
+        budget_usd: Optional[float],
+        pricing: Optional[Dict],
+        safety: float = 1.2,
+        window: int = 3,
+    ):
+        self.deadline_s = deadline_s
+        self.budget_usd = budget_usd if pricing else None
+        self.pricing = pricing
+        self.safety = safety
+        self.window = window
+        self._samples: Dict[str, List[Dict[str, float]]] = {r: [] for r in ROLES}
+        self._prev_tokens: Optional[Dict[str, Dict[str, int]]] = None
+        self._prev_costs: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.deadline_s is not None or self.budget_usd is not None
+
+    def observe(self, entry: Dict, costs: Optional[Dict[str, float]] = None) -> None:
+        """
+        Learn from one log entry (must carry a snapshot of tokens_by_agent);
+        costs is the cumulative cost in USD per role, if known.
+        """
+        tokens = entry.get("tokens_by_agent") or {}
+        seconds = entry.get("role_seconds") or {}
+        for role in ROLES:
+            cur = tokens.get(role) or {}
+            prev = (self._prev_tokens or {}).get(role) or {}
+            delta = {
+                k: cur.get(k, 0) - prev.get(k, 0)
+                for k in ("input", "output", "cached_input")
+            }
+            # Roles that made no call this iteration (e.g. skipped Tasker) teach nothing
+            if delta["input"] or delta["output"]:
+                sample = {"seconds": float(seconds.get(role, 0.0)), **delta}
+                if costs is not None:
+                    sample["cost_usd"] = costs.get(role, 0.0) - self._prev_costs.get(
+                        role, 0.0
+                    )
+                self._samples[role].append(sample)
+        self._prev_tokens = {r: dict(tokens.get(r) or {}) for r in ROLES}
+        self._prev_costs = dict(costs or {})
+
+    def _rate(self, role: str, kind: str) -> float:
+        val = self.pricing.get(role, {}).get(kind)
+        if val is None:
+            val = self.pricing["default"].get(kind)
+        return float(val or 0.0)
+
+    def _role_estimate(self, role: str) -> Optional[Tuple[float, float]]:
+        recent = self._samples[role][-self.window :]
+        if not recent:
+            return None
+        n = len(recent)
+        seconds = sum(s["seconds"] for s in recent) / n
+        cost = 0.0
+        if self.pricing and all("cost_usd" in s for s in recent):
+            cost = sum(s["cost_usd"] for s in recent) / n
+        elif self.pricing:
+            for kind, key in (
+                ("in", "input"),
+                ("cached_in", "cached_input"),
+                ("out", "output"),
+            ):
+                avg = sum(s[key] for s in recent) / n
+                cost += avg / 1_000_000.0 * self._rate(role, kind)
+        return seconds, cost
+
+    def predict(self, plan: str) -> Optional[Dict[str, float]]:
+        """Predicted {seconds, cost_usd} of one iteration of a plan (None without history)."""
+        seconds = cost = 0.0
+        for role in PLANS[plan]:
+            est = self._role_estimate(role)
+            if est is None:
+                return None
+            seconds += est[0]
+            cost += est[1]
+        return {"seconds": round(seconds, 3), "cost_usd": round(cost, 6)}
+
+    def decide(self, elapsed_s: float, spent_usd: float, can_reduce: bool) -> Decision:
+        remaining = {
+            "seconds": (
+                None
+                if self.deadline_s is None
+                else round(self.deadline_s - elapsed_s, 3)
+            ),
+            "cost_usd": (
+                None
+                if self.budget_usd is None
+                else round(self.budget_usd - spent_usd, 6)
+            ),
+        }
+        predicted = {plan: self.predict(plan) for plan in PLANS}
+
+        def fits(p: Optional[Dict[str, float]]) -> bool:
+            if p is None:  # no history yet: only an exhausted budget stops us
+                return all(v is None or v > 0 for v in remaining.values())
+            return all(
+                left is None or p[key] * self.safety <= left
+                for key, left in (
+                    ("seconds", remaining["seconds"]),
+                    ("cost_usd", remaining["cost_usd"]),
+                )
+            )
+
+        if fits(predicted["full"]):
+            action, reason = "continue", "full iteration fits the remaining budget"
+        elif can_reduce and fits(predicted["reduced"]):
+            action, reason = "reduced", "only Coder+Evaluator fit; skipping Tasker"
+        else:
+            action, reason = "stop", "budget exhausted: next iteration would not fit"
+        return {
+            "action": action,
+            "reason": reason,
+            "predicted": predicted,
+            "remaining": remaining,
+        }
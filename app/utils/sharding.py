@@ -0,0 +1,216 @@
+import re
+from typing import Dict, List, Optional, Set, TypedDict
+
+# Section banners in generated app.ts: "// ---- Title ----", "// ====== Title",
+# or a title line between two "// =====" rules.
+_BANNER = re.compile(r"^\s*//\s*(?:={3,}|-{3,})(.*)$")
+# Identifiers worth matching literally: API paths, routes/assets, camelCase names, calls
+_IDENT = re.compile(r"/api/[\w\-/]+|/[\w\-]+\.\w+|\b[a-z]+[A-Z]\w*\b|\b\w+(?=\(\))")
+_WORD = re.compile(r"[a-z][a-z0-9]{3,}")
+_STOP = {
+    "with",
+    "that",
+    "this",
+    "from",
+    "when",
+    "into",
+    "ensure",
+    "keep",
+    "make",
+    "update",
+    "only",
+    "must",
+    "should",
+    "every",
+    "each",
+    "remove",
+    "replace",
+    "existing",
+}
+_REGION_RE = re.compile(r'<REGION id="?(\d+)"?>\n?(.*?)</REGION>', re.S)
+
+SHARD_INSTRUCTIONS = """
+
+PARALLEL EDIT (overrides the output rules above):
+Other parts of app.ts are being edited at the same time. Edit ONLY the regions you
+are given and keep each region's opening banner comment unchanged. Return, between
+<FILE> and </FILE>, every given region in full as <REGION id="N">...</REGION>,
+and nothing else."""
+
+
+class Region(TypedDict):
+    title: str
+    text: str
+
+
+class Shard(TypedDict):
+    regions: List[int]
+    tasks: List[str]
+
+
+class ShardConflict(ValueError):
+    """Shard outputs cannot be merged safely (missing/foreign/duplicated regions, banner edits)."""
+
+
+def split_regions(code: str) -> List[Region]:
+    """Split app.ts at its section banners (text before the first banner is a region too)."""
+    lines = code.splitlines(keepends=True)
+    starts = []
+    i = 0
+    while i < len(lines):
+        m = _BANNER.match(lines[i])
+        if m:
+            title = m.group(1).strip(" =-")
+            start = i
+            if (
+                not title
+                and i + 2 < len(lines)
+                and lines[i + 1].strip().startswith("//")
+                and _BANNER.match(lines[i + 2])
+            ):
+                title = lines[i + 1].strip().lstrip("/").strip()
+                i += 2
+            starts.append((start, title))
+        i += 1
+    bounds = list(starts)
+    if not bounds or bounds[0][0] > 0:
+        bounds.insert(0, (0, "(preamble)"))
+    regions: List[Region] = []
+    for k, (s, title) in enumerate(bounds):
+        e = bounds[k + 1][0] if k + 1 < len(bounds) else len(lines)
+        text = "".join(lines[s:e])
+        if text:
+            regions.append({"title": title, "text": text})
+    return regions
+
+
+def group_tasks(tasks: List[str]) -> List[str]:
+    """Fold "Header:" tasks and the sub-point tasks that follow into one task each."""
+    grouped: List[str] = []
+    open_header = False
+    for t in tasks:
+        if open_header and not t.rstrip().endswith(":"):
+            grouped[-1] += "\n  - " + t
+            continue
+        grouped.append(t)
+        open_header = t.rstrip().endswith(":")
+    return grouped
+
+
+def _task_regions(task: str, regions: List[Region]) -> Set[int]:
+    idents = set(_IDENT.findall(task))
+    words = set(_WORD.findall(task.lower())) - _STOP
+    scores = []
+    for r in regions:
+        score = 3 * sum(r["text"].count(x) for x in idents)
+        score += 2 * len(words & set(_WORD.findall(r["title"].lower())))
+        scores.append(score)
+    best = max(scores, default=0)
+    if best <= 0:
+        return set()
+    return {i for i, s in enumerate(scores) if s >= best / 2}
+
+
+def plan_shards(
+    tasks: List[str], regions: List[Region], max_shards: int
+) -> Optional[List[Shard]]:
+    """
+    Group tasks by the regions they touch. Tasks touching overlapping regions
+    share a shard; the smallest shards are merged down to max_shards.
+    Returns None when the work should stay serial (fewer than two regions or
+    shards, or any task that cannot be placed).
+    """
+    if len(regions) < 2 or max_shards < 2:
+        return None
+    parent = list(range(len(regions)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    placed = []
+    for task in group_tasks(tasks):
+        touched = _task_regions(task, regions)
+        if not touched:
+            return None
+        first = min(touched)
+        for other in touched:
+            parent[find(other)] = find(first)
+        placed.append((task, first))
+
+    shards: Dict[int, Shard] = {}
+    for task, region in placed:
+        root = find(region)
+        shard = shards.setdefault(root, {"regions": [], "tasks": []})
+        shard["tasks"].append(task)
+    for i in range(len(regions)):
+        if find(i) in shards:
+            shards[find(i)]["regions"].append(i)
+
+    out = list(shards.values())
+
+    def size(s: Shard) -> int:
+        return sum(len(regions[i]["text"]) for i in s["regions"])
+
+    while len(out) > max_shards:
+        out.sort(key=size)
+        a, b = out.pop(0), out.pop(0)
+        out.append(
+            {
+                "regions": sorted(a["regions"] + b["regions"]),
+                "tasks": a["tasks"] + b["tasks"],
+            }
+        )
+    return out if len(out) >= 2 else None
+
+
+def shard_message(shard: Shard, regions: List[Region], requirements: str) -> str:
+    tasks_str = "\n".join(f"- {t}" for t in shard["tasks"])
+    outline = "\n".join(f"  {i}. {r['title']}" for i, r in enumerate(regions))
+    given = "\n".join(
+        f'<REGION id="{i}">\n{regions[i]["text"]}</REGION>' for i in shard["regions"]
+    )
+    return f"""Requirements (for reference): {requirements}
+        Tasks to implement now (only these regions may change):
+        {tasks_str}
+
+        Sections of app.ts, for orientation:
+        {outline}
+
+        Regions to edit (return each in full):
+        {given}
+        """
+
+
+def parse_regions(output: str) -> Dict[int, str]:
+    """<REGION id="N">...</REGION> blocks of a reply, by id."""
+    return {int(i): body for i, body in _REGION_RE.findall(output)}
+
+
+def merge_shards(regions: List[Region], shards: List[Shard], outputs: List[str]) -> str:
+    """Splice shard outputs back into app.ts; raises ShardConflict when unsafe."""
+    new_text: Dict[int, str] = {}
+    for shard, out in zip(shards, outputs):
+        found = parse_regions(out)
+        extra = set(found) - set(shard["regions"])
+        missing = set(shard["regions"]) - set(found)
+        if extra or missing:
+            raise ShardConflict(
+                f"shard {shard['regions']}: unexpected regions {sorted(extra)}, "
+                f"missing {sorted(missing)}"
+            )
+        for i, body in found.items():
+            if i in new_text:
+                raise ShardConflict(f"region {i} returned by two shards")
+            if not body.strip():
+                raise ShardConflict(f"region {i} came back empty")
+            original = regions[i]["text"]
+            banner = original.splitlines()[0].strip() if original.strip() else ""
+            if i > 0 and banner and body.lstrip().splitlines()[0].strip() != banner:
+                raise ShardConflict(f"region {i}: banner line changed or missing")
+            if original.endswith("\n") and not body.endswith("\n"):
+                body += "\n"
+            new_text[i] = body
+    return "".join(new_text.get(i, r["text"]) for i, r in enumerate(regions))
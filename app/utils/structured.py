@@ -0,0 +1,317 @@
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+from app.utils.io import vprint, safe_invoke, stream_invoke, normalize_content, _crash
+from app.utils.tokens import CallUsage, call_usage
+
+
+class TaskerPlan(TypedDict):
+    task_list: List[str]
+
+
+class EvaluatorVerdict(TypedDict):
+    summary: str
+    failing_items: List[str]
+    new_tasks: List[str]
+    decision: str  # "PASS" | "FAIL"
+
+
+# JSON schemas passed to provider-native structured output (JSON schema / tool calling)
+TASKER_SCHEMA: Dict[str, Any] = {
+    "title": "tasker_plan",
+    "description": "Ordered list of small, verifiable implementation tasks.",
+    "type": "object",
+    "properties": {
+        "task_list": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Atomic tasks ordered by execution priority; [] if none.",
+        }
+    },
+    "required": ["task_list"],
+    "additionalProperties": False,
+}
+
+EVALUATOR_SCHEMA: Dict[str, Any] = {
+    "title": "evaluator_verdict",
+    "description": "Verdict on the current artifact against requirements and acceptance criteria.",
+    "type": "object",
+    "properties": {
+        "summary": {
+            "type": "string",
+            "description": "One or two sentences.",
+        },
+        "failing_items": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Concrete issues; [] when PASS.",
+        },
+        "new_tasks": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "Atomic tasks resolving failing_items, one complete task per entry; [] when PASS.",
+        },
+        "decision": {"type": "string", "enum": ["PASS", "FAIL"]},
+    },
+    "required": ["summary", "failing_items", "new_tasks", "decision"],
+    "additionalProperties": False,
+}
+
+# Appended to the Evaluator system prompt in structured mode; replaces the Markdown sections.
+EVALUATOR_JSON_INSTRUCTIONS = """
+
+STRUCTURED OUTPUT (overrides the Markdown output format above):
+Return ONLY a JSON object with fields "summary", "failing_items", "new_tasks", "decision".
+Do not write FUNCTIONAL_CHECK or any prose outside the JSON.
+Each "new_tasks" entry must be one complete, self-contained task (merge sub-points into it)."""
+
+# Added to the Tasker system prompt when native structured output is rejected
+# and the JSON has to be parsed from plain text.
+TASKER_JSON_INSTRUCTIONS = """
+
+STRUCTURED OUTPUT:
+Return ONLY a JSON object with the single field "task_list" (an array of strings; [] if there are no tasks).
+Do not write any prose or code fences outside the JSON."""
+
+_SENTINEL_TASKS = {"none", "none.", "n/a", "no tasks", ""}
+
+
+def is_sentinel_task(s: str) -> bool:
+    return s.strip().lower() in _SENTINEL_TASKS
+
+
+def _clean_tasks(value: Any, field: str) -> List[str]:
+    if not isinstance(value, list):
+        raise ValueError(f"'{field}' must be a list")
+    tasks = []
+    for t in value:
+        if isinstance(t, dict):
+            # Tolerate {"task": ...} / {"description": ...} objects
+            t = t.get("task") or t.get("description") or json.dumps(t)
+        t = str(t).strip()
+        if not is_sentinel_task(t):
+            tasks.append(t)
+    return tasks
+
+
+def validate_tasker(data: Any) -> TaskerPlan:
+    if not isinstance(data, dict) or "task_list" not in data:
+        raise ValueError("expected an object with 'task_list'")
+    return {"task_list": _clean_tasks(data["task_list"], "task_list")}
+
+
+def validate_verdict(data: Any) -> EvaluatorVerdict:
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    decision = str(data.get("decision", "")).strip().upper()
+    if decision not in {"PASS", "FAIL"}:
+        raise ValueError(f"'decision' must be PASS or FAIL, got {decision!r}")
+    return {
+        "summary": str(data.get("summary", "")).strip(),
+        "failing_items": _clean_tasks(data.get("failing_items", []), "failing_items"),
+        "new_tasks": _clean_tasks(data.get("new_tasks", []), "new_tasks"),
+        "decision": decision,
+    }
+
+
+def parse_json_lenient(text: str) -> Any:
+    """
+    Parse JSON from model text, repairing common issues: code fences,
+    prose around the object, and trailing commas.
+    """
+    s = (text or "").strip()
+    fence = re.search(r"```(?:json)?\s*(.*?)```", s, re.DOTALL)
+    if fence:
+        s = fence.group(1).strip()
+    try:
+        return json.loads(s)
+    except json.JSONDecodeError:
+        pass
+    start, end = s.find("{"), s.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object found")
+    s = re.sub(r",\s*([}\]])", r"\1", s[start : end + 1])
+    return json.loads(s)
+
+
+def invoke_structured(
+    llm,
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    validate: Callable[[Any], Any],
+    who: str,
+    iter_no: int,
+    native: bool = True,
+    retries: int = 2,
+    on_text: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+    crash_marker: bool = True,
+    json_instructions: str = "",
+) -> Tuple[Optional[Any], str, List[CallUsage]]:
+    """
+    Invoke an LLM for a JSON object matching `schema` and validate it.
+    native=True uses provider-native structured output; otherwise the JSON is
+    parsed from plain text. A provider that rejects native output (JSON schema
+    / tool calling, see _native_rejected) gets the call again as plain text,
+    with json_instructions appended to the system prompt; transport, timeout
+    and server errors are re-raised. Unparseable replies are repaired locally
+    first, then re-requested up to `retries` times with the parse error.
+    Plain-text calls are streamed when on_text or cancel is given (see
+    stream_invoke); a cancelled call returns no data. crash_marker is passed to
+    safe_invoke / stream_invoke.
+    Returns (validated data or None, raw text, usage of each call made).
+    """
+    if native:
+        try:
+            return _invoke_structured(
+                llm,
+                messages,
+                schema,
+                validate,
+                who,
+                iter_no,
+                True,
+                retries,
+                on_text,
+                cancel,
+                crash_marker=False,
+            )
+        except Exception as e:
+            if not _native_rejected(e):
+                # Timeouts, connection and server errors are not the provider
+                # refusing the schema: fail the call as a plain one would
+                _crash(who, iter_no, e, crash_marker)
+                raise
+            vprint(
+                f"[iter {iter_no}] {who}: native structured output failed ({e}); "
+                "retrying with JSON parsed from text"
+            )
+            messages = _with_system_suffix(messages, json_instructions)
+    return _invoke_structured(
+        llm,
+        messages,
+        schema,
+        validate,
+        who,
+        iter_no,
+        False,
+        retries,
+        on_text,
+        cancel,
+        crash_marker,
+    )
+
+
+def _native_rejected(e: Exception) -> bool:
+    """
+    True if e means native structured output itself was refused: a 400/422
+    from the provider (unsupported response_format / tool schema), a client
+    without with_structured_output, or a reply failing schema parsing.
+    Transport errors, timeouts, rate limits and 5xx are False.
+    """
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status in (400, 422)
+    return isinstance(e, (NotImplementedError, ValueError, TypeError))
+
+
+def _with_system_suffix(
+    messages: List[Dict[str, str]], suffix: str
+) -> List[Dict[str, str]]:
+    """Copy of messages with suffix appended to the system prompt."""
+    if not suffix:
+        return list(messages)
+    if messages and messages[0]["role"] == "system":
+        head = {**messages[0], "content": messages[0]["content"] + suffix}
+        return [head, *messages[1:]]
+    return [{"role": "system", "content": suffix.strip()}, *messages]
+
+
+def _invoke_structured(
+    llm,
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    validate: Callable[[Any], Any],
+    who: str,
+    iter_no: int,
+    native: bool,
+    retries: int,
+    on_text: Optional[Callable[[str], None]],
+    cancel: Optional[threading.Event],
+    crash_marker: bool,
+) -> Tuple[Optional[Any], str, List[CallUsage]]:
+    runnable = llm.with_structured_output(schema, include_raw=True) if native else llm
+    streamed = not native and (on_text is not None or cancel is not None)
+    msgs = list(messages)
+    calls: List[CallUsage] = []
+    text = ""
+    for attempt in range(retries + 1):
+        if cancel is not None and cancel.is_set():
+            break
+        if streamed:
+            resp = stream_invoke(
+                runnable, msgs, who, iter_no, on_text, cancel, crash_marker
+            )
+            if resp is None:
+                break
+        else:
+            resp = safe_invoke(runnable, msgs, who, iter_no, crash_marker)
+        raw, parsed = (resp["raw"], resp.get("parsed")) if native else (resp, None)
+        calls.append(call_usage(raw))
+        text = normalize_content(raw.content)
+        if not text and native:
+            # Tool-calling replies carry the payload in tool_calls, not content
+            calls = getattr(raw, "tool_calls", None) or []
+            if calls:
+                text = json.dumps(calls[0].get("args", {}), ensure_ascii=False)
+        if cancel is not None and cancel.is_set():
+            break
+        try:
+            data = parsed if parsed is not None else parse_json_lenient(text)
+            return validate(data), text, calls
+        except (ValueError, TypeError) as e:
+            vprint(f"[iter {iter_no}] {who}: invalid JSON (attempt {attempt + 1}): {e}")
+            msgs = msgs + [
+                {"role": "assistant", "content": text or "(empty)"},
+                {
+                    "role": "user",
+                    "content": f"Your reply was not valid JSON for the required schema ({e}). "
+                    "Reply again with ONLY the JSON object.",
+                },
+            ]
+    return None, text, calls
+
+
+def partial_verdict(text: str) -> Optional[EvaluatorVerdict]:
+    """
+    Verdict fields streamed so far, once every field before "decision" is
+    complete (decision is reported as FAIL); None until then.
+    """
+    i = text.find('"decision"')
+    if i == -1 or '"new_tasks"' not in text[:i]:
+        return None
+    head = text[:i].rstrip().rstrip(",") + "}"
+    try:
+        return validate_verdict({**parse_json_lenient(head), "decision": "FAIL"})
+    except (ValueError, TypeError):
+        return None
+
+
+def render_verdict_md(verdict: EvaluatorVerdict) -> str:
+    """Render a structured verdict as the Markdown evaluator report."""
+    lines = ["SUMMARY", verdict["summary"] or "(none)", "", "FAILING_ITEMS"]
+    if verdict["failing_items"]:
+        lines.extend(f"- {x}" for x in verdict["failing_items"])
+    else:
+        lines.append("- None")
+    lines.extend(["", "NEW_TASKS"])
+    if verdict["new_tasks"]:
+        lines.extend(f"{n}. {t}" for n, t in enumerate(verdict["new_tasks"], 1))
+    else:
+        lines.append("- None")
+    lines.extend(["", f"DECISION: {verdict['decision']}"])
+    return "\n".join(lines)
@@ -2,7 +2,7 @@ import json
 import os
 from typing import Dict, Optional
 
-from app.utils.tokens import TOK
+from app.utils.tokens import current_usage
 from app.utils.pricing import compute_cost_usd_per_1M
 
 
@@ -11,13 +11,22 @@ def finalize_summary(
     pricing: Dict,
     pricing_missing: Optional[str],
     verbose: bool,
-) -> None:
+    extra: Optional[Dict] = None,
+    role_costs: Optional[Dict[str, float]] = None,
+) -> Dict:
+    """
+    Write tokens_summary.json. role_costs (USD per role, e.g. priced by the
+    model that served each call) replaces the role-rate costs when given.
+    """
+    TOK = current_usage()
     summary = {
         "total_input_tokens": TOK["total"]["input"],
         "total_cached_input_tokens": TOK["total"]["cached_input"],
         "total_output_tokens": TOK["total"]["output"],
         "by_agent": TOK,
     }
+    # Pipeline-specific sections (e.g. per-model usage under cascade routing)
+    summary.update(extra or {})
     # Compute cost if pricing available
     if pricing_missing:
         summary["cost_computation"] = {
@@ -27,6 +36,11 @@ def finalize_summary(
         total_cost = None
     else:
         cost_details, total_cost = compute_cost_usd_per_1M(pricing, TOK)
+        if role_costs is not None:
+            for role, cost in role_costs.items():
+                cost_details[role]["cost_usd"] = round(cost, 6)
+                cost_details[role]["priced_by"] = "model"
+            total_cost = round(sum(role_costs.values()), 6)
         summary["cost_computation"] = {
             "status": "ok",
             "total_cost_usd": total_cost,
@@ -55,3 +69,4 @@ def finalize_summary(
             f"output: {TOK['total']['output']}\n"
             "Cost not computed: pricing info is missing in environment (see tokens_summary.json)."
         )
+    return summary
@@ -1,26 +1,118 @@
-from typing import Dict, Tuple, Any
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
 
-# Global token counters (kept in-memory; also logged per-iter by callers)
-TOK: Dict[str, Dict[str, int]] = {
-    "tasker": {"input": 0, "output": 0, "cached_input": 0},
-    "coder": {"input": 0, "output": 0, "cached_input": 0},
-    "evaluator": {"input": 0, "output": 0, "cached_input": 0},
-    "total": {"input": 0, "output": 0, "cached_input": 0},
-}
 
+def _new_counter() -> Dict[str, Dict[str, int]]:
+    return {
+        k: {"input": 0, "output": 0, "cached_input": 0}
+        for k in ("tasker", "coder", "evaluator", "total")
+    }
 
-def add_usage(agent: str, it: int, ot: int, cit: int) -> None:
+
+# Global token counters (kept in-memory; also logged per-iter by callers).
+# Runs started with usage_scope() count into their own copy instead, so several
+# runs can share one process (app.server) without mixing their totals.
+TOK: Dict[str, Dict[str, int]] = _new_counter()
+_CURRENT: ContextVar[Dict[str, Dict[str, int]]] = ContextVar("token_usage", default=TOK)
+
+# Serializes add_usage: speculative calls, hedge losers and shard workers book
+# from their own threads while the graph thread books the regular calls
+_LOCK = threading.RLock()
+
+# Optional observers notified of every add_usage call as
+# hook(agent, it, ot, cit, model); scoped to the current context like the counters
+UsageHook = Callable[[str, int, int, int, Optional[str]], None]
+_HOOKS: ContextVar[Tuple[UsageHook, ...]] = ContextVar("token_usage_hooks", default=())
+
+# response_metadata key naming the model that actually produced a reply, set
+# by wrappers that may answer with another model than the role's (HedgedLLM)
+SERVED_BY = "served_by"
+
+
+class CallUsage(NamedTuple):
+    """Usage of one LLM call; model is None when the role's own model served it."""
+
+    model: Optional[str]
+    input: int
+    output: int
+    cached_input: int
+
+
+def usage_scope() -> Dict[str, Dict[str, int]]:
+    """Start a fresh counter for the current context (one run) and return it."""
+    counter = _new_counter()
+    _CURRENT.set(counter)
+    _HOOKS.set(())
+    return counter
+
+
+def current_usage() -> Dict[str, Dict[str, int]]:
+    """Counter add_usage writes to in the current context."""
+    return _CURRENT.get()
+
+
+def add_usage_hook(hook: UsageHook) -> None:
+    _HOOKS.set(_HOOKS.get() + (hook,))
+
+
+def remove_usage_hook(hook: UsageHook) -> None:
+    _HOOKS.set(tuple(h for h in _HOOKS.get() if h is not hook))
+
+
+def add_usage(
+    agent: str, it: int, ot: int, cit: int, model: Optional[str] = None
+) -> None:
     """
     Update cumulative token usage for a role and total.
     In single-agent mode we map unknown agent labels to 'coder' bucket for pricing simplicity.
+    model names the model that served the call when it is not the role's own.
     """
-    agent_key = agent if agent in TOK else "coder"
-    TOK[agent_key]["input"] += it
-    TOK[agent_key]["output"] += ot
-    TOK[agent_key]["cached_input"] += cit
-    TOK["total"]["input"] += it
-    TOK["total"]["output"] += ot
-    TOK["total"]["cached_input"] += cit
+    tok = _CURRENT.get()
+    agent_key = agent if agent in tok else "coder"
+    with _LOCK:
+        tok[agent_key]["input"] += it
+        tok[agent_key]["output"] += ot
+        tok[agent_key]["cached_input"] += cit
+        tok["total"]["input"] += it
+        tok["total"]["output"] += ot
+        tok["total"]["cached_input"] += cit
+        for hook in _HOOKS.get():
+            hook(agent_key, it, ot, cit, model)
+
+
+def book_calls(agent: str, calls: Iterable[CallUsage]) -> Tuple[int, int, int]:
+    """add_usage for each call (under the model that served it); returns the summed usage."""
+    total = [0, 0, 0]
+    for call in calls:
+        add_usage(agent, call.input, call.output, call.cached_input, call.model)
+        total[0] += call.input
+        total[1] += call.output
+        total[2] += call.cached_input
+    return total[0], total[1], total[2]
+
+
+def usage_totals(calls: Iterable[CallUsage]) -> Tuple[int, int, int]:
+    """Summed (input, output, cached_input) of calls."""
+    calls = list(calls)
+    return (
+        sum(c.input for c in calls),
+        sum(c.output for c in calls),
+        sum(c.cached_input for c in calls),
+    )
+
+
+def served_model(resp: Any) -> Optional[str]:
+    """Model a wrapper recorded as having served resp (see SERVED_BY), if any."""
+    rm = getattr(resp, "response_metadata", None)
+    if isinstance(rm, dict) and rm.get(SERVED_BY):
+        return str(rm[SERVED_BY])
+    return None
+
+
+def call_usage(resp: Any) -> CallUsage:
+    """CallUsage of one LangChain response."""
+    return CallUsage(served_model(resp), *extract_usage(resp))
 
 
 def extract_usage(resp: Any) -> Tuple[int, int, int]:
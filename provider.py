@@ -1,12 +1,19 @@
 # provider.py
+import atexit
+import importlib.util
 import os
-from typing import Tuple
+import threading
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+import httpx
+
 # LangChain chat wrappers
 from langchain_openai import ChatOpenAI
 
 try:
+    import anthropic
     from langchain_anthropic import ChatAnthropic
 
     _HAS_ANTHROPIC = True
@@ -16,12 +23,95 @@ except Exception:
 
 load_dotenv()  # load .env if present
 
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+
+# Shared HTTP clients keyed by (provider, base_url). Every role LLM and every
+# run in this process reuses the same keep-alive connections.
+_HTTP_CLIENTS: Dict[Tuple[str, str], httpx.Client] = {}
+_HTTP_LOCK = threading.Lock()
+
+# Chat model instances keyed by (provider, model, temperature). They hold no
+# per-run state, so a long-lived process (app.server) builds each one once.
+_LLMS: Dict[Tuple[str, str, float], object] = {}
+_LLM_LOCK = threading.Lock()
+
 
 def _get(env_key: str, default: str = "") -> str:
     v = os.getenv(env_key)
     return v.strip() if isinstance(v, str) else default
 
 
+def _get_number(env_key: str, default: float) -> float:
+    try:
+        return float(_get(env_key) or default)
+    except ValueError:
+        return default
+
+
+def _request_timeout() -> float:
+    return _get_number("LLM_TIMEOUT", 60)
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 is used when requested (default on) and the h2 package is installed."""
+    wanted = _get("LLM_HTTP2", "1").lower() not in {"0", "false", "no", "off"}
+    return wanted and importlib.util.find_spec("h2") is not None
+
+
+def _http_client(provider: str, base_url: str) -> httpx.Client:
+    """
+    Return the pooled HTTP client for a provider/base_url, creating it on first use.
+    Pool limits and timeouts come from LLM_HTTP_* / LLM_TIMEOUT env vars.
+    """
+    key = (provider, base_url.rstrip("/"))
+    with _HTTP_LOCK:
+        client = _HTTP_CLIENTS.get(key)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=int(_get_number("LLM_HTTP_MAX_CONNECTIONS", 20)),
+                max_keepalive_connections=int(
+                    _get_number("LLM_HTTP_MAX_KEEPALIVE", 10)
+                ),
+                keepalive_expiry=_get_number("LLM_HTTP_KEEPALIVE_EXPIRY", 60),
+            )
+            timeout = httpx.Timeout(
+                _request_timeout(),
+                connect=_get_number("LLM_HTTP_CONNECT_TIMEOUT", 10),
+            )
+            client = httpx.Client(
+                limits=limits, timeout=timeout, http2=_http2_enabled()
+            )
+            _HTTP_CLIENTS[key] = client
+        return client
+
+
+def close_http_clients() -> None:
+    """Close all pooled HTTP clients (e.g. on process shutdown)."""
+    with _HTTP_LOCK:
+        for client in _HTTP_CLIENTS.values():
+            client.close()
+        _HTTP_CLIENTS.clear()
+
+
+atexit.register(close_http_clients)
+
+
+if _HAS_ANTHROPIC:
+
+    class _PooledChatAnthropic(ChatAnthropic):
+        """ChatAnthropic that sends requests through the shared HTTP client pool."""
+
+        @cached_property
+        def _client(self):
+            params = dict(self._client_params)
+            params["http_client"] = _http_client(
+                "anthropic", str(params.get("base_url") or ANTHROPIC_BASE_URL)
+            )
+            return anthropic.Client(**params)
+
+
 def _select_model(provider: str, role: str) -> str:
     role_upper = role.upper()  # TASKER | CODER | EVALUATOR
     if provider == "openai":
@@ -37,14 +127,63 @@ def _select_model(provider: str, role: str) -> str:
     raise ValueError(f"Unsupported provider: {provider}")
 
 
-def make_llm(role: str, temperature: float = 0.0):
+def model_cascade(role: str, inherit: bool = True) -> List[str]:
+    """
+    Models a role escalates through, cheapest first, from
+    {PROVIDER}_{ROLE}_MODEL_CASCADE (or, with inherit, {PROVIDER}_MODEL_CASCADE),
+    comma-separated. Empty when no cascade is configured (the role keeps its single model).
+    """
+    provider = _get("LLM_PROVIDER", "openai").lower()
+    prefix = provider.upper()
+    raw = _get(f"{prefix}_{role.upper()}_MODEL_CASCADE") or (
+        _get(f"{prefix}_MODEL_CASCADE") if inherit else ""
+    )
+    return [m.strip() for m in raw.split(",") if m.strip()]
+
+
+def make_llm(role: str, temperature: float = 0.0, model: Optional[str] = None):
     """
     Create a chat model for a given role: 'tasker' | 'coder' | 'evaluator'.
-    Respects LLM_PROVIDER and provider-specific keys in .env.
+    Respects LLM_PROVIDER and provider-specific keys in .env; `model` overrides
+    the role's configured model (used by cascade routing).
+    Instances are cached per (provider, model, temperature) and shared by roles/runs.
     """
     provider = _get("LLM_PROVIDER", "openai").lower()
-    model = _select_model(provider, role)
+    return _cached_llm(provider, model or _select_model(provider, role), temperature)
+
+
+def hedge_provider() -> str:
+    """Alternate provider for hedged requests and failover ('' = hedging off)."""
+    return _get("LLM_HEDGE_PROVIDER").lower()
+
+
+def make_hedge_llm(role: str, temperature: float = 0.0):
+    """
+    Chat model on the alternate provider used for hedged requests and failover
+    (LLM_HEDGE_PROVIDER), or None when hedging is not configured. The model is
+    LLM_HEDGE_{ROLE}_MODEL / LLM_HEDGE_MODEL, else that provider's model for the role.
+    """
+    provider = hedge_provider()
+    if not provider:
+        return None
+    model = (
+        _get(f"LLM_HEDGE_{role.upper()}_MODEL")
+        or _get("LLM_HEDGE_MODEL")
+        or _select_model(provider, role)
+    )
+    return _cached_llm(provider, model, temperature)
+
+
+def _cached_llm(provider: str, model: str, temperature: float):
+    key = (provider, model, float(temperature))
+    with _LLM_LOCK:
+        llm = _LLMS.get(key)
+        if llm is None:
+            llm = _LLMS[key] = _build_llm(provider, model, temperature)
+        return llm
+
 
+def _build_llm(provider: str, model: str, temperature: float):
     if provider == "openai":
         api_key = _get("OPENAI_API_KEY")
         if not api_key:
@@ -54,8 +193,11 @@ def make_llm(role: str, temperature: float = 0.0):
             model=model,
             temperature=temperature,
             api_key=api_key,
-            timeout=60,
+            timeout=_request_timeout(),
             max_retries=1,
+            # Usage is reported on streamed replies too (--pipeline)
+            stream_usage=True,
+            http_client=_http_client("openai", OPENAI_BASE_URL),
         )
 
     if provider == "openrouter":
@@ -76,10 +218,12 @@ def make_llm(role: str, temperature: float = 0.0):
             model=model,
             temperature=temperature,
             api_key=api_key,
-            base_url="https://openrouter.ai/api/v1",
+            base_url=OPENROUTER_BASE_URL,
             default_headers=default_headers or None,
-            timeout=60,
+            timeout=_request_timeout(),
             max_retries=1,
+            stream_usage=True,
+            http_client=_http_client("openrouter", OPENROUTER_BASE_URL),
         )
 
     if provider == "anthropic":
@@ -90,11 +234,11 @@ def make_llm(role: str, temperature: float = 0.0):
         api_key = _get("ANTHROPIC_API_KEY")
         if not api_key:
             raise RuntimeError("Missing ANTHROPIC_API_KEY for provider=anthropic")
-        return ChatAnthropic(
+        return _PooledChatAnthropic(
             model=model,
             temperature=temperature,
             api_key=api_key,
-            timeout=60,
+            timeout=_request_timeout(),
             max_retries=1,
         )
 
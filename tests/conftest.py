@@ -0,0 +1,55 @@
+import glob
+import os
+from typing import Callable, Dict, List
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKSPACE = os.path.join(ROOT, "workspace", "password_recovery_health")
+
+# Generated app.ts files of the recorded runs, plus every per-iteration snapshot
+APP_SAMPLES = sorted(glob.glob(os.path.join(WORKSPACE, "*", "app.ts")))
+CODE_SAMPLES = sorted(
+    glob.glob(os.path.join(WORKSPACE, "*", "*.ts"))
+    + glob.glob(os.path.join(WORKSPACE, "*", "code_iter*.tsx"))
+)
+
+
+def _sample_id(path: str) -> str:
+    return os.path.relpath(path, ROOT)
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def samples() -> Dict[str, List[str]]:
+    return {"app": APP_SAMPLES, "code": CODE_SAMPLES}
+
+
+@pytest.fixture(params=APP_SAMPLES, ids=_sample_id)
+def app_code(request) -> str:
+    return _read(request.param)
+
+
+@pytest.fixture(params=CODE_SAMPLES, ids=_sample_id)
+def code(request) -> str:
+    return _read(request.param)
+
+
+@pytest.fixture
+def region_reply() -> Callable[[Dict[int, str]], str]:
+    """Builds a Coder reply returning the given region bodies."""
+
+    def build(bodies: Dict[int, str]) -> str:
+        return (
+            "<FILE>\n"
+            + "\n".join(
+                f'<REGION id="{i}">\n{body}</REGION>' for i, body in bodies.items()
+            )
+            + "\n</FILE>"
+        )
+
+    return build
@@ -0,0 +1,65 @@
+import pytest
+
+from app.utils.codeindex import CodeIndex, parse_blocks
+
+
+def test_samples_present(samples):
+    assert samples["app"] and samples["code"]
+
+
+def test_blocks_round_trip(code):
+    assert "".join(b["text"] for b in parse_blocks(code)) == code
+
+
+def test_noop_splice_is_identity(code, region_reply):
+    index = CodeIndex(code)
+    ids = list(range(len(index.blocks)))
+    reply = region_reply({i: index.blocks[i]["text"] for i in ids})
+    new_code, new_index, edited = index.splice(ids, reply)
+    assert new_code == code
+    assert new_index.blocks == index.blocks
+    assert edited == ids
+
+
+def test_splice_matches_fresh_parse(code, region_reply):
+    index = CodeIndex(code)
+    # Edit a few blocks spread over the file, one of them into two declarations
+    ids = sorted({1, len(index.blocks) // 2, len(index.blocks) - 1})
+    bodies = {i: index.blocks[i]["text"] for i in ids}
+    bodies[ids[0]] = (
+        "// Added helper\nfunction addedHelper() {\n  return 1;\n}\n\n" + bodies[ids[0]]
+    )
+    bodies[ids[-1]] = bodies[ids[-1]].rstrip("\n") + "\n// trailing note\n"
+    new_code, new_index, _ = index.splice(ids, region_reply(bodies))
+    assert "function addedHelper()" in new_code
+    assert "".join(b["text"] for b in new_index.blocks) == new_code
+    assert new_index.blocks == parse_blocks(new_code)
+
+
+def test_splice_keeps_unedited_text(code, region_reply):
+    index = CodeIndex(code)
+    i = len(index.blocks) // 2
+    body = index.blocks[i]["text"].rstrip("\n")  # missing final newline is restored
+    new_code, _, _ = index.splice([i], region_reply({i: body + "\n// edited"}))
+    before = "".join(b["text"] for b in index.blocks[:i])
+    after = "".join(b["text"] for b in index.blocks[i + 1 :])
+    assert new_code.startswith(before)
+    assert new_code.endswith(after)
+    assert new_code[len(before) : len(new_code) - len(after)] == body + "\n// edited\n"
+
+
+def test_splice_rejects_foreign_regions(code, region_reply):
+    index = CodeIndex(code)
+    with pytest.raises(ValueError, match="not given"):
+        index.splice([0], region_reply({1: index.blocks[1]["text"]}))
+
+
+def test_splice_rejects_empty_regions(code, region_reply):
+    index = CodeIndex(code)
+    with pytest.raises(ValueError, match="empty"):
+        index.splice([1], region_reply({1: "\n  \n"}))
+
+
+def test_splice_rejects_reply_without_regions(code):
+    with pytest.raises(ValueError, match="no <REGION>"):
+        CodeIndex(code).splice([0], "<FILE>\nconst x = 1;\n</FILE>")
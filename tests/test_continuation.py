@@ -0,0 +1,122 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.utils.continuation import (
+    CONTINUE_FILE_PROMPT,
+    CONTINUE_PROMPT,
+    _balanced,
+    _seam_repeats,
+    extract_file,
+    invoke_file,
+)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "const a = [1, (2 + 3)];\nfunction f() { return { a }; }\n",
+        "const s = '}' + \"]\" + `x ${f({ a: `in ${1}` })} }`;\n",
+        "// a } in a comment\n/* and ( here */ const r = /[}\\/]+/g;\nx = a / b;\n",
+    ],
+    ids=["nested", "strings-and-templates", "comments-and-regex"],
+)
+def test_balanced_code(code):
+    assert _balanced(code)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "function f() { if (x) { return 1; }\n",
+        "const a = [1, 2);\n",
+        "const t = `unterminated ${x}\n",
+        "const s = 'unterminated;\n",
+        "} extra closer {",
+    ],
+)
+def test_unbalanced_code(code):
+    assert not _balanced(code)
+
+
+def test_app_samples_balance(app_code):
+    assert _balanced(app_code)
+
+
+HEAD = "".join(f"  const value{i} = compute({i});\n" for i in range(10))
+
+
+def test_seam_repeats_detects_restart_from_earlier_line():
+    tail = "".join(f"  const value{i} = compute({i});\n" for i in range(4, 12))
+    assert _seam_repeats(HEAD, tail)
+
+
+def test_seam_repeats_ignores_new_text_and_short_lines():
+    assert not _seam_repeats(HEAD, "  const value10 = compute(10);\n}\n}\n")
+    assert not _seam_repeats(HEAD + "}\n}\n}\n", "}\n}\n}\n")
+
+
+class _ScriptedLLM:
+    """Replies in order, each with a finish_reason."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.seen = []
+
+    def invoke(self, messages):
+        self.seen.append(messages)
+        content, reason = self.replies.pop(0)
+        return AIMessage(content=content, response_metadata={"finish_reason": reason})
+
+
+def _invoke(replies):
+    llm = _ScriptedLLM(replies)
+    text, code, calls = invoke_file(
+        llm, [{"role": "user", "content": "go"}], "CODER", 1, max_continuations=2
+    )
+    return llm, text, code, calls
+
+
+def test_stitched_file_is_returned_with_file_prompt():
+    llm, text, code, calls = _invoke(
+        [
+            ("<FILE>\nfunction f() {\n  return [1,", "length"),
+            (" 2];\n}\n</FILE>", "stop"),
+        ]
+    )
+    assert code == "\nfunction f() {\n  return [1, 2];\n}\n"
+    assert len(calls) == 2
+    assert llm.seen[1][-1]["content"] == CONTINUE_FILE_PROMPT
+
+
+def test_untagged_reply_is_continued_without_file_tags():
+    llm, text, code, _ = _invoke(
+        [("Here is what I would change", "length"), (": nothing.", "stop")]
+    )
+    assert llm.seen[1][-1]["content"] == CONTINUE_PROMPT
+    assert "</FILE>" not in CONTINUE_PROMPT
+    assert text == "Here is what I would change: nothing."
+
+
+def test_stitched_file_that_does_not_balance_is_rejected():
+    _, text, code, _ = _invoke(
+        [
+            ("<FILE>\nfunction f() {\n  if (x) {\n    return 1;", "length"),
+            ("\n}\n</FILE>", "stop"),
+        ]
+    )
+    assert extract_file(text) is not None
+    assert code is None
+
+
+def test_continuation_restarting_earlier_text_is_rejected():
+    head = "<FILE>\nfunction f() {\n" + HEAD
+    # Restarts a few lines back instead of at the cut (no exact overlap to drop)
+    tail = "".join(f"  const value{i} = compute({i});\n" for i in range(3, 7))
+    _, _, code, _ = _invoke([(head, "length"), (tail + "}\n</FILE>", "stop")])
+    assert code is None
+
+
+def test_unfinished_after_all_continuations_is_rejected():
+    _, _, code, calls = _invoke([("<FILE>\nconst a = 1;", "length")] * 3)
+    assert code is None
+    assert len(calls) == 3
@@ -0,0 +1,37 @@
+from app.utils.diff import code_diff
+
+OLD = "".join(f"line {i}\n" for i in range(1, 11))
+
+
+def test_identical_is_empty():
+    assert code_diff(OLD, OLD) == ""
+
+
+def test_headers_and_context():
+    new = OLD.replace("line 5\n", "line five\n")
+    diff = code_diff(OLD, new, name="app.ts", context=1)
+    assert diff.splitlines() == [
+        "--- a/app.ts",
+        "+++ b/app.ts",
+        "@@ -4,3 +4,3 @@",
+        " line 4",
+        "-line 5",
+        "+line five",
+        " line 6",
+    ]
+
+
+def test_separate_hunks_for_distant_edits():
+    new = OLD.replace("line 1\n", "line one\n").replace("line 10\n", "line ten\n")
+    assert code_diff(OLD, new, context=1).count("@@ -") == 2
+
+
+def test_missing_final_newline_does_not_merge_lines():
+    diff = code_diff("a\nb", "a\nc")
+    assert diff.splitlines()[-4:] == [
+        "-b",
+        "\\ No newline at end of file",
+        "+c",
+        "\\ No newline at end of file",
+    ]
+    assert diff.endswith("\n")
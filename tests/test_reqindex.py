@@ -0,0 +1,73 @@
+from app.utils.reqindex import BM25, RequirementsIndex, split_sections
+
+REQUIREMENTS = """Password recovery system
+
+Purpose
+Single-file Bun server with an SPA; no frameworks.
+
+Deliverables
+One app.ts file.
+
+1. Reset tokens
+Tokens are random, single-use and expire after 15 minutes.
+- Store only a hash of each token.
+
+2. Email delivery
+Send the reset link by email through the configured SMTP relay.
+
+3. Rate limiting
+Limit reset requests per account and per IP address.
+"""
+
+
+def test_split_sections_at_labels_and_numbered_items():
+    sections = split_sections(REQUIREMENTS)
+    assert [s["title"] for s in sections] == [
+        "Password recovery system",
+        "Purpose",
+        "Deliverables",
+        "1. Reset tokens",
+        "2. Email delivery",
+        "3. Rate limiting",
+    ]
+    # Bullets stay inside their section, and the title line is kept in the text
+    assert sections[3]["text"].startswith("1. Reset tokens")
+    assert "Store only a hash" in sections[3]["text"]
+
+
+def test_split_keeps_text_before_first_title_as_preamble():
+    sections = split_sections("intro line, not a title,\nmore.\n# Heading\nSome body.")
+    assert sections[0]["title"] == "(preamble)"
+    assert sections[1] == {"title": "Heading", "text": "# Heading\nSome body."}
+
+
+def test_bm25_prefers_matching_document():
+    bm25 = BM25(["token expiry and hashing", "email relay", "rate limit per IP"])
+    scores = bm25.scores("hash the reset tokens")
+    assert scores[0] > 0
+    assert scores[1] == scores[2] == 0
+
+
+def test_select_picks_matching_and_pinned_sections():
+    sel = RequirementsIndex(REQUIREMENTS).select(
+        ["Expire reset tokens after 15 minutes"], per_task=1, min_score=0.5
+    )
+    assert not sel["full"]
+    assert sel["sections"] == ["Purpose", "Deliverables", "1. Reset tokens"]
+    assert "SMTP" not in sel["text"]
+    assert sel["scores"]["Expire reset tokens after 15 minutes"] > 0.5
+
+
+def test_select_falls_back_to_full_text_on_weak_match():
+    index = RequirementsIndex(REQUIREMENTS)
+    sel = index.select(["Add dark mode toggle"], per_task=2, min_score=0.5)
+    assert sel["full"]
+    assert sel["text"] == REQUIREMENTS
+    assert sel["reason"].startswith("low-confidence match")
+
+
+def test_select_full_text_without_tasks_or_sections():
+    assert RequirementsIndex(REQUIREMENTS).select([], 2, 0.5)["reason"] == "no tasks"
+    sel = RequirementsIndex("just one paragraph").select(["anything"], 2, 0.0)
+    assert sel["full"]
+    assert sel["reason"] == "document has too few sections to index"
@@ -0,0 +1,111 @@
+import json
+import os
+
+from app.utils.runlog import JsonlIndex, RunReader, iter_log_entries, iter_run_dirs
+
+
+def _write(path, entries, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e) + "\n")
+
+
+def _sidecar(path):
+    with open(os.path.join(os.path.dirname(path), ".log.jsonl.idx")) as f:
+        return json.load(f)
+
+
+def test_access_by_line_and_iter(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    # Embedded code with an escaped "iter" must not be taken as the key
+    _write(
+        path,
+        [
+            {"iter": 1, "code": 'const s = "{\\"iter\\": 9}";'},
+            {"note": "no iter"},
+            {"iter": 2, "x": 2},
+            {"iter": 2, "x": 3},
+        ],
+    )
+    with JsonlIndex(path) as idx:
+        assert len(idx) == 4
+        assert idx.keys == [1, None, 2, 2]
+        assert idx.get(1) == {"note": "no iter"}
+        assert idx.by_iter(2) == {"iter": 2, "x": 3}  # last one wins
+        assert idx.by_iter(9) is None
+        assert idx.iters() == [1, 2]
+        assert idx.last()["x"] == 3
+        assert [e.get("iter") for e in idx] == [1, None, 2, 2]
+
+
+def test_blank_lines_fold_into_previous_entry(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text('{"iter": 1}\n\n{"iter": 2}\n', encoding="utf-8")
+    with JsonlIndex(str(path)) as idx:
+        assert len(idx) == 2
+        assert idx.get(0) == {"iter": 1}
+        assert idx.by_iter(2) == {"iter": 2}
+
+
+def test_sidecar_reused_and_extended_on_append(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    _write(path, [{"iter": 1}, {"iter": 2}])
+    with JsonlIndex(path):
+        pass
+    assert _sidecar(path)["keys"] == [1, 2]
+
+    _write(path, [{"iter": 3}], mode="a")
+    with JsonlIndex(path) as idx:
+        assert idx.iters() == [1, 2, 3]
+        assert idx.by_iter(3) == {"iter": 3}
+    saved = _sidecar(path)
+    assert saved["keys"] == [1, 2, 3]
+    assert saved["size"] == os.path.getsize(path)
+
+
+def test_rewritten_file_rebuilds_index(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    _write(path, [{"iter": 1}, {"iter": 2}, {"iter": 3}])
+    with JsonlIndex(path):
+        pass
+    _write(path, [{"iter": 7}])
+    with JsonlIndex(path) as idx:
+        assert idx.iters() == [7]
+        assert idx.get(0) == {"iter": 7}
+
+
+def test_persist_false_writes_no_sidecar(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    _write(path, [{"iter": 1}])
+    with JsonlIndex(path, persist=False) as idx:
+        assert idx.by_iter(1) == {"iter": 1}
+    assert not os.path.exists(tmp_path / ".log.jsonl.idx")
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "log.jsonl"
+    path.write_text("", encoding="utf-8")
+    with JsonlIndex(str(path)) as idx:
+        assert len(idx) == 0
+        assert idx.last() is None
+
+
+def test_run_reader_and_tree_walk(tmp_path):
+    run_a = tmp_path / "a" / "run1"
+    run_b = tmp_path / "b"
+    for d in (run_a, run_b):
+        d.mkdir(parents=True)
+    _write(str(run_a / "log.jsonl"), [{"iter": 1, "done": False}])
+    _write(str(run_a / "state.jsonl"), [{"iter": 1, "code_tsx": "x"}])
+    _write(str(run_b / "log.jsonl"), [{"iter": 1, "done": True}])
+    (tmp_path / "empty").mkdir()
+
+    assert sorted(iter_run_dirs(str(tmp_path))) == sorted([str(run_a), str(run_b)])
+    with RunReader(str(run_a)) as run:
+        assert run.log_at(1)["done"] is False
+        assert run.state_at(1)["code_tsx"] == "x"
+    entries = list(iter_log_entries(str(tmp_path)))
+    assert {e["output_dir"]: e["done"] for e in entries} == {
+        str(run_a): False,
+        str(run_b): True,
+    }
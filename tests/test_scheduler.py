@@ -0,0 +1,91 @@
+import pytest
+
+from app.utils.scheduler import BudgetScheduler
+
+PRICING = {
+    "default": {"in": 1.0, "cached_in": 0.5, "out": 4.0},
+    "coder": {"in": 2.0, "cached_in": 1.0, "out": 8.0},
+}
+
+
+def _entry(tokens, seconds):
+    return {
+        "tokens_by_agent": {
+            role: {"input": i, "output": o, "cached_input": 0}
+            for role, (i, o) in tokens.items()
+        },
+        "role_seconds": seconds,
+    }
+
+
+def _observe_iteration(sched, n, costs=None):
+    """Cumulative entry after n identical iterations (1M in / 0.1M out per role)."""
+    tokens = {r: (n * 1_000_000, n * 100_000) for r in ("tasker", "coder", "evaluator")}
+    sched.observe(
+        _entry(tokens, {"tasker": 1.0, "coder": 2.0, "evaluator": 3.0}), costs
+    )
+
+
+def test_disabled_without_limits():
+    assert not BudgetScheduler(None, None, PRICING).enabled
+    # A cost budget without pricing cannot be enforced
+    assert not BudgetScheduler(None, 5.0, None).enabled
+
+
+def test_no_history_continues_until_budget_is_spent():
+    sched = BudgetScheduler(60.0, 1.0, PRICING)
+    assert sched.predict("full") is None
+    assert sched.decide(10.0, 0.5, can_reduce=True)["action"] == "continue"
+    assert sched.decide(10.0, 1.0, can_reduce=True)["action"] == "stop"
+    assert sched.decide(61.0, 0.0, can_reduce=True)["action"] == "stop"
+
+
+def test_predicts_from_token_deltas_and_role_rates():
+    sched = BudgetScheduler(None, 100.0, PRICING)
+    _observe_iteration(sched, 1)
+    _observe_iteration(sched, 2)
+    # Per iteration: 1M in + 0.1M out for each role; coder has its own rates
+    assert sched.predict("full") == {"seconds": 6.0, "cost_usd": 5.6}
+    assert sched.predict("reduced") == {"seconds": 5.0, "cost_usd": 4.2}
+
+
+def test_observed_costs_override_token_pricing():
+    sched = BudgetScheduler(None, 100.0, PRICING)
+    _observe_iteration(sched, 1, {"tasker": 0.1, "coder": 0.2, "evaluator": 0.3})
+    _observe_iteration(sched, 2, {"tasker": 0.2, "coder": 0.4, "evaluator": 0.6})
+    assert sched.predict("full")["cost_usd"] == pytest.approx(0.6)
+
+
+def test_skipped_role_teaches_nothing():
+    sched = BudgetScheduler(None, 100.0, PRICING)
+    sched.observe(_entry({"coder": (10, 1), "evaluator": (10, 1)}, {"coder": 1.0}))
+    assert sched.predict("full") is None
+    assert sched.predict("reduced") is not None
+
+
+def test_falls_back_to_reduced_plan_then_stops():
+    sched = BudgetScheduler(100.0, None, PRICING, safety=1.0)
+    _observe_iteration(sched, 1)
+    # full needs 6s, reduced (Coder + Evaluator) 5s
+    assert sched.decide(94.0, 0.0, can_reduce=True)["action"] == "continue"
+    assert sched.decide(94.5, 0.0, can_reduce=True)["action"] == "reduced"
+    assert sched.decide(94.5, 0.0, can_reduce=False)["action"] == "stop"
+    decision = sched.decide(96.0, 0.0, can_reduce=True)
+    assert decision["action"] == "stop"
+    assert decision["remaining"] == {"seconds": 4.0, "cost_usd": None}
+
+
+def test_safety_margin_applies_to_prediction():
+    sched = BudgetScheduler(100.0, None, PRICING, safety=2.0)
+    _observe_iteration(sched, 1)
+    assert sched.decide(88.0, 0.0, can_reduce=False)["action"] == "continue"
+    assert sched.decide(88.5, 0.0, can_reduce=False)["action"] == "stop"
+
+
+def test_uses_recent_window_only():
+    sched = BudgetScheduler(None, None, PRICING, window=1)
+    sched.observe(_entry({"coder": (10, 1)}, {"coder": 100.0}))
+    sched.observe(_entry({"coder": (20, 2)}, {"coder": 2.0}))
+    sched.observe(_entry({"tasker": (1, 1), "coder": (20, 2), "evaluator": (1, 1)}, {}))
+    # The last observation taught nothing for the coder; its latest sample is 2s
+    assert sched._role_estimate("coder")[0] == 2.0
@@ -0,0 +1,105 @@
+import pytest
+
+from app.utils.sharding import ShardConflict, merge_shards, parse_regions, split_regions
+
+
+@pytest.fixture
+def reply(region_reply):
+    def build(regions, ids, edit=None) -> str:
+        bodies = {i: regions[i]["text"] for i in ids}
+        bodies.update(edit or {})
+        return region_reply(bodies)
+
+    return build
+
+
+@pytest.fixture
+def regions(app_code):
+    regions = split_regions(app_code)
+    assert len(regions) >= 4
+    return regions
+
+
+def _shards(regions):
+    n = len(regions)
+    return [{"regions": [1, 2], "tasks": ["a"]}, {"regions": [n - 1], "tasks": ["b"]}]
+
+
+def test_split_round_trip(app_code):
+    regions = split_regions(app_code)
+    assert "".join(r["text"] for r in regions) == app_code
+    assert regions[0]["title"] == "(preamble)"
+
+
+def test_parse_regions_reads_bodies_verbatim(regions, reply):
+    found = parse_regions(reply(regions, [0, 2]))
+    assert found == {0: regions[0]["text"], 2: regions[2]["text"]}
+
+
+def test_merge_unchanged_outputs_is_identity(regions, reply):
+    shards = _shards(regions)
+    outputs = [reply(regions, s["regions"]) for s in shards]
+    code = "".join(r["text"] for r in regions)
+    assert merge_shards(regions, shards, outputs) == code
+
+
+def test_merge_applies_each_shard_in_place(regions, reply):
+    shards = _shards(regions)
+    last = len(regions) - 1
+    edit2 = regions[2]["text"].rstrip("\n") + "\n// shard one\n"
+    edit_last = (
+        regions[last]["text"].rstrip("\n") + "\n// shard two"
+    )  # no final newline
+    outputs = [
+        reply(regions, [1, 2], {2: edit2}),
+        reply(regions, [last], {last: edit_last}),
+    ]
+    merged = merge_shards(regions, shards, outputs)
+    expected = [r["text"] for r in regions]
+    expected[2] = edit2
+    expected[last] = edit_last + ("\n" if regions[last]["text"].endswith("\n") else "")
+    assert merged == "".join(expected)
+
+
+def test_merge_rejects_missing_region(regions, reply):
+    shards = _shards(regions)
+    outputs = [reply(regions, [1]), reply(regions, shards[1]["regions"])]
+    with pytest.raises(ShardConflict, match="missing"):
+        merge_shards(regions, shards, outputs)
+
+
+def test_merge_rejects_foreign_region(regions, reply):
+    shards = _shards(regions)
+    outputs = [reply(regions, [1, 2, 3]), reply(regions, shards[1]["regions"])]
+    with pytest.raises(ShardConflict, match="unexpected"):
+        merge_shards(regions, shards, outputs)
+
+
+def test_merge_rejects_region_returned_twice(regions, reply):
+    shards = [{"regions": [1], "tasks": ["a"]}, {"regions": [1], "tasks": ["b"]}]
+    outputs = [reply(regions, [1]), reply(regions, [1])]
+    with pytest.raises(ShardConflict, match="two shards"):
+        merge_shards(regions, shards, outputs)
+
+
+def test_merge_rejects_empty_region(regions, reply):
+    shards = _shards(regions)
+    outputs = [
+        reply(regions, [1, 2], {2: "  \n"}),
+        reply(regions, shards[1]["regions"]),
+    ]
+    with pytest.raises(ShardConflict, match="empty"):
+        merge_shards(regions, shards, outputs)
+
+
+def test_merge_rejects_changed_banner(regions, reply):
+    shards = _shards(regions)
+    body = "// ==== Renamed ====\n" + "".join(
+        regions[2]["text"].splitlines(keepends=True)[1:]
+    )
+    outputs = [
+        reply(regions, [1, 2], {2: body}),
+        reply(regions, shards[1]["regions"]),
+    ]
+    with pytest.raises(ShardConflict, match="banner"):
+        merge_shards(regions, shards, outputs)
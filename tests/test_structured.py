@@ -0,0 +1,163 @@
+import httpx
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.utils.structured import (
+    TASKER_SCHEMA,
+    invoke_structured,
+    parse_json_lenient,
+    partial_verdict,
+    render_verdict_md,
+    validate_tasker,
+    validate_verdict,
+)
+
+_REQUEST = httpx.Request("POST", "https://api.example/v1/chat")
+
+
+def test_parse_json_lenient_repairs_fences_prose_and_trailing_commas():
+    assert parse_json_lenient('```json\n{"a": 1}\n```') == {"a": 1}
+    assert parse_json_lenient('Here it is: {"a": [1, 2,],} hope it helps') == {
+        "a": [1, 2]
+    }
+    with pytest.raises(ValueError, match="no JSON object"):
+        parse_json_lenient("no json here")
+
+
+def test_validate_tasker_cleans_tasks():
+    plan = validate_tasker(
+        {"task_list": [" Add login ", "none", {"task": "Hash tokens"}, {"x": 1}]}
+    )
+    assert plan == {"task_list": ["Add login", "Hash tokens", '{"x": 1}']}
+    with pytest.raises(ValueError, match="task_list"):
+        validate_tasker({"tasks": []})
+    with pytest.raises(ValueError, match="must be a list"):
+        validate_tasker({"task_list": "Add login"})
+
+
+def test_validate_verdict_normalises_decision():
+    verdict = validate_verdict(
+        {"summary": " ok ", "decision": "pass", "failing_items": ["N/A"]}
+    )
+    assert verdict == {
+        "summary": "ok",
+        "failing_items": [],
+        "new_tasks": [],
+        "decision": "PASS",
+    }
+    with pytest.raises(ValueError, match="PASS or FAIL"):
+        validate_verdict({"decision": "maybe"})
+    with pytest.raises(ValueError, match="JSON object"):
+        validate_verdict(["PASS"])
+
+
+def test_partial_verdict_waits_for_fields_before_decision():
+    text = '{"summary": "s", "failing_items": ["a"], "new_tasks": ["fix a"'
+    assert partial_verdict(text) is None
+    text += '], "decision": "'
+    assert partial_verdict(text) == {
+        "summary": "s",
+        "failing_items": ["a"],
+        "new_tasks": ["fix a"],
+        "decision": "FAIL",
+    }
+
+
+def test_render_verdict_md_has_parseable_sections():
+    md = render_verdict_md(
+        {
+            "summary": "",
+            "failing_items": ["a"],
+            "new_tasks": ["fix a", "test a"],
+            "decision": "FAIL",
+        }
+    )
+    assert md.splitlines() == [
+        "SUMMARY",
+        "(none)",
+        "",
+        "FAILING_ITEMS",
+        "- a",
+        "",
+        "NEW_TASKS",
+        "1. fix a",
+        "2. test a",
+        "",
+        "DECISION: FAIL",
+    ]
+
+
+class _FakeLLM:
+    """Plain replies in order; with_structured_output() raises native_error."""
+
+    def __init__(self, replies, native_error=None):
+        self.replies = list(replies)
+        self.native_error = native_error
+        self.seen = []
+
+    def with_structured_output(self, schema, include_raw=False):
+        llm = self
+
+        class _Native:
+            def invoke(self, messages):
+                raise llm.native_error
+
+        return _Native()
+
+    def invoke(self, messages):
+        self.seen.append(messages)
+        return AIMessage(
+            content=self.replies.pop(0),
+            usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12},
+        )
+
+
+def _call(llm, **kw):
+    return invoke_structured(
+        llm,
+        [{"role": "system", "content": "sys"}, {"role": "user", "content": "u"}],
+        TASKER_SCHEMA,
+        validate_tasker,
+        "TASKER",
+        1,
+        crash_marker=False,
+        json_instructions="\nJSON please",
+        **kw,
+    )
+
+
+def test_rejected_native_output_falls_back_to_text_json():
+    error = httpx.HTTPStatusError(
+        "400", request=_REQUEST, response=httpx.Response(400, request=_REQUEST)
+    )
+    llm = _FakeLLM(['{"task_list": ["a"]}'], native_error=error)
+    data, _text, calls = _call(llm)
+    assert data == {"task_list": ["a"]}
+    assert llm.seen[0][0]["content"] == "sys\nJSON please"
+    assert [(c.model, c.input, c.output) for c in calls] == [(None, 10, 2)]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        httpx.ReadTimeout("timed out", request=_REQUEST),
+        httpx.ConnectError("refused", request=_REQUEST),
+        httpx.HTTPStatusError(
+            "503", request=_REQUEST, response=httpx.Response(503, request=_REQUEST)
+        ),
+    ],
+    ids=["timeout", "connect", "5xx"],
+)
+def test_transport_errors_are_not_retried_as_text(error):
+    llm = _FakeLLM(['{"task_list": []}'], native_error=error)
+    with pytest.raises(type(error)):
+        _call(llm)
+    assert llm.seen == []
+
+
+def test_invalid_text_json_is_re_requested():
+    llm = _FakeLLM(['{"task_list": "nope"}', '{"task_list": ["b"]}'])
+    data, _text, calls = _call(llm, native=False)
+    assert data == {"task_list": ["b"]}
+    assert len(calls) == 2
+    assert "not valid JSON" in llm.seen[1][-1]["content"]